@@ -0,0 +1,451 @@
+#!/usr/bin/python3
+
+# Benchmarks for CIMS
+# Each benchmark runs the old (legacy.py) and new versions of something over our
+# real pages, checks they agree, and prints how long each one took.
+#
+#	python bench.py loadtti
+#	python bench.py overlay
+#	python bench.py t42
+#	python bench.py export
+#	python bench.py compare
+#	python bench.py charsub
+#	python bench.py legalise
+#	python bench.py x26
+#	python bench.py textcolour
+#	python bench.py table
+#	python bench.py layout
+#	python bench.py linebreak
+
+import argparse, copy, glob, json, time
+
+import legacy
+import page
+import t42
+import textBlock
+from sinks import MemorySink
+import legaliser
+from legaliser import pageLegaliser
+
+# Every page we export plus every template we build pages from
+def ttiCorpus():
+	return sorted(glob.glob("teletext/*.tti")) + sorted(glob.glob("*_template.tti"))
+
+# Run a function over every item in the corpus a number of times, return the best time for one pass
+def timed(function, corpus, repeat):
+	best = None
+
+	for _ in range(repeat):
+		start = time.perf_counter()
+		for item in corpus:
+			function(item)
+		elapsed = time.perf_counter() - start
+
+		if best is None or elapsed < best:
+			best = elapsed
+
+	return best
+
+def report(name, corpus, old, new):
+	print(name + ": " + str(len(corpus)) + " items")
+	print("  old: %8.2f ms" % (old * 1000))
+	print("  new: %8.2f ms" % (new * 1000))
+	print("  speedup: %.1fx" % (old / new))
+
+def benchLoadTTI(args):
+	corpus = ttiCorpus()
+
+	for filename in corpus:
+		if legacy.loadTTI(filename) != page.loadTTI(filename):
+			print("loadTTI: output differs for " + filename)
+			return 1
+
+	old = timed(legacy.loadTTI, corpus, args.repeat)
+	new = timed(page.loadTTI, corpus, args.repeat)
+	report("loadTTI", corpus, old, new)
+	return 0
+
+# A newsreel-sized page: every subpage in the corpus, stamped with "n/N" counters and a box
+def benchOverlay(args):
+	subpages = []
+	for filename in ttiCorpus():
+		subpages += page.loadTTI(filename)["subpages"]
+	
+	newsreel = {"number":"185", "subpages":subpages[:64]}
+	box = [{"number":1, "text":"\x16,,,,,,,,,,,,,,,,"}, {"number":2, "text":"\x16j UUTISET    5"}, {"number":3, "text":"\x16,,,,,,,,,,,,,,,,"}]
+	
+	def old(newsreel):
+		result = copy.deepcopy(newsreel)
+		for subpage in result["subpages"]:
+			subpage["packets"] = legacy.blockOverlay(subpage["packets"], box, 20, 2, 38, 4)
+		return legacy.numberSubpage(result)
+	
+	def new(newsreel):
+		result = {"number":"185", "subpages":[{"packets":page.clonePackets(subpage["packets"])} for subpage in newsreel["subpages"]]}
+		page.pageOverlay(result, box, 20, 2, 38, 4)
+		return page.numberSubpage(result)
+	
+	if [subpage["packets"] for subpage in old(newsreel)["subpages"]] != [subpage["packets"] for subpage in new(newsreel)["subpages"]]:
+		print("overlay: output differs")
+		return 1
+	
+	corpus = [newsreel]
+	report("overlay + numberSubpage (" + str(len(newsreel["subpages"])) + " subpages)", corpus, timed(old, corpus, args.repeat), timed(new, corpus, args.repeat))
+	return 0
+
+# T42 has no old version to race against, so this just measures how fast we can encode the whole corpus
+def benchT42(args):
+	corpus = [pageLegaliser(page.loadTTI(filename, model=True)) for filename in ttiCorpus()]
+	packets = sum(len(t42.encodePage(item)) for item in corpus) // t42.packetSize
+	
+	best = timed(t42.encodePage, corpus, args.repeat)
+	print("T42 encode: " + str(len(corpus)) + " pages, " + str(packets) + " packets")
+	print("  time: %8.2f ms" % (best * 1000))
+	print("  %d packets/s" % (packets / best))
+	return 0
+
+# Exporting every page, without writing anything to disk or skipping anything
+def benchExport(args):
+	corpus = [pageLegaliser(page.loadTTI(filename)) for filename in ttiCorpus()]
+	oldSink = MemorySink()
+	newSink = MemorySink()
+	
+	for item in corpus:
+		legacy.exportTTI(item, False, oldSink)
+		page.exportTTI(item, False, newSink)
+	
+	if oldSink.hashes != newSink.hashes:
+		print("exportTTI: output differs")
+		return 1
+	
+	old = timed(lambda item: legacy.exportTTI(item, False, oldSink), corpus, args.repeat)
+	new = timed(lambda item: page.exportTTI(item, False, newSink), corpus, args.repeat)
+	report("exportTTI", corpus, old, new)
+	return 0
+
+# Each page against itself and against copies with a row changed, a row repeated, a subpage gone and an empty
+# subpage added, which between them are everything that used to make comparison() say no
+def comparisonPairs():
+	pairs = []
+	
+	for filename in ttiCorpus():
+		item = page.loadTTI(filename)
+		pairs.append((item, copy.deepcopy(item)))
+		
+		changed = copy.deepcopy(item)
+		packet = next((packet for packet in changed["subpages"][0]["packets"] if "text" in packet), None)
+		if packet is not None:
+			packet["text"] += "x"
+			pairs.append((item, changed))
+		
+		repeated = copy.deepcopy(item)
+		if packet is not None:
+			repeated["subpages"][0]["packets"].append(dict(packet))
+			pairs.append((item, repeated))
+		
+		if len(item["subpages"]) > 1:
+			pairs.append((item, dict(item, subpages=item["subpages"][:-1])))
+		
+		pairs.append((item, dict(item, subpages=item["subpages"] + [{"packets":[]}])))
+	
+	return pairs
+
+def benchCompare(args):
+	corpus = comparisonPairs()
+	
+	for pageA, pageB in corpus:
+		if legacy.comparison(pageA, pageB) != page.comparison(pageA, pageB):
+			print("comparison: output differs for P" + str(pageA["number"]))
+			return 1
+	
+	old = timed(lambda pair: legacy.comparison(*pair), corpus, args.repeat)
+	new = timed(lambda pair: page.comparison(*pair), corpus, args.repeat)
+	report("comparison", corpus, old, new)
+	return 0
+
+# Headlines and story text from the Yle news pages we've exported, as plain text
+def headlineCorpus():
+	corpus = []
+	
+	for filename in sorted(glob.glob("teletext/P1[0-9][0-9].tti")):
+		for subpage in page.loadTTI(filename)["subpages"]:
+			for packet in subpage["packets"]:
+				if "text" in packet:
+					text = "".join(character for character in packet["text"] if ord(character) >= 0x20).strip()
+					if text:
+						corpus.append(text)
+	
+	return corpus
+
+def benchCharsub(args):
+	corpus = headlineCorpus()
+	
+	for text in corpus:
+		if legacy.charsub(text) != legaliser.charsub(text):
+			print("charsub: output differs for " + repr(text))
+			return 1
+	
+	old = timed(legacy.charsub, corpus, args.repeat)
+	new = timed(legaliser.charsub, corpus, args.repeat)
+	report("charsub", corpus, old, new)
+	return 0
+
+# The X/26 packets are packed differently now (see benchX26), so they're compared separately
+def withoutEnhancements(item):
+	return [[packet for packet in subpage["packets"] if packet["number"] != 26] for subpage in item["subpages"]]
+
+# Every page in the corpus, plus one newsreel-sized page made of 64 of their subpages
+def benchLegalise(args):
+	corpus = [page.loadTTI(filename) for filename in ttiCorpus()]
+	subpages = [subpage for item in corpus for subpage in item["subpages"]]
+	corpus.append({"number":"185", "subpages":subpages[:64]})
+	
+	for item in corpus:
+		if withoutEnhancements(legacy.pageLegaliser(item)) != withoutEnhancements(legaliser.pageLegaliser(item)):
+			print("pageLegaliser: output differs for P" + str(item["number"]))
+			return 1
+	
+	old = timed(legacy.pageLegaliser, corpus, args.repeat)
+	new = timed(legaliser.pageLegaliser, corpus, args.repeat)
+	report("pageLegaliser", corpus, old, new)
+	
+	cacheInfo = legaliser.legaliserCacheInfo()
+	print("  row cache: %d hits, %d misses" % (cacheInfo.hits, cacheInfo.misses))
+	return 0
+
+# Which (row, column, mode, data) enhancements a list of X/26 packets actually makes
+def decodeEnhancements(packets):
+	found = set()
+	row = None
+	
+	for packet in packets:
+		for position in range(1, len(packet), 3):
+			value = sum((ord(character) - 0x40) << (6 * place) for place, character in enumerate(packet[position:position + 3]))
+			address, mode, data = value & 0x3f, (value >> 6) & 0x1f, value >> 11
+			
+			if mode == 0x1f and address == 0x3f:
+				return found	# Terminator
+			if address >= 40:
+				row = 24 if address == 40 else address - 40
+			else:
+				found.add((row, address, mode, data))
+	
+	return found
+
+# Our TV and radio listings as guide pages: one subpage of "HH.MM title" rows per 20 programmes
+def listingCorpus():
+	subpages = []
+	
+	for filename in ("tv_gids.json", "radio_gids.json"):
+		with open(filename, encoding='utf-8') as f:
+			listings = json.load(f)
+		
+		for programmes in listings.values():
+			rows = [(programme["start_time"] + " " + programme["title"])[:40] for programme in programmes]
+			subpages += [rows[start:start + 20] for start in range(0, len(rows), 20)]
+	
+	return subpages
+
+# How many X/26 packets the listings need, old packer against new. In the English profile every ä and ö
+# needs an enhancement, so that's where the difference shows.
+def benchX26(args):
+	for profile in ("finnish", "english"):
+		lists = []
+		for rows in listingCorpus():
+			enhancements = []
+			for number, text in enumerate(rows, 3):
+				legaliser.legaliseRow(number, text, enhancements, profile)
+			lists.append(enhancements)
+		
+		old = [legacy.write_enhancements(enhancements) for enhancements in lists]
+		new = [legaliser.write_enhancements(enhancements) for enhancements in lists]
+		
+		for oldPackets, newPackets, enhancements in zip(old, new, lists):
+			if len(enhancements) < 15 * 13 and decodeEnhancements(oldPackets) != decodeEnhancements(newPackets):
+				print("write_enhancements: output differs")
+				return 1
+		
+		overflowing = sum(1 for enhancements in lists if len(enhancements) > 15 * 13)
+		print("X/26 packets (" + profile + "): " + str(len(lists)) + " subpages, " + str(overflowing) + " over the old limit")
+		print("  old: %6d packets" % sum(len(packets) for packets in old))
+		print("  new: %6d packets" % sum(len(packets) for packets in new))
+	
+	return 0
+
+# FMI marine forecasts, the longest text we wrap. We don't keep any copies of the real ones, so these are
+# put together from the phrases FMI uses, each area getting a few sentences like weather.py's marine pages.
+marineAreas = ("Perämeri", "Merenkurkku", "Selkämeri", "Ahvenanmeren meri", "Saaristomeri", "Suomenlahden länsiosa", "Suomenlahden itäosa", "Pohjois-Itämeri", "Itämeren keskiosa", "Riianlahti")
+marinePhrases = (
+	"Lounais- ja etelätuulta 8-12 m/s, illalla 10-14 m/s.",
+	"Huomenna luoteeseen kääntyvää tuulta 12-16 m/s, puuskissa 20 m/s.",
+	"Sadealueita, sateessa näkyvyys huono.",
+	"Näkyvyys hyvä, sumussa paikoin alle 1 km.",
+	"Yöllä tuuli heikkenee ja kääntyy pohjoiseen/koilliseen 5-9 m/s.",
+	"Aallokko 1,5-2,5 m, ulapalla merkitsevä aallonkorkeus enimmillään 3 m.",
+	"Kovan tuulen varoitus voimassa iltaan asti.",
+	"Poutaa, iltapäivällä yksittäisiä kuurosateita ja ukkosta."
+)
+
+def marineCorpus():
+	corpus = []
+	
+	for number, area in enumerate(marineAreas):
+		sentences = [marinePhrases[(number + step) % len(marinePhrases)] for step in range(3 + number % 4)]
+		corpus.append([{"colour":"cyan", "text":area + ":"}, {"colour":"white", "text":" ".join(sentences)}])
+		corpus.append([{"colour":"white", "text":area + ": " + " ".join(sentences * 3)}])	# A whole forecast in one go
+	
+	return corpus
+
+def benchTextColour(args):
+	corpus = marineCorpus()
+	oldWrap = lambda chunks: legacy.textColour(chunks, maxWidth=40, defaultColour=textBlock.colourCode("white"))
+	newWrap = lambda chunks: textBlock.wrapText(chunks, maxWidth=40, defaultColour=textBlock.colourCode("white"))	# Without the layout cache
+	
+	for chunks in corpus:
+		if oldWrap(chunks) != newWrap(chunks):
+			print("textColour: output differs for " + repr(chunks[0]["text"]))
+			return 1
+	
+	old = timed(oldWrap, corpus, args.repeat)
+	new = timed(newWrap, corpus, args.repeat)
+	report("textColour", corpus, old, new)
+	return 0
+
+# Our TV and radio listings as table rows: time, title and channel, one format for all of them
+def benchTable(args):
+	format = [
+		{"width":5, "data":"time", "colour":"yellow"},
+		{"width":26, "data":"title", "colour":"white"},
+		{"width":6, "data":"channel", "colour":"cyan", "align":"right"}
+	]
+	corpus = []
+	
+	for filename in ("tv_gids.json", "radio_gids.json"):
+		with open(filename, encoding='utf-8') as f:
+			listings = json.load(f)
+		
+		for channel, programmes in listings.items():
+			corpus += [{"time":programme["start_time"], "title":programme["title"], "channel":channel} for programme in programmes]
+	
+	table = textBlock.compile_table(format)
+	
+	if [legacy.tableRow(format, data) for data in corpus] != table.render_rows(corpus):
+		print("tableRow: output differs")
+		return 1
+	
+	old = timed(lambda rows: [legacy.tableRow(format, data) for data in rows], [corpus], args.repeat)
+	new = timed(lambda rows: textBlock.compile_table(format).render_rows(rows), [corpus], args.repeat)
+	report("tableRow", corpus, old, new)
+	return 0
+
+# Our Yle stories as they come out of the feed: each subpage's text as one paragraph, its first row as the title
+def storyCorpus():
+	corpus = []
+	
+	for filename in sorted(glob.glob("teletext/P1[0-9][0-9].tti")):
+		for subpage in page.loadTTI(filename)["subpages"]:
+			rows = ["".join(character for character in packet["text"] if ord(character) >= 0x20).strip() for packet in subpage["packets"] if "text" in packet and 4 < packet["number"] < 22]
+			rows = [row for row in rows if row]
+			if rows:
+				corpus.append((rows[0], " ".join(rows[1:])))
+	
+	return corpus
+
+# Each story laid out the way one run does it: the title and text on its article page (measuring the text first
+# to see if it fits), the title on the index, then all of that again for the newsreel.
+# The old way wraps every one from scratch.
+def benchLayout(args):
+	corpus = []
+	
+	for number, (title, text) in enumerate(storyCorpus()):
+		heading = {"content":[{"align":"left","content":[{"colour":"yellow","text":title}]}]}
+		paragraph = {"content":[{"align":"left","content":[{"colour":"white","text":text}]}]}
+		headline = {"content":[{"align":"left","content":[{"colour":"white","text":title}]},{"align":"right","content":[{"colour":"yellow","text":str(102 + number % 20)}]}]}
+		line = 5 + 2 * (number % 8)
+		
+		corpus += [("render", heading, 5), ("measure", paragraph, 7), ("render", paragraph, 7), ("measure", headline, line), ("render", headline, line)] * 2
+	
+	def layout(item):
+		kind, spec, line = item
+		if kind == "measure":
+			return textBlock.measureTeletextBlock(spec)
+		return textBlock.toTeletextBlock(spec, line=line)
+	
+	def uncached(item):
+		kind, spec, line = item
+		if kind == "measure":
+			return textBlock.measureBlock(spec, wrap=textBlock.wrapText)
+		return textBlock.renderTeletextBlock(spec, 40, line, wrap=textBlock.wrapText)
+	
+	def run(items):
+		textBlock.clearLayoutCache()	# Every pass starts like a new run
+		return [layout(item) for item in items]
+	
+	for item in corpus:
+		if uncached(item) != layout(item):
+			print("toTeletextBlock: output differs for " + repr(item[1]))
+			return 1
+	
+	old = timed(lambda items: [uncached(item) for item in items], [corpus], args.repeat)
+	new = timed(run, [corpus], args.repeat)
+	report("toTeletextBlock", corpus, old, new)
+	
+	blockInfo, wrapInfo = textBlock.layoutCacheInfo()
+	print("  block cache: %d hits, %d misses" % (blockInfo.hits, blockInfo.misses))
+	return 0
+
+# Rows and carousel subpages our stored stories need with first-fit and with optimal line breaking.
+# Stories go onto rows 5 to 22 one after another with a blank row between them, and one that doesn't fit
+# in what's left of a subpage starts the next one, like the newsreel pages fill up.
+def benchLineBreak(args):
+	stories = storyCorpus()
+	firstRow, lastRow = 5, 22
+	results = {}
+	
+	for layout in ("greedy", "optimal"):
+		def rows(story):
+			title, text = story
+			titleRows = textBlock.measureBlock({"layout":layout, "content":[{"align":"left","content":[{"colour":"yellow","text":title}]}]}, wrap=textBlock.wrapText)[0]
+			textRows = textBlock.measureBlock({"layout":layout, "content":[{"align":"left","content":[{"colour":"white","text":text}]}]}, wrap=textBlock.wrapText)[0]
+			return titleRows + textRows
+		
+		counts = [rows(story) for story in stories]
+		subpages = 1
+		line = firstRow
+		
+		for count in counts:
+			if line + count - 1 > lastRow and line > firstRow:
+				subpages += 1
+				line = firstRow
+			line += count + 1
+		
+		results[layout] = (sum(counts), subpages, timed(rows, stories, args.repeat))
+	
+	print("line breaking: " + str(len(stories)) + " stories")
+	for layout, (rowCount, subpages, elapsed) in results.items():
+		print("  %-8s %5d rows %4d subpages %8.2f ms" % (layout + ":", rowCount, subpages, elapsed * 1000))
+	
+	return 0
+
+benchmarks = {
+	"loadtti":benchLoadTTI,
+	"charsub":benchCharsub,
+	"compare":benchCompare,
+	"export":benchExport,
+	"legalise":benchLegalise,
+	"linebreak":benchLineBreak,
+	"layout":benchLayout,
+	"overlay":benchOverlay,
+	"t42":benchT42,
+	"table":benchTable,
+	"textcolour":benchTextColour,
+	"x26":benchX26
+}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="CIMS benchmarks")
+	parser.add_argument("benchmark", choices=sorted(benchmarks))
+	parser.add_argument("--repeat", type=int, default=20, help="passes over the corpus, best one counts")
+	args = parser.parse_args()
+
+	raise SystemExit(benchmarks[args.benchmark](args))
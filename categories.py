@@ -0,0 +1,320 @@
+# News category pipeline for CIMS
+# Every news category is the same job: take a Yle RSS feed, make a page for each story on the category's page
+# template, then an index of the headlines on its index template. So a category is just a line in a table:
+#
+#	{"name":"paauutiset", "feed":"https://yle.fi/rss/uutiset/paauutiset",
+#	 "pageTemplate":"paauutiset_page.tti", "indexTemplate":"paauutiset_index.tti",
+#	 "startPage":102, "maxPages":10, "indexPage":101}
+#
+# with, optionally,
+#	"clean"	a function for the title and story text (otherwise the story just loses its soft hyphens)
+#	"enabled"	False to leave the category out
+#
+# runCategories runs each category as a task of its own, with its own timing. A category that fails to build is
+# reported and has none of its pages exported, and the rest carry on; so do they if one fails partway through
+# exporting. With workers > 1 the categories are
+# built in a thread pool, but their pages are still exported in table order, so where two categories share
+# a page number the later one wins, just as it always has.
+#
+# Given a RenderState, a story page is only built if its story has changed since the last run: each page
+# remembers the GUID of the entry on it and a hash of the entry's title and description (and of the template
+# it was put on, since that has the date in it). An index is only rebuilt if its list of headlines has changed.
+# A page more than one category writes to is always built, and so is any page the sink hasn't got.
+# The hashes also cover the category's own settings (its clean and prepare functions included), and the state is
+# thrown away whenever renderVersion changes, so a change to how pages are made doesn't leave old pages on air.
+
+import collections, concurrent.futures, hashlib, json, logging, time
+
+from bs4 import BeautifulSoup
+
+from feeds import getFeed, prefetchFeeds
+from legaliser import pageLegaliser
+from sinks import writeAtomically
+import page
+from page import clonePackets, exportTTI, loadTemplate
+from textBlock import measureTeletextBlock, toTeletextBlock
+
+firstLine = 5
+lastLine = 22
+
+# Bump this whenever a change here, in textBlock or in the legaliser changes what the pages look like,
+# so the next run builds every page again rather than skipping the ones whose stories haven't changed
+renderVersion = 1
+
+CategoryResult = collections.namedtuple("CategoryResult", ["name", "seconds", "pages", "error", "skipped"])
+
+class CategoryReport:
+	def __init__(self, results, wall):
+		self.results = results	# A CategoryResult for each category, in table order
+		self.wall = wall
+
+	def failed(self):
+		return [result for result in self.results if result.error is not None]
+
+	def __str__(self):
+		lines = ["Categories: " + str(len(self.results)) + " in " + format(self.wall, ".2f") + "s, " + str(len(self.failed())) + " failed, " + str(sum(result.skipped for result in self.results)) + " unchanged pages skipped"]
+
+		for result in self.results:
+			outcome = str(result.pages) + " pages" if result.error is None else "failed: " + str(result.error)
+			if result.skipped:
+				outcome += ", " + str(result.skipped) + " skipped"
+			lines.append("  " + format(result.seconds, "6.2f") + "s  " + outcome.ljust(22) + "  " + result.name)
+
+		return "\n".join(lines)
+
+# Stable from one run to the next, unlike hash()
+def contentHash(*parts):
+	return hashlib.blake2b("\x00".join(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+# A function's code, so an edit to a clean or prepare function changes the hashes without anyone having to
+# remember to bump renderVersion. Code objects inside it (lambdas, comprehensions) are followed too.
+def codeFingerprint(code):
+	parts = [code.co_code.hex()] + list(code.co_names)
+
+	for constant in code.co_consts:
+		parts.append(codeFingerprint(constant) if hasattr(constant, "co_code") else repr(constant))
+
+	return contentHash(*parts)
+
+def functionFingerprint(function):
+	if function is None:
+		return ""
+
+	name = (getattr(function, "__module__", None) or "") + "." + getattr(function, "__qualname__", repr(function))
+	code = getattr(function, "__code__", None)
+
+	return name if code is None else name + ":" + codeFingerprint(code)
+
+# Everything about a category that changes how its pages look: its settings bar the feed, plus prepare
+def configHash(category, prepare):
+	settings = {key:(functionFingerprint(value) if callable(value) else value) for key, value in category.items() if key not in ("feed", "enabled")}
+	return contentHash(str(renderVersion), json.dumps(settings, sort_keys=True), functionFingerprint(prepare))
+
+# What each category's pages had on them last time, kept in a JSON file between runs:
+#	{"version": renderVersion, "categories": {category: {"pages": {page number: [guid, hash]}, "index": hash}}}
+# A file from a different renderVersion is ignored.
+class RenderState:
+	def __init__(self, filename=None):
+		self.filename = filename
+		self.categories = {}
+
+		if filename is not None:
+			self.load()
+
+	def load(self):
+		try:
+			with open(self.filename, encoding='utf-8') as f:
+				stored = json.load(f)
+		except (OSError, ValueError):
+			stored = {}	# No state yet, so everything gets built
+
+		if isinstance(stored, dict) and stored.get("version") == renderVersion:
+			self.categories = stored.get("categories", {})
+		else:
+			self.categories = {}	# Pages made some other way, so none of them can be trusted
+
+	def save(self, filename=None):
+		writeAtomically(filename or self.filename, json.dumps({"version":renderVersion, "categories":self.categories}, sort_keys=True).encode('utf-8'))
+
+	def unchanged(self, name, number, guid, pageHash):
+		return self.categories.get(name, {}).get("pages", {}).get(str(number)) == [guid, pageHash]
+
+	def indexUnchanged(self, name, indexHash):
+		return self.categories.get(name, {}).get("index") == indexHash
+
+	# What a category has on its pages now. Only called once they've all been exported.
+	def update(self, name, pages, indexHash):
+		self.categories[name] = {"pages":{str(number):entry for number, entry in pages.items()}, "index":indexHash}
+
+# The same entry from one run to the next. Yle's entries all have a GUID, but just in case.
+def entryId(newsArticle):
+	return newsArticle.get("id") or newsArticle.get("link") or newsArticle["title"]
+
+# Everything on a template page, so a change of template (or of the date on it) shows up in the hashes
+def templateHash(teletextPage):
+	return contentHash(*(str(packet.get("number")) + ":" + str(packet.get("text")) for packet in teletextPage["subpages"][0]["packets"]))
+
+# Page numbers more than one of these categories writes to. Those have to be built every time, as whatever
+# the later category skipped would be left with the earlier one's page on it.
+def sharedPages(categories):
+	seen = collections.Counter()
+
+	for category in categories:
+		seen.update(set(range(category["startPage"], category["startPage"] + category["maxPages"] + 1)) | {category["indexPage"]})
+
+	return {number for number, count in seen.items() if count > 1}
+
+# A new page on a template. prepare gets it before anything's written on it (demo.py fills in the date).
+def templatePage(number, template, prepare):
+	teletextPage = {"number":number,"subpages":[{"packets":clonePackets(template["subpages"][0]["packets"])}]}
+
+	if prepare is not None:
+		teletextPage = prepare(teletextPage)
+
+	return teletextPage
+
+def articleTitle(category, newsArticle):
+	title = newsArticle["title"].strip()
+
+	if category.get("clean") is not None:
+		title = category["clean"](title)
+
+	return title
+
+# One story: the title in yellow, then the description if it fits on the page
+def articlePage(category, number, template, newsArticle, title, prepare):
+	clean = category.get("clean")
+	line = firstLine
+	teletextPage = templatePage(number, template, prepare)
+
+	paraBlock = toTeletextBlock(
+		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":title}]}]},
+		line = line
+	)
+	line += (len(paraBlock) + 1)
+	teletextPage["subpages"][0]["packets"] += paraBlock
+
+	# Yle puts the summary in the description
+	articleText = newsArticle["description"] if "description" in newsArticle else newsArticle["title"]
+
+	if clean is not None:
+		articleText = clean(articleText)
+	else:
+		articleText = articleText.replace("\u00AD", "")
+
+	# The description should be plain text, but just in case
+	paragraph = {"content":[{"align":"left","content":[{"colour":"white","text":BeautifulSoup(articleText, "lxml").get_text()}]}]}
+
+	if (measureTeletextBlock(paragraph)[0] + line) <= lastLine:
+		teletextPage["subpages"][0]["packets"] += toTeletextBlock(input = paragraph, line = line)
+
+	return teletextPage
+
+# The headlines, each with its page number, for as many as fit
+def indexPage(category, headlines, teletextPage):
+	line = firstLine
+
+	for headline in headlines:
+		paragraph = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]}
+
+		if (measureTeletextBlock(paragraph)[0] + line) > lastLine:
+			break
+
+		paraBlock = toTeletextBlock(input = paragraph, line = line)
+		line += (len(paraBlock) + 1)
+		teletextPage["subpages"][0]["packets"] += paraBlock
+
+	return teletextPage
+
+# A category's pages, with nothing but the rendering to do. state, shared and sink are only used to skip
+# pages that haven't changed.
+class CategoryBuild:
+	def __init__(self):
+		self.pages = []	# Legalised and ready to export: the stories, then the index
+		self.skipped = 0
+		self.entries = {}	# page number -> [guid, hash], for the RenderState
+		self.indexHash = None
+
+def buildCategory(category, prepare=None, state=None, shared=frozenset(), sink=None):
+	name = category["name"]
+	template = loadTemplate(category["pageTemplate"])
+	newsData = getFeed(category["feed"])
+	build = CategoryBuild()
+	headlines = []
+
+	if sink is None:
+		sink = page.defaultSink
+
+	# A page the sink already has that hasn't changed since, so it can be left alone
+	def kept(number, unchanged):
+		return unchanged and number not in shared and sink.lastHash(sink.pageName(number)) is not None
+
+	if state is not None:
+		pageTemplateHash = contentHash(templateHash(templatePage(0, template, prepare)), configHash(category, prepare))
+
+	for pageNum, newsArticle in enumerate(newsData['entries']):
+		number = category["startPage"] + pageNum
+		title = articleTitle(category, newsArticle)
+		headlines.append({"title":title,"number":str(number)})
+
+		if state is not None:
+			guid = entryId(newsArticle)
+			pageHash = contentHash(newsArticle["title"], newsArticle.get("description", ""), pageTemplateHash)
+			build.entries[number] = [guid, pageHash]
+
+		if state is not None and kept(number, state.unchanged(name, number, guid, pageHash)):
+			build.skipped += 1
+		else:
+			build.pages.append(pageLegaliser(articlePage(category, number, template, newsArticle, title, prepare)))
+
+		# demo.py always stopped after the page *past* maxPages, so that's what we do too
+		if pageNum >= category["maxPages"]:
+			break
+
+	number = category["indexPage"]
+	teletextPage = templatePage(number, loadTemplate(category["indexTemplate"]), prepare)
+
+	if state is not None:
+		build.indexHash = contentHash(templateHash(teletextPage), configHash(category, prepare), *(headline["number"] + ":" + headline["title"] for headline in headlines))
+
+		if kept(number, state.indexUnchanged(name, build.indexHash)):
+			build.skipped += 1
+			return build
+
+	build.pages.append(pageLegaliser(indexPage(category, headlines, teletextPage)))
+	return build
+
+# buildCategory, timed, with any exception caught and handed back rather than raised
+def runCategory(category, prepare, state, shared, sink):
+	start = time.perf_counter()
+
+	try:
+		build = buildCategory(category, prepare, state, shared, sink)
+		error = None
+	except Exception as exception:
+		logging.exception("Category " + category["name"] + " failed")
+		build = CategoryBuild()
+		error = exception
+
+	return build, error, time.perf_counter() - start
+
+def exportCategory(category, build, error, seconds, state, sink):
+	start = time.perf_counter()
+
+	try:
+		for teletextPage in build.pages:
+			exportTTI(teletextPage, sink=sink)
+	except Exception as exception:	# Like a build error, this only stops this category
+		logging.exception("Category " + category["name"] + " failed to export")
+		error = exception
+
+	if state is not None and error is None:
+		state.update(category["name"], build.entries, build.indexHash)
+
+	return CategoryResult(category["name"], seconds + time.perf_counter() - start, len(build.pages), error, build.skipped)
+
+# Build and export every enabled category. Returns a CategoryReport.
+# With a RenderState, pages that haven't changed since it was last saved are skipped, and it's saved afterwards.
+def runCategories(categories, workers=1, prepare=None, state=None, sink=None):
+	categories = [category for category in categories if category.get("enabled", True)]
+	shared = sharedPages(categories)
+	start = time.perf_counter()
+
+	if sink is None:
+		sink = page.defaultSink
+
+	prefetchFeeds([category["feed"] for category in categories])	# Anything we haven't got yet, all at once
+
+	if workers > 1:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+			futures = [pool.submit(runCategory, category, prepare, state, shared, sink) for category in categories]
+			results = [exportCategory(category, *future.result(), state, sink) for category, future in zip(categories, futures)]
+	else:
+		results = [exportCategory(category, *runCategory(category, prepare, state, shared, sink), state, sink) for category in categories]
+
+	sink.flush()	# The sink's hashes first: a page the state says we can skip has to be one the sink knows it has
+
+	if state is not None and state.filename is not None:
+		state.save()
+
+	return CategoryReport(results, time.perf_counter() - start)
@@ -0,0 +1,308 @@
+# National option character sets for CIMS
+# Level 1 teletext has 13 characters that change with the national option a page is sent with: on a Finnish
+# page 0x5b is Ä, on a German one it's still Ä, but on an English one it's an arrow. A profile is one of these
+# options, compiled once, when this module is imported, into everything the loader and the legaliser need:
+#
+#	decodeTable	level 1 -> unicode, a str.translate table for loadTTI
+#	encodeTable	unicode -> level 1, a str.translate table for the legaliser (anything else over 127 becomes 0x7f)
+#	asciiTable	the same as encodeTable for rows that are plain ASCII, as a bytes.translate table
+#	enhancements	characters the profile can't show on level 1 -> (mode, data) for their X/26 enhancement
+#	language	the C12-C14 bits, where they go in a .tti page status word
+#
+# Pages pick a profile by name with "profile" (page["profile"], or Page.profile). Finnish is the default.
+
+enhancementmapping = {
+	# map to L1 replacement character, enhancement mode, enhancement data
+	# these can be mapped to level 1 characters provided we are using the English language (which we always are right now)
+
+#¤ÉÄÖÅÜ_éäöåü
+
+	"#":[0x23,0,0],
+	"¤":[0x24,0,0],
+	"É":[0x40,0,0],
+	"Ä":[0x5b,0,0],
+	"Ö":[0x5c,0,0],
+	"Å":[0x5d,0,0],
+	"Ü":[0x5e,0,0],
+	"_":[0x5F,0,0],
+	"é":[0x60,0,0],
+	"ä":[0x7b,0,0],
+	"ö":[0x7c,0,0],
+	"å":[0x7d,0,0],
+	"ü":[0x7e,0,0],
+
+	# no diacritic - i.e. the Latin G0 character set
+	# 0x23 character already present in English NOS
+	"¤":[0x7f,0x10,0x24],
+	"[":[0x28,0x10,0x5b],
+	"\\":[0x2f,0x10,0x5c],
+	"]":[0x29,0x10,0x5d],
+	"^":[0x20,0x10,0x5e],
+	"{":[0x28,0x10,0x7b],
+	"|":[0x20,0x10,0x7c],
+	"}":[0x29,0x10,0x7d],
+	"~":[0x7f,0x10,0x7e],
+
+	# grave AEIOUaeiou
+	"À":[0x41,0x11,0x41],"È":[0x45,0x11,0x45],"Ì":[0x49,0x11,0x49],"Ò":[0x4F,0x11,0x4F],"Ù":[0x55,0x11,0x55],
+	"à":[0x61,0x11,0x61],"è":[0x65,0x11,0x65],"ì":[0x69,0x11,0x69],"ò":[0x6F,0x11,0x6F],"ù":[0x75,0x11,0x75],
+
+	# acute ACEILNORSUYZacegilnorsuyz
+	"Á":[0x41,0x12,0x41],"Ć":[0x43,0x12,0x43],"Í":[0x49,0x12,0x49],"Ĺ":[0x4c,0x12,0x4c],"Ń":[0x4e,0x12,0x4e],"Ó":[0x4f,0x12,0x4f],"Ŕ":[0x52,0x12,0x52],"Ś":[0x53,0x12,0x53],"Ú":[0x55,0x12,0x55],"Ý":[0x59,0x12,0x59],"Ź":[0x5a,0x12,0x5a],
+	"á":[0x61,0x12,0x61],"ć":[0x63,0x12,0x63],"í":[0x69,0x12,0x69],"ĺ":[0x6c,0x12,0x6c],"ń":[0x6e,0x12,0x6e],"ó":[0x6f,0x12,0x6f],"ŕ":[0x72,0x12,0x72],"ś":[0x73,0x12,0x73],"ú":[0x75,0x12,0x75],"ý":[0x79,0x12,0x79],"ź":[0x7a,0x12,0x7a],
+
+	# circumflex ACEGHIJOSUWYaceghijosuwy
+	"Â":[0x41,0x13,0x41],"Ĉ":[0x43,0x13,0x43],"Ê":[0x45,0x13,0x45],"Ĝ":[0x47,0x13,0x47],"Ĥ":[0x48,0x13,0x48],"Î":[0x49,0x13,0x49],"Ĵ":[0x4a,0x13,0x4a],"Ô":[0x4f,0x13,0x4f],"Ŝ":[0x53,0x13,0x53],"Û":[0x55,0x13,0x55],"Ŵ":[0x57,0x13,0x57],"Ŷ":[0x59,0x13,0x59],
+	"â":[0x61,0x13,0x61],"ĉ":[0x63,0x13,0x63],"ê":[0x65,0x13,0x65],"ĝ":[0x67,0x13,0x67],"ĥ":[0x68,0x13,0x68],"î":[0x69,0x13,0x69],"ĵ":[0x6a,0x13,0x6a],"ô":[0x6f,0x13,0x6f],"ŝ":[0x73,0x13,0x73],"û":[0x75,0x13,0x75],"ŵ":[0x77,0x13,0x77],"ŷ":[0x79,0x13,0x79],
+
+	# tilde AINOUainou
+	"Ã":[0x41,0x14,0x41],"Ĩ":[0x49,0x14,0x49],"Ñ":[0x4e,0x14,0x4e],"Õ":[0x4f,0x14,0x4f],"Ũ":[0x55,0x14,0x55],
+	"ã":[0x61,0x14,0x61],"ĩ":[0x69,0x14,0x69],"ñ":[0x6e,0x14,0x6e],"õ":[0x6f,0x14,0x6f],"ũ":[0x75,0x14,0x75],
+
+	# macron AEIOUaeiou
+	"Ā":[0x41,0x15,0x41],"Ē":[0x45,0x15,0x45],"Ī":[0x49,0x15,0x49],"Ō":[0x4f,0x15,0x4f],"Ū":[0x55,0x15,0x55],
+	"ā":[0x61,0x15,0x61],"ē":[0x65,0x15,0x65],"ī":[0x69,0x15,0x69],"ō":[0x6f,0x15,0x6f],"ū":[0x75,0x15,0x75],
+
+	# breve AGUagu
+	"Ă":[0x41,0x16,0x41],"Ğ":[0x47,0x16,0x47],"Ŭ":[0x55,0x16,0x55],
+	"ă":[0x61,0x16,0x61],"ğ":[0x67,0x16,0x67],"ŭ":[0x75,0x16,0x75],
+
+	# dot CEGIZcegz
+	"Ċ":[0x43,0x17,0x43],"Ė":[0x45,0x17,0x45],"Ġ":[0x47,0x17,0x47],"İ":[0x49,0x17,0x49],"Ż":[0x5a,0x17,0x5a],
+	"ċ":[0x63,0x17,0x63],"ė":[0x65,0x17,0x65],"ġ":[0x67,0x17,0x67],"ż":[0x7a,0x17,0x7a],
+
+	# diaeresis/umlaut AEIOUYaeiouy
+	"Ë":[0x45,0x18,0x45],"Ï":[0x49,0x18,0x49],"Ÿ":[0x59,0x18,0x59],
+	"ë":[0x65,0x18,0x65],"ï":[0x69,0x18,0x69],"ÿ":[0x79,0x18,0x79],
+
+	# ring AUau
+	"Ů":[0x55,0x1a,0x55],
+	"ů":[0x75,0x1a,0x75],
+
+	# cedilla CGKLNRSTcklnrst
+	"Ç":[0x43,0x1b,0x43],"Ģ":[0x47,0x1b,0x47],"Ķ":[0x4b,0x1b,0x4b],"Ļ":[0x4c,0x1b,0x4c],"Ņ":[0x4e,0x1b,0x4e],"Ŗ":[0x52,0x1b,0x52],"Ş":[0x53,0x1b,0x53],"Ț":[0x54,0x1b,0x54],
+	"ç":[0x63,0x1b,0x63],"ķ":[0x6b,0x1b,0x6b],"ļ":[0x6c,0x1b,0x6c],"ņ":[0x6e,0x1b,0x6e],"ŗ":[0x72,0x1b,0x72],"ş":[0x73,0x1b,0x73],"ț":[0x74,0x1b,0x74],
+
+	# double acute OUou
+	"Ő":[0x4f,0x1d,0x4f],"Ű":[0x55,0x1d,0x55],
+	"ő":[0x6f,0x1d,0x6f],"ű":[0x75,0x1d,0x75],
+
+	# ogonek AEIUaeiu
+	"Ą":[0x41,0x1e,0x41],"Ę":[0x45,0x1e,0x45],"Į":[0x49,0x1e,0x49],"Ų":[0x55,0x1e,0x55],
+	"ą":[0x61,0x1e,0x61],"ę":[0x65,0x1e,0x65],"į":[0x69,0x1e,0x69],"ų":[0x75,0x1e,0x75],
+
+	# caron/háček CDELNRSTZcdelnrstz
+	"Č":[0x43,0x1f,0x43],"Ď":[0x44,0x1f,0x44],"Ě":[0x45,0x1f,0x45],"Ľ":[0x4c,0x1f,0x4c],"Ň":[0x4e,0x1f,0x4e],"Ř":[0x52,0x1f,0x52],"Š":[0x53,0x1f,0x53],"Ť":[0x54,0x1f,0x54],"Ž":[0x5a,0x1f,0x5a],
+	"č":[0x63,0x1f,0x63],"ď":[0x64,0x1f,0x64],"ě":[0x65,0x1f,0x65],"ľ":[0x6c,0x1f,0x6c],"ň":[0x6e,0x1f,0x6e],"ř":[0x72,0x1f,0x72],"š":[0x73,0x1f,0x73],"ť":[0x74,0x1f,0x74],"ž":[0x7a,0x1f,0x7a],
+	# symbols from the Latin G2 supplementary set
+	"¡":[0x21,0x0F,0x21],
+	"¢":[0x63,0x0F,0x22],
+	# 0x23 character already present in English NOS
+	# 0x24 character already present in English NOS
+	"¥":[0x59,0x0F,0x25],
+	# 0x26 character already present in English NOS
+	"§":[0x53,0x0F,0x27],
+	# 0x28 already mapped from G0 set
+	"‘":[0x27,0x0F,0x29],
+	"“":[0x22,0x0F,0x2a],
+	"«":[0x3c,0x0F,0x2b],
+	# 0x2c character already present in English NOS
+	# 0x2d character already present in English NOS
+	# 0x2e character already present in English NOS
+	"↓":[0x7f,0x0F,0x2f],
+	"°":[0x7f,0x0F,0x30],
+	"±":[0x7f,0x0F,0x31],
+	"²":[0x7f,0x0F,0x32],
+	"³":[0x7f,0x0F,0x33],
+	"×":[0x7f,0x0F,0x34],
+	"µ":[0x7f,0x0F,0x35],
+	"¶":[0x7f,0x0F,0x36],
+	"·":[0x7f,0x0F,0x37],
+	# 0x38 characeter already present in English NOS
+	"’":[0x27,0x0F,0x39],
+	"”":[0x22,0x0F,0x3a],
+	"»":[0x3e,0x0F,0x3b],
+	# 0x3c character already present in English NOS
+	# 0x3d character already present in English NOS
+	# 0x3e character already present in English NOS
+	"¿":[0x3F,0x0F,0x3f],
+	# 0x40-0x4f are the diacritic characters
+	# 0x50 character already present in English NOS
+	"¹":[0x7f,0x0F,0x51],
+	"®":[0x7f,0x0F,0x52],
+	"©":[0x7f,0x0F,0x53],
+	"™":[0x7f,0x0F,0x54],
+	"♪":[0x7f,0x0F,0x55],
+	"₠":[0x45,0x0F,0x56],
+	"‰":[0x7f,0x0F,0x57],
+	"∝":[0x7f,0x0F,0x58],
+	# 0x59-0x5b are reserved
+	"⅛":[0x7f,0x0F,0x5c],
+	"⅜":[0x7f,0x0F,0x5d],
+	"⅝":[0x7f,0x0F,0x5e],
+	"⅞":[0x7f,0x0F,0x5f],
+	"Ω":[0x7f,0x0F,0x60],
+	"Æ":[0x7f,0x0F,0x61],
+	"Đ":[0x44,0x0F,0x62],
+	"ª":[0x61,0x0F,0x63],
+	"Ħ":[0x48,0x0F,0x64],
+	# 0x65 is reserved
+	"Ĳ":[0x7f,0x0F,0x66],
+	"Ŀ":[0x4C,0x0F,0x67],
+	"Ł":[0x4C,0x0F,0x68],
+	"Ø":[0x4f,0x0F,0x69],
+	"Œ":[0x7f,0x0F,0x6a],
+	"º":[0x6f,0x0F,0x6b],
+	"Þ":[0x7f,0x0F,0x6c],
+	"Ŧ":[0x4f,0x0F,0x6d],
+	"Ŋ":[0x7f,0x0F,0x6e],
+	"ŉ":[0x6e,0x0F,0x6f],
+	"ĸ":[0x71,0x0F,0x70],
+	"æ":[0x7f,0x0F,0x71],
+	"đ":[0x64,0x0F,0x72],
+	"ð":[0x64,0x0F,0x73],
+	"ħ":[0x68,0x0F,0x74],
+	"ı":[0x69,0x0F,0x75],
+	"ĳ":[0x7f,0x0F,0x76],
+	"ŀ":[0x6C,0x0F,0x77],
+	"ł":[0x6C,0x0F,0x78],
+	"ø":[0x6f,0x0F,0x79],
+	"œ":[0x7f,0x0F,0x7a],
+	"ß":[0x73,0x0F,0x7b],
+	"þ":[0x7f,0x0F,0x7c],
+	"ŧ":[0x4f,0x0F,0x7d],
+	"ŋ":[0x7f,0x0F,0x7e],
+
+	# G1 mosaics
+	"▌":[0x7f,0x01,0x35],
+	"▐":[0x7f,0x01,0x6a],
+	"█":[0x7f,0x01,0x7f],
+
+	# G3 smooth mosaics and line drawing set
+	"▒":[0x7f,0x02,0x2f],
+	"●":[0x7f,0x02,0x4D],
+	"⬤":[0x7f,0x02,0x4E],
+	"◯":[0x4f,0x02,0x4F],
+
+	#todo: more mappings
+}
+
+# Characters some national option has that nothing in enhancementmapping covers, because they were Finnish ones
+# (or English ones, which we never used to send)
+extraEnhancements = {
+	"Ä":[0x41,0x18,0x41],"Ö":[0x4f,0x18,0x4f],"Ü":[0x55,0x18,0x55],
+	"ä":[0x61,0x18,0x61],"ö":[0x6f,0x18,0x6f],"ü":[0x75,0x18,0x75],
+	"Å":[0x41,0x1a,0x41],"å":[0x61,0x1a,0x61],
+	"É":[0x45,0x12,0x45],"é":[0x65,0x12,0x65],
+	"←":[0x7f,0x0F,0x2c],"↑":[0x7f,0x0F,0x2d],"→":[0x7f,0x0F,0x2e],
+	"÷":[0x7f,0x0F,0x38],
+	"¼":[0x7f,0x0F,0x3c],"½":[0x7f,0x0F,0x3d],"¾":[0x7f,0x0F,0x3e],
+	"―":[0x2d,0x0F,0x50]
+}
+
+# The codes that change between national options, and what the Latin G0 set has in each of them
+nationalPositions = (0x23,0x24,0x40,0x5b,0x5c,0x5d,0x5e,0x5f,0x60,0x7b,0x7c,0x7d,0x7e)
+latinCharacters = "#¤@[\\]^_`{|}~"
+
+# What to show on level 1 when one of those Latin G0 characters has to be an enhancement instead
+latinFallbacks = {"#":0x7f, "¤":0x7f, "@":0x7f, "[":0x28, "\\":0x2f, "]":0x29, "^":0x20, "_":0x20, "`":0x27, "{":0x28, "|":0x20, "}":0x29, "~":0x7f}
+
+# name: (C12-C14 as they go in the page status word, the national characters in nationalPositions order)
+nationalOptions = {
+	"english":(0b000, "£$@←½→↑#―¼‖¾÷"),
+	"german":(0b100, "#$§ÄÖÜ^_°äöüß"),
+	"finnish":(0b010, "#¤ÉÄÖÅÜ_éäöåü"),
+	"italian":(0b110, "£$é°ç→↑#ùàòèì"),
+	"french":(0b001, "éïàëêùî#èâôûç"),
+	"spanish":(0b101, "ç$¡áéíóú¿üñèà"),
+	"czech":(0b011, "#ůčťžýířéáěúš")
+}
+
+# Some other names people will look for
+profileAliases = {"swedish":"finnish", "portuguese":"spanish", "slovak":"czech"}
+
+defaultProfile = "finnish"
+
+# Anything that isn't in the table and is over 127 can't go out on level 1 at all
+class LevelOneTable(dict):
+	def __missing__(self, code):
+		self[code] = 0x7f	# Only characters over 127 aren't in here already
+		return 0x7f
+
+class Profile:
+	__slots__ = ("name", "language", "national", "decodeTable", "encodeTable", "asciiTable", "enhancements", "enhancedSet")
+	
+	def __init__(self, name, language, national):
+		self.name = name
+		self.language = language
+		self.national = national
+		self.decodeTable = str.maketrans(dict(zip(nationalPositions, national)))
+		
+		# Everything we know how to enhance, then the Latin G0 characters this option has swapped out,
+		# then the option's own characters, which don't need enhancing at all
+		mapping = {character:safeChar for character, safeChar in enhancementmapping.items() if safeChar[1]}
+		mapping.update(extraEnhancements)
+		
+		for code, character in zip(nationalPositions, latinCharacters):
+			if character not in national:
+				mapping[character] = [latinFallbacks[character],0x10,code]
+		
+		if "$" not in national:
+			mapping["$"] = [0x7f,0x0F,0x24]	# The dollar lives in G2
+		
+		for code, character in zip(nationalPositions, national):
+			mapping[character] = [code,0,0]
+		
+		self.encodeTable = LevelOneTable((code, code) for code in range(128))
+		self.enhancements = {}
+		
+		for character, (levelOne, mode, data) in mapping.items():
+			if levelOne > 127:
+				self.encodeTable[ord(character)] = 0x7f	# Nothing we can do with this one
+				continue
+			
+			self.encodeTable[ord(character)] = levelOne
+			
+			if mode:
+				self.enhancements[character] = (mode, data)
+		
+		self.enhancedSet = frozenset(self.enhancements)
+		self.asciiTable = bytes(self.encodeTable[code] for code in range(128)) + bytes(range(128, 256))
+	
+	# The language bits for a .tti page status word
+	def statusBits(self):
+		return self.language << 7
+	
+	def decode(self, text):
+		return text.translate(self.decodeTable)
+	
+	def encode(self, text):
+		if text.isascii():
+			return text.encode("ascii").translate(self.asciiTable).decode("ascii")
+		
+		return text.translate(self.encodeTable)
+
+profiles = {name:Profile(name, language, national) for name, (language, national) in nationalOptions.items()}
+
+# Find a profile by name (or just hand one back). None gets you the default.
+def getProfile(profile=None):
+	if isinstance(profile, Profile):
+		return profile
+	
+	if profile is None:
+		profile = defaultProfile
+	
+	profile = profile.lower()
+	profile = profileAliases.get(profile, profile)
+	
+	if profile not in profiles:
+		raise ValueError("Unknown character set profile " + repr(profile))
+	
+	return profiles[profile]
+
+# The profile a page (dict or pagemodel.Page) asks for
+def pageProfile(page):
+	if isinstance(page, dict):
+		return getProfile(page.get("profile"))
+	
+	return getProfile(getattr(page, "profile", None))
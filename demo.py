@@ -11,9 +11,7 @@
 
 # Start by importing all the libraries we need
 import feedparser
-from bs4 import BeautifulSoup
 import lxml
-import copy
 import newsreel
 import weathermap
 import veikkausliiga
@@ -25,9 +23,11 @@ from weather import main as weather_main
 from datetime import datetime
 import unicodedata
 
-from textBlock import toTeletextBlock
-from page import exportTTI, loadTTI
-from legaliser import pageLegaliser
+from feeds import getFeed, prefetchFeeds, feedCacheInfo, httpCacheInfo
+from categories import runCategories, RenderState
+from textBlock import toTeletextBlock, layoutCacheInfo
+from page import exportTTI, loadTemplate, clonePackets, defaultSink
+from legaliser import pageLegaliser, legaliserCacheInfo
 
 # Finse dag- en maandnamen
 FINNISH_DAYS = ["MAANANTAI", "TIISTAI", "KESKIVIIKKO", "TORSTAI", "PERJANTAI", "LAUANTAI", "SUNNUNTAI"]
@@ -83,792 +83,34 @@ def vervang_datum_in_tti(tti_data):
     
     return tti_data
 
-# Load the template page for the header & footer
-newsPageTemplate = loadTTI("paauutiset_page.tti")
-
-# How many news pages do we want to create?
-maxPages = 10
-startPage = 102
-
-# Download and parse an RSS Feed of news from Yle
-newsData = feedparser.parse("https://yle.fi/rss/uutiset/paauutiset")
-
-# Initialise a Page Counter
-pageNum = 0
-
-# Create a headlines list for P101
-headlines = []
-
-# Loop through each news story to produce pages
-for newsArticle in newsData['entries']:
-	# Set the first line we write on
-	line = 5
-	
-	# Create a new teletext page
-	teletextPage = {"number":(pageNum + startPage),"subpages":[{"packets":copy.deepcopy(newsPageTemplate["subpages"][0]["packets"])}]}
-	
-	# Vervang DAY/DATE placeholders in de template
-	teletextPage = vervang_datum_in_tti(teletextPage)
-	
-	# Get the title from Yle RSS
-	clean_title = newsArticle["title"].strip()
-	
-	# Create the title
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":clean_title}]}]},
-		line = line
-	)
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add the title to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Yle gebruikt 'description' voor de samenvatting
-	if "description" in newsArticle:
-		article_text = newsArticle["description"]
-	else:
-		article_text = newsArticle["title"]  # fallback
-
-	# fix: verwijder soft hyphen (U+00AD)
-	article_text = article_text.replace("\u00AD", "")
-    
-	# Voor Yle is description plain text, maar we gebruiken BeautifulSoup voor de zekerheid
-	soup = BeautifulSoup(article_text, "lxml")
-	
-	# Maak één paragraaf van de beschrijving
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":soup.get_text()}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) <= 22:
-		# Move on the line pointer
-		line += (len(paraBlock) + 1)
-		
-		# Add this paragraph to the teletext page
-		teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Export the final page
-	# We run it through "legaliser", this fixes the accented characters, but may be wrong for your country!
-	exportTTI(pageLegaliser(teletextPage))
-	
-	# Use the cleaned title for headlines too
-	headlines.append({"title":clean_title,"number":str(pageNum + startPage)})
-	
-	# Iterate the page counter
-	pageNum += 1
-	
-	# Stop when we have enough pages
-	if pageNum > maxPages:
-		break
-
-# Next we create P101, the headlines
-# Start by loading the template
-newsIndexTemplate = loadTTI("paauutiset_index.tti")
-
-# Create a page
-teletextPage = {"number":101,"subpages":[{"packets":copy.deepcopy(newsIndexTemplate["subpages"][0]["packets"])}]}
-
-# Vervang DAY/DATE placeholders met echte Finse datum
-teletextPage = vervang_datum_in_tti(teletextPage)
-
-line = 5
-
-for headline in headlines:
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) > 22:
-		break
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add this paragraph to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-
-exportTTI(pageLegaliser(teletextPage))
-
-# Load the template page for the header & footer
-newsPageTemplate = loadTTI("tuoreimmat_page.tti")
-
-# How many news pages do we want to create?
-maxPages = 10
-startPage = 112
-
-# Download and parse an RSS Feed of news from Yle
-newsData = feedparser.parse("https://yle.fi/rss/uutiset/tuoreimmat")
-
-# Initialise a Page Counter
-pageNum = 0
-
-# Create a headlines list for P101
-headlines = []
-
-# Loop through each news story to produce pages
-for newsArticle in newsData['entries']:
-	# Set the first line we write on
-	line = 5
-	
-	# Create a new teletext page
-	teletextPage = {"number":(pageNum + startPage),"subpages":[{"packets":copy.deepcopy(newsPageTemplate["subpages"][0]["packets"])}]}
-	
-	# Vervang DAY/DATE placeholders in de template
-	teletextPage = vervang_datum_in_tti(teletextPage)
-	
-	# Get the title from Yle RSS
-	clean_title = newsArticle["title"].strip()
-	
-	# Create the title
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":clean_title}]}]},
-		line = line
-	)
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add the title to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Yle gebruikt 'description' voor de samenvatting
-	if "description" in newsArticle:
-		article_text = newsArticle["description"]
-	else:
-		article_text = newsArticle["title"]  # fallback
-
-	# fix: verwijder soft hyphen (U+00AD)
-	article_text = article_text.replace("\u00AD", "")
-    
-	# Voor Yle is description plain text, maar we gebruiken BeautifulSoup voor de zekerheid
-	soup = BeautifulSoup(article_text, "lxml")
-	
-	# Maak één paragraaf van de beschrijving
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":soup.get_text()}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) <= 22:
-		# Move on the line pointer
-		line += (len(paraBlock) + 1)
-		
-		# Add this paragraph to the teletext page
-		teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Export the final page
-	# We run it through "legaliser", this fixes the accented characters, but may be wrong for your country!
-	exportTTI(pageLegaliser(teletextPage))
-	
-	# Use the cleaned title for headlines too
-	headlines.append({"title":clean_title,"number":str(pageNum + startPage)})
-	
-	# Iterate the page counter
-	pageNum += 1
-	
-	# Stop when we have enough pages
-	if pageNum > maxPages:
-		break
-
-# Next we create P111, the headlines
-# Start by loading the template
-newsIndexTemplate = loadTTI("tuoreimmat_index.tti")
-
-# Create a page
-teletextPage = {"number":111,"subpages":[{"packets":copy.deepcopy(newsIndexTemplate["subpages"][0]["packets"])}]}
-
-# Vervang DAY/DATE placeholders met echte Finse datum
-teletextPage = vervang_datum_in_tti(teletextPage)
-
-line = 5
-
-for headline in headlines:
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) > 22:
-		break
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add this paragraph to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-
-exportTTI(pageLegaliser(teletextPage))
-
-# Load the template page for the header & footer
-newsPageTemplate = loadTTI("sportgeneral_page.tti")
-
-# How many news pages do we want to create?
-maxPages = 4
-startPage = 302
-
-# Download and parse an RSS Feed of news from Yle
-newsData = feedparser.parse("https://yle.fi/rss/urheilu")
-
-# Initialise a Page Counter
-pageNum = 0
-
-# Create a headlines list for P101
-headlines = []
-
-# Loop through each news story to produce pages
-for newsArticle in newsData['entries']:
-	# Set the first line we write on
-	line = 5
-	
-	# Create a new teletext page
-	teletextPage = {"number":(pageNum + startPage),"subpages":[{"packets":copy.deepcopy(newsPageTemplate["subpages"][0]["packets"])}]}
-	
-	# Vervang DAY/DATE placeholders in de template
-	teletextPage = vervang_datum_in_tti(teletextPage)
-	
-	# Get the title from Yle RSS
-	clean_title = newsArticle["title"].strip()
-	
-	# Create the title
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":clean_title}]}]},
-		line = line
-	)
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add the title to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Yle gebruikt 'description' voor de samenvatting
-	if "description" in newsArticle:
-		article_text = newsArticle["description"]
-	else:
-		article_text = newsArticle["title"]  # fallback
-
-	# fix: verwijder soft hyphen (U+00AD)
-	article_text = article_text.replace("\u00AD", "")
-    
-	# Voor Yle is description plain text, maar we gebruiken BeautifulSoup voor de zekerheid
-	soup = BeautifulSoup(article_text, "lxml")
-	
-	# Maak één paragraaf van de beschrijving
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":soup.get_text()}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) <= 22:
-		# Move on the line pointer
-		line += (len(paraBlock) + 1)
-		
-		# Add this paragraph to the teletext page
-		teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Export the final page
-	# We run it through "legaliser", this fixes the accented characters, but may be wrong for your country!
-	exportTTI(pageLegaliser(teletextPage))
-	
-	# Use the cleaned title for headlines too
-	headlines.append({"title":clean_title,"number":str(pageNum + startPage)})
-	
-	# Iterate the page counter
-	pageNum += 1
-	
-	# Stop when we have enough pages
-	if pageNum > maxPages:
-		break
-
-# Next we create P111, the headlines
-# Start by loading the template
-newsIndexTemplate = loadTTI("sportgeneral_index.tti")
-
-# Create a page
-teletextPage = {"number":301,"subpages":[{"packets":copy.deepcopy(newsIndexTemplate["subpages"][0]["packets"])}]}
-
-# Vervang DAY/DATE placeholders met echte Finse datum
-teletextPage = vervang_datum_in_tti(teletextPage)
-
-line = 5
-
-for headline in headlines:
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) > 22:
-		break
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add this paragraph to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-
-exportTTI(pageLegaliser(teletextPage))
-
-# Load the template page for the header & footer
-newsPageTemplate = loadTTI("jalkapallo_page.tti")
-
-# How many news pages do we want to create?
-maxPages = 4
-startPage = 309
-
-# Download and parse an RSS Feed of news from Yle
-newsData = feedparser.parse("https://feeds.yle.fi/uutiset/v1/recent.rss?publisherIds=YLE_URHEILU&concepts=18-205598")
-
-# Initialise a Page Counter
-pageNum = 0
-
-# Create a headlines list for P101
-headlines = []
-
-# Loop through each news story to produce pages
-for newsArticle in newsData['entries']:
-	# Set the first line we write on
-	line = 5
-	
-	# Create a new teletext page
-	teletextPage = {"number":(pageNum + startPage),"subpages":[{"packets":copy.deepcopy(newsPageTemplate["subpages"][0]["packets"])}]}
-	
-	# Vervang DAY/DATE placeholders in de template
-	teletextPage = vervang_datum_in_tti(teletextPage)
-	
-	# Get the title from Yle RSS - CLEAN IT FOR JALKAPALLO!
-	clean_title = clean_text_aggressive(newsArticle["title"].strip())
-	
-	# Create the title
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":clean_title}]}]},
-		line = line
-	)
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add the title to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Yle gebruikt 'description' voor de samenvatting
-	if "description" in newsArticle:
-		article_text = newsArticle["description"]
-	else:
-		article_text = newsArticle["title"]  # fallback
-
-	# CLEAN THE TEXT AGGRESSIVELY FOR JALKAPALLO!
-	article_text = clean_text_aggressive(article_text)
-    
-	# Voor Yle is description plain text, maar we gebruiken BeautifulSoup voor de zekerheid
-	soup = BeautifulSoup(article_text, "lxml")
-	
-	# Maak één paragraaf van de beschrijving
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":soup.get_text()}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) <= 22:
-		# Move on the line pointer
-		line += (len(paraBlock) + 1)
-		
-		# Add this paragraph to the teletext page
-		teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Export the final page
-	# We run it through "legaliser", this fixes the accented characters, but may be wrong for your country!
-	exportTTI(pageLegaliser(teletextPage))
-	
-	# Use the cleaned title for headlines too
-	headlines.append({"title":clean_title,"number":str(pageNum + startPage)})
-	
-	# Iterate the page counter
-	pageNum += 1
-	
-	# Stop when we have enough pages
-	if pageNum > maxPages:
-		break
-
-# Next we create P308, the headlines
-# Start by loading the template
-newsIndexTemplate = loadTTI("jalkapallo_index.tti")
-
-# Create a page
-teletextPage = {"number":308,"subpages":[{"packets":copy.deepcopy(newsIndexTemplate["subpages"][0]["packets"])}]}
-
-# Vervang DAY/DATE placeholders met echte Finse datum
-teletextPage = vervang_datum_in_tti(teletextPage)
-
-line = 5
-
-for headline in headlines:
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) > 22:
-		break
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add this paragraph to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-
-exportTTI(pageLegaliser(teletextPage))
-
-# Load the template page for the header & footer
-newsPageTemplate = loadTTI("matkailu_page.tti")
-
-# How many news pages do we want to create?
-maxPages = 4
-startPage = 402
-
-# Download and parse an RSS Feed of news from Yle
-newsData = feedparser.parse("https://yle.fi/rss/t/18-206851/fi")
-
-# Initialise a Page Counter
-pageNum = 0
-
-# Create a headlines list for P101
-headlines = []
-
-# Loop through each news story to produce pages
-for newsArticle in newsData['entries']:
-	# Set the first line we write on
-	line = 5
-	
-	# Create a new teletext page
-	teletextPage = {"number":(pageNum + startPage),"subpages":[{"packets":copy.deepcopy(newsPageTemplate["subpages"][0]["packets"])}]}
-	
-	# Vervang DAY/DATE placeholders in de template
-	teletextPage = vervang_datum_in_tti(teletextPage)
-	
-	# Get the title from Yle RSS
-	clean_title = newsArticle["title"].strip()
-	
-	# Create the title
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":clean_title}]}]},
-		line = line
-	)
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add the title to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Yle gebruikt 'description' voor de samenvatting
-	if "description" in newsArticle:
-		article_text = newsArticle["description"]
-	else:
-		article_text = newsArticle["title"]  # fallback
-
-	# fix: verwijder soft hyphen (U+00AD)
-	article_text = article_text.replace("\u00AD", "")
-    
-	# Voor Yle is description plain text, maar we gebruiken BeautifulSoup voor de zekerheid
-	soup = BeautifulSoup(article_text, "lxml")
-	
-	# Maak één paragraaf van de beschrijving
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":soup.get_text()}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) <= 22:
-		# Move on the line pointer
-		line += (len(paraBlock) + 1)
-		
-		# Add this paragraph to the teletext page
-		teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Export the final page
-	# We run it through "legaliser", this fixes the accented characters, but may be wrong for your country!
-	exportTTI(pageLegaliser(teletextPage))
-	
-	# Use the cleaned title for headlines too
-	headlines.append({"title":clean_title,"number":str(pageNum + startPage)})
-	
-	# Iterate the page counter
-	pageNum += 1
-	
-	# Stop when we have enough pages
-	if pageNum > maxPages:
-		break
-
-# Next we create P111, the headlines
-# Start by loading the template
-newsIndexTemplate = loadTTI("matkailu_index.tti")
-
-# Create a page
-teletextPage = {"number":401,"subpages":[{"packets":copy.deepcopy(newsIndexTemplate["subpages"][0]["packets"])}]}
-
-# Vervang DAY/DATE placeholders met echte Finse datum
-teletextPage = vervang_datum_in_tti(teletextPage)
-
-line = 5
-
-for headline in headlines:
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) > 22:
-		break
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add this paragraph to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-
-exportTTI(pageLegaliser(teletextPage))
-
-# Load the template page for the header & footer
-newsPageTemplate = loadTTI("politics_page.tti")
-
-# How many news pages do we want to create?
-maxPages = 10
-startPage = 124
-
-# Download and parse an RSS Feed of news from Yle
-newsData = feedparser.parse("https://yle.fi/rss/t/18-220306/fi")
-
-# Initialise a Page Counter
-pageNum = 0
-
-# Create a headlines list for P123
-headlines = []
-
-# Loop through each news story to produce pages
-for newsArticle in newsData['entries']:
-	# Set the first line we write on
-	line = 5
-	
-	# Create a new teletext page
-	teletextPage = {"number":(pageNum + startPage),"subpages":[{"packets":copy.deepcopy(newsPageTemplate["subpages"][0]["packets"])}]}
-	
-	# Vervang DAY/DATE placeholders in de template
-	teletextPage = vervang_datum_in_tti(teletextPage)
-	
-	# Get the title from Yle RSS
-	clean_title = newsArticle["title"].strip()
-	
-	# Create the title
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":clean_title}]}]},
-		line = line
-	)
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add the title to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Yle gebruikt 'description' voor de samenvatting
-	if "description" in newsArticle:
-		article_text = newsArticle["description"]
-	else:
-		article_text = newsArticle["title"]  # fallback
-
-	# fix: verwijder soft hyphen (U+00AD)
-	article_text = article_text.replace("\u00AD", "")
-    
-	# Voor Yle is description plain text, maar we gebruiken BeautifulSoup voor de zekerheid
-	soup = BeautifulSoup(article_text, "lxml")
-	
-	# Maak één paragraaf van de beschrijving
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":soup.get_text()}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) <= 22:
-		# Move on the line pointer
-		line += (len(paraBlock) + 1)
-		
-		# Add this paragraph to the teletext page
-		teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Export the final page
-	# We run it through "legaliser", this fixes the accented characters, but may be wrong for your country!
-	exportTTI(pageLegaliser(teletextPage))
-	
-	# Use the cleaned title for headlines too
-	headlines.append({"title":clean_title,"number":str(pageNum + startPage)})
-	
-	# Iterate the page counter
-	pageNum += 1
-	
-	# Stop when we have enough pages
-	if pageNum > maxPages:
-		break
-
-# Next we create P101, the headlines
-# Start by loading the template
-newsIndexTemplate = loadTTI("politics_index.tti")
-
-# Create a page
-teletextPage = {"number":123,"subpages":[{"packets":copy.deepcopy(newsIndexTemplate["subpages"][0]["packets"])}]}
-
-# Vervang DAY/DATE placeholders met echte Finse datum
-teletextPage = vervang_datum_in_tti(teletextPage)
-
-line = 5
-
-for headline in headlines:
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) > 22:
-		break
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add this paragraph to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-
-exportTTI(pageLegaliser(teletextPage))
-
-# Load the template page for the header & footer
-newsPageTemplate = loadTTI("talous_page.tti")
-
-# How many news pages do we want to create?
-maxPages = 3
-startPage = 202
-
-# Download and parse an RSS Feed of news from Yle
-newsData = feedparser.parse("https://yle.fi/rss/t/18-204933/fi")
-
-# Initialise a Page Counter
-pageNum = 0
-
-# Create a headlines list for P123
-headlines = []
-
-# Loop through each news story to produce pages
-for newsArticle in newsData['entries']:
-	# Set the first line we write on
-	line = 5
-	
-	# Create a new teletext page
-	teletextPage = {"number":(pageNum + startPage),"subpages":[{"packets":copy.deepcopy(newsPageTemplate["subpages"][0]["packets"])}]}
-	
-	# Vervang DAY/DATE placeholders in de template
-	teletextPage = vervang_datum_in_tti(teletextPage)
-	
-	# Get the title from Yle RSS
-	clean_title = newsArticle["title"].strip()
-	
-	# Create the title
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"yellow","text":clean_title}]}]},
-		line = line
-	)
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add the title to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Yle gebruikt 'description' voor de samenvatting
-	if "description" in newsArticle:
-		article_text = newsArticle["description"]
-	else:
-		article_text = newsArticle["title"]  # fallback
-
-	# fix: verwijder soft hyphen (U+00AD)
-	article_text = article_text.replace("\u00AD", "")
-    
-	# Voor Yle is description plain text, maar we gebruiken BeautifulSoup voor de zekerheid
-	soup = BeautifulSoup(article_text, "lxml")
-	
-	# Maak één paragraaf van de beschrijving
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":soup.get_text()}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) <= 22:
-		# Move on the line pointer
-		line += (len(paraBlock) + 1)
-		
-		# Add this paragraph to the teletext page
-		teletextPage["subpages"][0]["packets"] += paraBlock
-	
-	# Export the final page
-	# We run it through "legaliser", this fixes the accented characters, but may be wrong for your country!
-	exportTTI(pageLegaliser(teletextPage))
-	
-	# Use the cleaned title for headlines too
-	headlines.append({"title":clean_title,"number":str(pageNum + startPage)})
-	
-	# Iterate the page counter
-	pageNum += 1
-	
-	# Stop when we have enough pages
-	if pageNum > maxPages:
-		break
-
-# Next we create P101, the headlines
-# Start by loading the template
-newsIndexTemplate = loadTTI("talous_index.tti")
-
-# Create a page
-teletextPage = {"number":201,"subpages":[{"packets":copy.deepcopy(newsIndexTemplate["subpages"][0]["packets"])}]}
-
-# Vervang DAY/DATE placeholders met echte Finse datum
-teletextPage = vervang_datum_in_tti(teletextPage)
-
-line = 5
-
-for headline in headlines:
-	paraBlock = toTeletextBlock(
-		input = {"content":[{"align":"left","content":[{"colour":"white","text":headline["title"]}]},{"align":"right","content":[{"colour":"yellow","text":headline["number"]}]}]},
-		line = line
-	)
-	
-	# Is this going to make the page too long?
-	if (len(paraBlock) + line) > 22:
-		break
-	
-	# Move on the line pointer
-	line += (len(paraBlock) + 1)
-	
-	# Add this paragraph to the teletext page
-	teletextPage["subpages"][0]["packets"] += paraBlock
-
-exportTTI(pageLegaliser(teletextPage))
+# Every news category: its feed, its templates and its pages. Each one gets up to maxPages + 1 story pages
+# from startPage on, and an index of their headlines on indexPage.
+newsCategories = [
+	{"name":"paauutiset", "feed":"https://yle.fi/rss/uutiset/paauutiset", "pageTemplate":"paauutiset_page.tti", "indexTemplate":"paauutiset_index.tti", "startPage":102, "maxPages":10, "indexPage":101},
+	{"name":"tuoreimmat", "feed":"https://yle.fi/rss/uutiset/tuoreimmat", "pageTemplate":"tuoreimmat_page.tti", "indexTemplate":"tuoreimmat_index.tti", "startPage":112, "maxPages":10, "indexPage":111},
+	{"name":"urheilu", "feed":"https://yle.fi/rss/urheilu", "pageTemplate":"sportgeneral_page.tti", "indexTemplate":"sportgeneral_index.tti", "startPage":302, "maxPages":4, "indexPage":301},
+	{"name":"jalkapallo", "feed":"https://feeds.yle.fi/uutiset/v1/recent.rss?publisherIds=YLE_URHEILU&concepts=18-205598", "pageTemplate":"jalkapallo_page.tti", "indexTemplate":"jalkapallo_index.tti", "startPage":309, "maxPages":4, "indexPage":308, "clean":clean_text_aggressive},
+	{"name":"matkailu", "feed":"https://yle.fi/rss/t/18-206851/fi", "pageTemplate":"matkailu_page.tti", "indexTemplate":"matkailu_index.tti", "startPage":402, "maxPages":4, "indexPage":401},
+	{"name":"politics", "feed":"https://yle.fi/rss/t/18-220306/fi", "pageTemplate":"politics_page.tti", "indexTemplate":"politics_index.tti", "startPage":124, "maxPages":10, "indexPage":123},
+	{"name":"talous", "feed":"https://yle.fi/rss/t/18-204933/fi", "pageTemplate":"talous_page.tti", "indexTemplate":"talous_index.tti", "startPage":202, "maxPages":3, "indexPage":201}
+]
+
+# How many categories to build at once. 1 builds them one after the other.
+categoryWorkers = 1
+
+# Download and parse every RSS feed we need at once, rather than waiting for each in turn.
+# newsreel and newsflash read the same feeds later, and get these copies rather than downloading them again.
+fetchReport = prefetchFeeds([category["feed"] for category in newsCategories])
+print(fetchReport)
+
+# Make the story pages and index of every category. Stories that haven't changed since the last run,
+# on the same page as last time, are left as they are, and so are indexes whose headlines haven't changed.
+renderState = RenderState("teletext/.render.json")
+categoryReport = runCategories(newsCategories, workers=categoryWorkers, prepare=vervang_datum_in_tti, state=renderState)
+print(categoryReport)
 
 # Reset headlines naar paauutiset voor P100
-newsData = feedparser.parse("https://yle.fi/rss/uutiset/paauutiset")
+newsData = getFeed("https://yle.fi/rss/uutiset/paauutiset")
 headlines = []
 
 pageNum = 0
@@ -880,7 +122,7 @@ for newsArticle in newsData['entries']:
         break
 
 # Finally, let's make P100, the main service index.
-frontPageTemplate = loadTTI("front_page.tti")
+frontPageTemplate = loadTemplate("front_page.tti")
 
 # Create a page
 teletextPage = {"number":100,"control":{"cycleTime":"5,T"},"subpages":[]}
@@ -895,7 +137,7 @@ for headline in headlines:
 		line = 18
 	)
 	
-	newSubpage = {"packets":copy.deepcopy(frontPageTemplate["subpages"][0]["packets"]) + paraBlock}
+	newSubpage = {"packets":clonePackets(frontPageTemplate["subpages"][0]["packets"]) + paraBlock}
 	
 	teletextPage["subpages"].append(newSubpage)
 
@@ -909,3 +151,19 @@ radio_scraper = radio.YleRadioScraper()
 radio_data = radio_scraper.scrape_radio_guide()
 radio_scraper.create_all_teletext_pages(radio_data)
 run_newsflash()
+
+cacheInfo = legaliserCacheInfo()
+print("Legaliser row cache: " + str(cacheInfo.hits) + " hits, " + str(cacheInfo.misses) + " misses")
+
+blockInfo, wrapInfo = layoutCacheInfo()
+print("Text layout cache: " + str(blockInfo.hits) + " hits, " + str(blockInfo.misses) + " misses")
+
+feedInfo = feedCacheInfo()
+print("Feeds: " + str(feedInfo.misses) + " downloaded, " + str(feedInfo.hits) + " reused")
+
+httpInfo = httpCacheInfo()
+if httpInfo is not None and httpInfo.requests > 0:
+	print("Feed HTTP cache: " + str(httpInfo.notModified) + " of " + str(httpInfo.requests) + " not modified (" + str(round(100 * httpInfo.notModified / httpInfo.requests)) + "%), " + str(httpInfo.received) + " bytes downloaded, " + str(httpInfo.saved) + " bytes saved")
+
+# Write out the hashes of everything we exported, so the next run can leave unchanged pages alone
+defaultSink.close()
@@ -0,0 +1,146 @@
+# Row-level page differ for CIMS
+# Every row of every subpage gets a short hash. Comparing two pages is then just comparing hashes row by row,
+# and what comes back is the set of (subpage, row) cells that changed rather than a yes or no.
+#
+# Rows 0-25 are the text rows, 26 is all of a subpage's enhancement packets together and 27 is its fastext links.
+# Page control (erase, cycle time, etc) isn't part of the diff, just as it never was for comparison().
+# A page dict can have more than one packet for a row; they're all part of that row's hash, in order, so two
+# pages that only differ in a duplicate still come out different, as they always did for comparison().
+#
+# A RowIndex keeps the hashes of the last version of every page it has seen, and can be saved to and loaded from
+# a JSON file, so the row-level changes can be worked out from one run to the next. DirectorySink keeps one for
+# the pages it writes, and exportTTI puts the rows that changed in its report.
+
+import hashlib, json
+
+from pagemodel import Page
+from sinks import writeAtomically
+
+# Stable from one run to the next, unlike hash()
+def rowHash(text):
+	return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+# The hashes of one page: a list with a {row: hash} dict for each subpage.
+# Takes a Page or a page dict (minified or not).
+def hashRows(page):
+	if not isinstance(page, Page):
+		return [packetHashes(packets) for packets in subpagePackets(page)]
+
+	hashes = []
+
+	for subpage in page.subpages:
+		rows = {row.number:rowHash(row.text) for row in subpage}
+
+		if subpage.enhancements:
+			rows[26] = rowHash("\n".join(subpage.enhancements))
+		if subpage.links is not None:
+			rows[27] = rowHash(",".join(subpage.links))
+
+		hashes.append(rows)
+
+	return hashes
+
+# Each subpage's packets, with the page's global packets inherited the same way teletextDeMinify does it,
+# but without changing the page
+def subpagePackets(page):
+	globalPackets = page.get("packets", [])
+
+	for subpage in page.get("subpages") or [{"packets":[]}]:
+		packets = subpage.get("packets", [])
+
+		if globalPackets and subpage.get("inherit", True):
+			present = set(packet["number"] for packet in packets)
+			packets = list(packets)
+
+			for packet in globalPackets:
+				if packet["number"] not in present:
+					packets.append(packet)
+					present.add(packet["number"])
+
+		yield packets
+
+# Hashes for a packet list. A row with one packet hashes just like the same row in a Page would.
+def packetHashes(packets):
+	rows = {}
+
+	for packet in packets:
+		if "linking" in packet:
+			text = ",".join(packet["linking"].get("pages", []))
+		else:
+			text = packet.get("text", "")
+
+		rows.setdefault(packet["number"], []).append(text)
+
+	return {number:rowHash("\n".join(texts)) for number, texts in rows.items()}
+
+# The (subpage, row) cells that differ between two sets of hashes. A subpage only one side has counts as all changed,
+# and as row 0 at least even if it has no rows at all.
+def diffHashes(old, new):
+	changed = set()
+
+	for subpage in range(max(len(old), len(new))):
+		if subpage >= len(old) or subpage >= len(new):
+			# Even an empty subpage changes the page, so there's always at least its header
+			changed.add((subpage, 0))
+			changed.update((subpage, row) for row in (old[subpage] if subpage < len(old) else new[subpage]))
+			continue
+
+		oldRows = old[subpage]
+		newRows = new[subpage]
+
+		for row, rowHash in newRows.items():
+			if oldRows.get(row) != rowHash:
+				changed.add((subpage, row))
+
+		for row in oldRows:
+			if row not in newRows:
+				changed.add((subpage, row))	# The row's gone
+
+	return changed
+
+def diffPages(pageA, pageB):
+	return diffHashes(hashRows(pageA), hashRows(pageB))
+
+# Hashes of the last version of each page, by page number
+class RowIndex:
+	def __init__(self, filename=None):
+		self.filename = filename
+		self.pages = {}
+
+		if filename is not None:
+			self.load()
+
+	def load(self):
+		try:
+			with open(self.filename, encoding='utf-8') as f:
+				stored = json.load(f)
+		except (OSError, ValueError):
+			stored = {}	# No index yet, so everything is new
+
+		# JSON keys are always strings, but rows are numbers
+		self.pages = {number:[{int(row):rowHash for row, rowHash in rows.items()} for rows in subpages] for number, subpages in stored.items()}
+
+	def save(self, filename=None):
+		writeAtomically(filename or self.filename, json.dumps(self.pages, sort_keys=True).encode('utf-8'))
+
+	# What's changed in this page since we last saw it, without remembering this version
+	def changes(self, page, number=None):
+		number = self.pageNumber(page, number)
+		return diffHashes(self.pages.get(number, []), hashRows(page))
+
+	# What's changed in this page since we last saw it. This version is the one we compare against next time.
+	def update(self, page, number=None):
+		number = self.pageNumber(page, number)
+		hashes = hashRows(page)
+		changed = diffHashes(self.pages.get(number, []), hashes)
+		self.pages[number] = hashes
+		return changed
+
+	def forget(self, number):
+		self.pages.pop(str(number), None)
+
+	def pageNumber(self, page, number):
+		if number is None:
+			number = page.number if isinstance(page, Page) else page["number"]
+
+		return str(number)
@@ -0,0 +1,318 @@
+# Feed fetching for CIMS
+# Downloading an RSS feed is mostly waiting for Yle to answer, so instead of fetching each category's feed just
+# before building its pages, we fetch all of them up front, several at once, and the page builders read the
+# parsed results from there. No more than perHost connections are open to any one server at a time.
+#
+#	feeds, report = fetchFeeds(["https://yle.fi/rss/uutiset/paauutiset", ...])
+#	newsData = feeds["https://yle.fi/rss/uutiset/paauutiset"]
+#	print(report)
+#
+# A FeedRepository remembers what it's fetched, so everything in a run that reads the same feed (demo, newsreel,
+# newsflash) shares one download and one parse of it. getFeed() and prefetchFeeds() use the one for this process.
+#
+# From one run to the next, a FeedCache keeps each feed's ETag and Last-Modified along with the parts of the parsed
+# feed the page builders use. Yle is asked for the feed only if it's changed since then; if it hasn't
+# (304 Not Modified), we use what we kept, without downloading or parsing anything.
+
+import collections, concurrent.futures, contextlib, gzip, hashlib, json, logging, os, threading, time, urllib.error, urllib.parse, urllib.request
+
+import feedparser
+
+from sinks import writeAtomically
+
+workerCount = 8
+perHostLimit = 4
+timeout = 30
+userAgent = "CIMS teletext feed fetcher"
+
+FeedInfo = collections.namedtuple("FeedInfo", ["hits", "misses", "feeds"])
+FeedTiming = collections.namedtuple("FeedTiming", ["url", "seconds", "entries", "error", "notModified", "received", "saved"])
+# The only parts of a feed anyone reads, so the only parts a FeedCache keeps
+entryFields = ("title", "description", "link", "id", "content")
+
+HttpCacheInfo = collections.namedtuple("HttpCacheInfo", ["requests", "notModified", "received", "saved"])
+
+class FetchReport:
+	def __init__(self, timings, wall):
+		self.timings = timings	# A FeedTiming for each feed, in the order they were asked for
+		self.wall = wall	# How long the whole fetch took
+
+	# How long it would have taken one feed at a time
+	def serial(self):
+		return sum(timing.seconds for timing in self.timings)
+
+	def __str__(self):
+		serial = self.serial()
+		speedup = serial / self.wall if self.wall > 0 else 1.0
+
+		lines = ["Feeds: " + str(len(self.timings)) + " fetched in " + format(self.wall, ".2f") + "s (" + format(serial, ".2f") + "s one at a time, " + format(speedup, ".1f") + "x)"]
+
+		for timing in self.timings:
+			result = str(timing.entries) + " entries" if timing.error is None else "failed: " + str(timing.error)
+			lines.append("  " + format(timing.seconds, "6.2f") + "s  " + ("304 " if timing.notModified else "    ") + result.ljust(12) + "  " + timing.url)
+
+		notModified = sum(1 for timing in self.timings if timing.notModified)
+		if notModified:
+			lines.append("  " + str(notModified) + " not modified, " + kilobytes(sum(timing.received for timing in self.timings)) + " downloaded, " + kilobytes(sum(timing.saved for timing in self.timings)) + " saved")
+
+		return "\n".join(lines)
+
+def kilobytes(size):
+	return format(size / 1024, ".1f") + " KB"
+
+# A parsed feed cut down to the feed's title and entryFields of each entry, as plain JSON
+def feedSummary(parsed):
+	summary = {"entries":[{field:entry[field] for field in entryFields if field in entry} for entry in parsed.get("entries", [])]}
+
+	if "title" in parsed.get("feed", {}):
+		summary["title"] = parsed["feed"]["title"]
+
+	return summary
+
+# And back into something that looks like what feedparser gave us in the first place
+def summaryFeed(summary):
+	entries = []
+
+	for stored in summary["entries"]:
+		entry = feedparser.FeedParserDict(stored)
+		if "content" in entry:
+			entry["content"] = [feedparser.FeedParserDict(content) for content in entry["content"]]
+		entries.append(entry)
+
+	feed = feedparser.FeedParserDict()
+	if "title" in summary:
+		feed["title"] = summary["title"]
+
+	return feedparser.FeedParserDict(entries=entries, feed=feed, bozo=0)
+
+# The ETag, Last-Modified and a feedSummary of every feed we've fetched, kept in a directory between runs:
+# index.json has the headers and sizes, and each feed's summary is in a JSON file of its own
+class FeedCache:
+	def __init__(self, directory=".feedcache"):
+		self.directory = directory
+		self.indexFile = os.path.join(directory, "index.json")
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.notModified = 0
+		self.received = 0	# Bytes we actually downloaded
+		self.saved = 0	# Bytes we would have downloaded, but didn't have to
+
+		try:
+			with open(self.indexFile, encoding='utf-8') as f:
+				self.index = json.load(f)
+		except (OSError, ValueError):
+			self.index = {}
+
+	def summaryFile(self, url):
+		return os.path.join(self.directory, hashlib.blake2b(url.encode('utf-8'), digest_size=12).hexdigest() + ".json")
+
+	def load(self, url):
+		try:
+			with open(self.summaryFile(url), encoding='utf-8') as f:
+				return summaryFeed(json.load(f))
+		except (OSError, ValueError, KeyError, TypeError) as error:
+			logging.warning("FeedCache: can't read the cached copy of " + url + ", fetching it in full: " + str(error))
+			return None
+
+	def store(self, url, parsed, headers, size):
+		try:
+			data = json.dumps(feedSummary(parsed), ensure_ascii=False).encode('utf-8')
+		except (TypeError, ValueError) as error:
+			logging.warning("FeedCache: can't keep " + url + ": " + str(error))
+			return
+
+		etag = headers.get("ETag")
+		modified = headers.get("Last-Modified")
+
+		with self.lock:
+			if etag is None and modified is None:
+				self.index.pop(url, None)	# Nothing to ask the server with next time, so don't bother keeping it
+				return
+
+			os.makedirs(self.directory, exist_ok=True)
+			writeAtomically(self.summaryFile(url), data)
+			self.index[url] = {"etag":etag, "modified":modified, "size":size}
+			writeAtomically(self.indexFile, json.dumps(self.index, sort_keys=True).encode('utf-8'))
+
+	# Fetch a feed, asking the server only for a new version. Returns (parsed, notModified, received, saved).
+	def fetch(self, url):
+		with self.lock:
+			entry = self.index.get(url)
+
+		cached = None if entry is None else self.load(url)
+		headers = {"User-Agent":userAgent, "Accept-Encoding":"gzip"}
+
+		if cached is not None:
+			if entry["etag"] is not None:
+				headers["If-None-Match"] = entry["etag"]
+			if entry["modified"] is not None:
+				headers["If-Modified-Since"] = entry["modified"]
+
+		try:
+			with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+				body = response.read()
+				responseHeaders = response.headers
+		except urllib.error.HTTPError as error:
+			if error.code != 304 or cached is None:
+				raise
+
+			with self.lock:
+				self.requests += 1
+				self.notModified += 1
+				self.saved += entry["size"]
+
+			return cached, True, 0, entry["size"]
+
+		size = len(body)
+
+		if responseHeaders.get("Content-Encoding") == "gzip":
+			body = gzip.decompress(body)
+
+		parsed = feedparser.parse(body, response_headers={name.lower():value for name, value in responseHeaders.items()})
+		self.store(url, parsed, responseHeaders, size)
+
+		with self.lock:
+			self.requests += 1
+			self.received += size
+
+		return parsed, False, size, 0
+
+	def info(self):
+		return HttpCacheInfo(self.requests, self.notModified, self.received, self.saved)
+
+# What feedparser gives back when it can't get a feed, so a failed fetch looks the same however it failed
+def emptyFeed(error):
+	return feedparser.FeedParserDict(entries=[], feed=feedparser.FeedParserDict(), bozo=1, bozo_exception=error)
+
+# One feed, waiting for a free connection to its server first
+def fetchFeed(url, hostLimits, cache=None):
+	notModified, received, saved = False, 0, 0
+
+	with hostLimits[urllib.parse.urlsplit(url).netloc]:
+		start = time.perf_counter()
+
+		try:
+			if cache is None:
+				parsed = feedparser.parse(url)
+			else:
+				parsed, notModified, received, saved = cache.fetch(url)
+			error = None
+		except Exception as exception:	# feedparser catches most things itself, but not quite everything
+			parsed = emptyFeed(exception)
+			error = exception
+
+		seconds = time.perf_counter() - start
+
+	if error is None and parsed.get("bozo") and not parsed.get("entries"):
+		error = parsed.get("bozo_exception")
+
+	return parsed, FeedTiming(url, seconds, len(parsed.get("entries", [])), error, notModified, received, saved)
+
+# Fetch and parse every feed at once. Returns {url: parsed feed} and a FetchReport.
+# With a FeedCache, feeds that haven't changed since the last run aren't downloaded again.
+def fetchFeeds(urls, workers=workerCount, perHost=perHostLimit, cache=None):
+	urls = list(dict.fromkeys(urls))	# Each feed once, in order
+	hostLimits = collections.defaultdict(lambda: threading.BoundedSemaphore(perHost))
+
+	for url in urls:
+		hostLimits[urllib.parse.urlsplit(url).netloc]	# Make them all now, rather than racing to in the workers
+
+	start = time.perf_counter()
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as pool:
+		results = list(pool.map(lambda url: fetchFeed(url, hostLimits, cache), urls))
+
+	wall = time.perf_counter() - start
+
+	feeds = {url:parsed for url, (parsed, timing) in zip(urls, results)}
+	return feeds, FetchReport([timing for parsed, timing in results], wall)
+
+# Parsed feeds by URL. ttl is how many seconds a feed is good for in a process that keeps running;
+# None means for as long as the process lasts, which for a cron run is the whole run.
+class FeedRepository:
+	def __init__(self, ttl=None, workers=workerCount, perHost=perHostLimit, cache=None):
+		self.ttl = ttl
+		self.cache = cache	# A FeedCache, if feeds should only be downloaded when they've changed
+		self.workers = workers
+		self.perHost = perHost
+		self.feeds = {}	# url -> (parsed, when we fetched it)
+		self.lock = threading.Lock()
+		self.urlLocks = collections.defaultdict(threading.Lock)	# So two threads asking for the same feed only fetch it once
+		self.hits = 0
+		self.misses = 0
+
+	def fresh(self, url):
+		if url not in self.feeds:
+			return False
+
+		return self.ttl is None or time.monotonic() - self.feeds[url][1] < self.ttl
+
+	# Feeds that failed aren't kept, so whoever asks next gets another go at them
+	def store(self, feeds, report):
+		now = time.monotonic()
+
+		with self.lock:
+			for timing in report.timings:
+				if timing.error is None:
+					self.feeds[timing.url] = (feeds[timing.url], now)
+
+	# The parsed feed, fetching it if we haven't got it (or it's gone stale)
+	def get(self, url):
+		with self.lock:
+			urlLock = self.urlLocks[url]
+
+		with urlLock:
+			with self.lock:
+				if self.fresh(url):
+					self.hits += 1
+					return self.feeds[url][0]
+
+				self.misses += 1
+
+			feeds, report = fetchFeeds([url], 1, self.perHost, self.cache)
+			self.store(feeds, report)
+			return feeds[url]
+
+	# Fetch every feed in the list we don't already have, all at once. Returns the FetchReport for the ones it fetched.
+	# Holds the same per-URL locks get() does while it fetches, so a feed is never being fetched twice at once.
+	def prefetch(self, urls):
+		urls = list(dict.fromkeys(urls))
+
+		with self.lock:
+			locked = set(url for url in urls if not self.fresh(url))
+			urlLocks = [self.urlLocks[url] for url in sorted(locked)]	# Always in the same order, so two prefetches can't deadlock
+
+		with contextlib.ExitStack() as held:
+			for urlLock in urlLocks:
+				held.enter_context(urlLock)
+
+			with self.lock:
+				stale = [url for url in urls if url in locked and not self.fresh(url)]	# A get() may have fetched some while we waited
+				self.misses += len(stale)
+
+			feeds, report = fetchFeeds(stale, self.workers, self.perHost, self.cache)
+			self.store(feeds, report)
+
+		return report
+
+	def info(self):
+		return FeedInfo(self.hits, self.misses, len(self.feeds))
+
+	def clear(self):
+		with self.lock:
+			self.feeds.clear()
+
+repository = FeedRepository(cache=FeedCache())
+
+def getFeed(url):
+	return repository.get(url)
+
+def prefetchFeeds(urls):
+	return repository.prefetch(urls)
+
+def feedCacheInfo():
+	return repository.info()
+
+# None if the process-wide repository isn't using a FeedCache
+def httpCacheInfo():
+	return None if repository.cache is None else repository.cache.info()
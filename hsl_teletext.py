@@ -1,7 +1,6 @@
-import copy
 from hsl_route_scraper import HSLRouteScraper
-from textBlock import tableRow
-from page import exportTTI, loadTTI
+from textBlock import compile_table
+from page import exportTTI, loadTemplate, clonePackets
 from legaliser import pageLegaliser
 
 # API KEY
@@ -34,22 +33,31 @@ if not routes_data:
 # PAGINA 401 - ROUTES M1 en M2 (4 subpagina's - beide richtingen)
 # ============================================================
 
-template_401 = loadTTI("hsl_routes_page.tti")
+template_401 = loadTemplate("hsl_routes_page.tti")
 
-# Maak deep copy van packets met alle text en control codes
-import json
+# Elke subpagina krijgt een eigen kopie van de template packets
 
 teletextPage401 = {
     "number": 455,
     "control": {"cycleTime": "10,T"},
     "subpages": [
-        {"packets": json.loads(json.dumps(template_401["subpages"][0]["packets"]))},
-        {"packets": json.loads(json.dumps(template_401["subpages"][0]["packets"]))},
-        {"packets": json.loads(json.dumps(template_401["subpages"][0]["packets"]))},
-        {"packets": json.loads(json.dumps(template_401["subpages"][0]["packets"]))}
+        {"packets": clonePackets(template_401["subpages"][0]["packets"])},
+        {"packets": clonePackets(template_401["subpages"][0]["packets"])},
+        {"packets": clonePackets(template_401["subpages"][0]["packets"])},
+        {"packets": clonePackets(template_401["subpages"][0]["packets"])}
     ]
 }
 
+# Tabelformaten die voor elke subpagina hetzelfde zijn, één keer gecompileerd
+header_table = compile_table([{"width": 38, "data": "title", "colour": "white"}])
+time_header_table = compile_table(
+    [
+        {"width": 19, "data": "empty", "colour": "white"},
+        {"width": 9, "data": "label1", "colour": "yellow", "align": "right"},
+        {"width": 9, "data": "label2", "colour": "yellow", "align": "right"},
+    ]
+)
+
 # Helper functie om subpagina te vullen
 def fill_subpage(subpage_idx, route_name, pattern, route_color):
     stops = pattern.get("stops", [])
@@ -67,26 +75,14 @@ def fill_subpage(subpage_idx, route_name, pattern, route_color):
     
     # Voeg route header toe
     header_dict = {"title": f"{route_name} {route_description}"}
-    header_row = tableRow(
-        [{"width": 38, "data": "title", "colour": "white"}],
-        header_dict
-    )
-    if header_row is not None:
-        teletextPage401["subpages"][subpage_idx]["packets"] += [{"number": line, "text": header_row}]
-        line += 1
+    header_row = header_table.render_row(header_dict)
+    teletextPage401["subpages"][subpage_idx]["packets"] += [{"number": line, "text": header_row}]
+    line += 1
     
     # Voeg tijdkolom headers toe
-    time_header_row = tableRow(
-        [
-            {"width": 19, "data": "empty", "colour": "white"},
-            {"width": 9, "data": "label1", "colour": "yellow", "align": "right"},
-            {"width": 9, "data": "label2", "colour": "yellow", "align": "right"},
-        ],
-        {"empty": "", "label1": "SAAPUVA", "label2": "SEURAAVA"}
-    )
-    if time_header_row is not None:
-        teletextPage401["subpages"][subpage_idx]["packets"] += [{"number": line, "text": time_header_row}]
-        line += 1
+    time_header_row = time_header_table.render_row({"empty": "", "label1": "SAAPUVA", "label2": "SEURAAVA"})
+    teletextPage401["subpages"][subpage_idx]["packets"] += [{"number": line, "text": time_header_row}]
+    line += 1
     
     # Verzamel alle stops met tijden
     stops_with_times = []
@@ -109,7 +105,15 @@ def fill_subpage(subpage_idx, route_name, pattern, route_color):
     
     stops_with_times.sort(key=lambda x: x["sort_key"])
     
-    # Voeg gesorteerde stops toe
+    # Voeg gesorteerde stops toe, allemaal in de kleur van de lijn
+    stop_table = compile_table(
+        [
+            {"width": 19, "data": "name", "colour": route_color, "align": "left"},
+            {"width": 9, "data": "time1", "colour": route_color, "align": "right"},
+            {"width": 9, "data": "time2", "colour": route_color, "align": "right"},
+        ]
+    )
+    
     for item in stops_with_times:
         stop = item["stop"]
         times = item["times"]
@@ -124,16 +128,11 @@ def fill_subpage(subpage_idx, route_name, pattern, route_color):
             "time2": time2
         }
         
-        row = tableRow(
-            [
-                {"width": 19, "data": "name", "colour": route_color, "align": "left"},
-                {"width": 9, "data": "time1", "colour": route_color, "align": "right"},
-                {"width": 9, "data": "time2", "colour": route_color, "align": "right"},
-            ],
-            rowDict
-        )
-        
-        if row is None:
+        try:
+            row = stop_table.render_row(rowDict)
+        except ValueError as error:
+            # Eén onvolledige halte mag niet de hele pagina kosten: rij overslaan
+            print(f"  ! Rij overgeslagen: {error}")
             continue
         
         tt_block = [{"number": line, "text": row}]
@@ -215,7 +214,7 @@ print("HSL Metro Routes Teletextpagina 401 gegenereerd (4 subpagina's).")
 # PAGINA 402 - DISRUPTIONS (met multi-line text support en subpagina's)
 # ============================================================
 
-template_402 = loadTTI("hsl_disruptions_page.tti")
+template_402 = loadTemplate("hsl_disruptions_page.tti")
 
 # Verzamel alle unieke disruptions (vermijd duplicaten)
 all_disruptions = []
@@ -353,9 +352,11 @@ if all_disruptions:
         "subpages": []
     }
     
+    disruption_tables = {}  # Eén gecompileerd tabelformaat per kleur
+    
     for subpage_disruptions in subpages_data:
         subpage = {
-            "packets": json.loads(json.dumps(template_402["subpages"][0]["packets"]))
+            "packets": clonePackets(template_402["subpages"][0]["packets"])
         }
         
         line = 6
@@ -363,15 +364,20 @@ if all_disruptions:
             lines = get_disruption_lines(disruption)
             
             for color, text in lines:
-                row = tableRow(
-                    [{"width": 40, "data": "text", "colour": color}],
-                    {"text": text}
-                )
-                if row is not None:
-                    subpage["packets"] += [{"number": line, "text": row}]
-                    line += 1
-                    if line > 22:
-                        break
+                if color not in disruption_tables:
+                    disruption_tables[color] = compile_table([{"width": 40, "data": "text", "colour": color}])
+                
+                try:
+                    row = disruption_tables[color].render_row({"text": text})
+                except ValueError as error:
+                    # Eén onvolledige melding mag niet de hele pagina kosten: rij overslaan
+                    print(f"  ! Rij overgeslagen: {error}")
+                    continue
+                
+                subpage["packets"] += [{"number": line, "text": row}]
+                line += 1
+                if line > 22:
+                    break
             
             # Lege regel tussen disruptions
             if line <= 22:
@@ -386,18 +392,13 @@ else:
     teletextPage402 = {
         "number": 456,
         "subpages": [{
-            "packets": json.loads(json.dumps(template_402["subpages"][0]["packets"]))
+            "packets": clonePackets(template_402["subpages"][0]["packets"])
         }]
     }
     
     no_disruption_text = "Ei aktiivisia hairioita"
-    row = tableRow(
-        [{"width": 40, "data": "message", "colour": "green"}],
-        {"message": no_disruption_text}
-    )
-    
-    if row is not None:
-        teletextPage402["subpages"][0]["packets"] += [{"number": 6, "text": row}]
+    row = compile_table([{"width": 40, "data": "message", "colour": "green"}]).render_row({"message": no_disruption_text})
+    teletextPage402["subpages"][0]["packets"] += [{"number": 6, "text": row}]
 
 exportTTI(pageLegaliser(teletextPage402))
 num_subpages_402 = len(teletextPage402["subpages"])
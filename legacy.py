@@ -0,0 +1,744 @@
+# Reference implementations for CIMS
+#
+# These are the original, unoptimised versions of functions that have since
+# been rewritten elsewhere. They are kept only so bench.py can check that the
+# new versions produce identical output and measure how much faster they are.
+# Nothing in the generator itself should import from here.
+
+import copy, hashlib, json, logging, re, time
+from datetime import datetime
+
+from page import access_bit, set_bit, teletextDeMinify, pageStatusWord, defaultSink
+from pagemodel import Page, Subpage
+from legaliser import enhancementmapping
+import legaliser, textBlock
+
+# Reads a .tti file into a standard teletext JSON object.
+# Note that this is not a "minified" object (no inheritance, etc)
+def loadTTI(filename):
+	regionMapping = {
+		0x23:"#",
+		0x24:"¤",
+		0x40:"É",
+		0x5b:"Ä",
+		0x5c:"Ö",
+		0x5d:"Å",
+		0x5e:"Ü",
+		0x5f:"_",
+		0x60:"é",
+		0x7b:"ä",
+		0x7c:"ö",
+		0x7d:"å",
+		0x7e:"ü"
+	}
+	
+	# Read in the file
+	tti = open(filename, "rb")
+	ttiContent = tti.readlines()
+	tti.close()
+	
+	# initialise variables for later
+	output = {"subpages":[]}
+	current = {"control":{"erasePage":False}}
+	newPage = True
+	subpageCounter = 0	# We only use this to check if the subcode makes sense
+	
+	for line in ttiContent:
+		line = line.decode('ascii','ignore').strip() # Remove any trailing whitespace
+		
+		try:
+			line.index(",")
+		except:
+			continue
+		
+		# If an "attribute" comes through after an OL or FL, we assume this is a new page
+		if line[:line.index(",")] in ["PN","SC","PS","CT"] and newPage:
+			if current:
+				if "packets" in current:
+					current["packets"] = sorted(current["packets"],key = lambda d: d['number'])
+					output["subpages"].append(current)	# If the current subpage isn't empty, write it to the output
+					subpageCounter += 1
+			
+			newPage = False	# Reset 
+			current = {"control":{"erasePage":False}}	# Create a fresh new subpage
+		
+		# Get the page number
+		if line[:line.index(",")] == "PN":
+			page_number = line[line.index(",") + 1:line.index(",") + 4]	# Find the "," and cut out the number bit
+			if "number" in output:	# What if we already have a number for this page?
+				if output["number"] != str(page_number):	# Is this the same as what we have?
+					print("More than one page in this tti " + str(filename))	# Oh no, a weird page has appeared
+					exit()	# This will be a return later
+			else:
+				output["number"] = str(page_number)	# Otherwise, this is our page number now
+		
+		# Get the page subcode
+		elif line[:line.index(",")] == "SC":
+			subcode = line[line.index(",") + 1:]
+			# Subcode should only be defined if it's not what we would logically expect
+			if (subpageCounter + 1) != int(subcode):
+				current["subcode"] = str(subcode)
+				#print(subpageCounter + 1)
+				#print(int(subcode))
+		
+		# Get the page options
+		elif line[:line.index(",")] == "PS":
+			raw_page_status = bytearray.fromhex(line[line.index(",") + 1:])
+			
+			# Language is composed from three bits. Pretty sure this isn't the right order, either...
+			language = (access_bit(raw_page_status,15) << 2) + (access_bit(raw_page_status,0) << 1) + access_bit(raw_page_status,1)
+			
+			if "control" not in current:
+				current["control"] = {"erasePage":False}
+				
+			if access_bit(raw_page_status,6) == 1:
+				current["control"]["erasePage"] = True
+			if access_bit(raw_page_status,8) == 1:
+				current["control"]["newsFlash"] = True
+			if access_bit(raw_page_status,9) == 1:
+				current["control"]["subtitle"] = True
+			if access_bit(raw_page_status,10) == 1:
+				current["control"]["suppressHeader"] = True
+			if access_bit(raw_page_status,11) == 1:
+				current["control"]["update"] = True
+			if access_bit(raw_page_status,13) == 1:
+				current["control"]["suppressPage"] = True
+			if access_bit(raw_page_status,12) == 1: # ?
+				current["control"]["interruptedSequence"] = True
+			
+			# Only output the language bit if it's not zero
+			if language != 0:
+				current["control"]["language"] = language
+		
+		# Page cycle time. We ignore this for the time being 
+		elif line[:line.index(",")] == "CT":
+			if "control" not in current:
+				current["control"] = {}
+			current["control"]["cycleTime"] = line[line.index(",") + 1:]
+		#	print("Cycle Time: " + line[line.index(",") + 1:])
+		
+		# Fasttext! A lot of the exciting stuff can be ignored here
+		# as it's not implemented in .tti
+		elif line[:line.index(",")] == "FL":
+			fasttext = line[line.index(",") + 1:].split(',')
+			
+			if "packets" in current:
+				current["packets"].append({"number":27, "dc":0, "linking":{"pages":fasttext}})
+			else:
+				current["packets"] = [{"number":27, "dc":0, "linking":{"pages":fasttext}}]
+		
+		# Output Lines (packets)
+		# For the moment we only care about packets 0-25 - no level 2.5 here :(
+		elif line[:line.index(",")] == "OL":
+			newPage = True
+			packet_number = int(line[line.index(",") + 1:line.index(",",3)])
+			packet_content = line[line.index(",",3) + 1:]
+			
+			if (packet_number < 26) and (packet_number != 0):
+				esc = False
+				unescapedPacket = ""
+				
+				graphics = False
+				
+				for position, character in enumerate(packet_content): # Un-escape the lines
+					
+					if esc:
+						esc = False
+						try:
+							unescapedPacket += chr(ord(character) - 0x40)	# Get the escaped character and subtract 0x40 to make it normal
+							
+							if ord(character) >= 0x51 and ord(character) <= 0x57:
+								graphics = True
+							elif ord(character) >= 0x40 and ord(character) <= 0x47:
+								graphics = False
+							
+						except:
+							print("loadTTI: error on page " + str(output["number"]) + " " + str(position) + " " + character)
+							continue
+						
+						continue	# Skip straight on to the next character
+					
+					if character == "":	# Tell us that the next character is escaped
+						esc = True
+					else:
+						if not graphics:
+							unescapedPacket += regionMapping.get(ord(character),character)
+						else:
+							unescapedPacket += character	# Pass other characters on through
+				
+				if "packets" in current:
+					current["packets"].append({"number":packet_number, "text":unescapedPacket})
+				else:
+					current["packets"] = [{"number":packet_number, "text":unescapedPacket}]
+		
+		# Meta isn't in the spec yet, officially
+		#elif line[:line.index(",")] == "DE":	# This isn't important, and has no bearing on the page
+		#	if "meta" in output:
+		#		output["meta"]["title"] = line[line.index(",") + 1:]
+		#	else:
+		#		output["meta"] = {"title":line[line.index(",") + 1:]}
+	
+	# Write out final subpage
+	if current:
+		if "packets" in current:
+			current["packets"]=sorted(current["packets"],key=lambda d: d['number'])
+			output["subpages"].append(current)	# If the current subpage isn't empty, write it to the output
+	
+	# This is a form of minification, which I've now decided will be taken care of elsewhere
+	#if len(output["subpages"]) == 1:	# If there's only one subpage
+	#	output = dict(**output, **output["subpages"][0])
+	#	del output["subpages"]
+	#	del output["subcode"]
+
+	return(output)
+
+#	How about an out-of-band flag, like a meta tag or something, to signal when this should be done!?
+def numberSubpage(page, row=20, offset=1, prefix=chr(7), align="right"):
+	if "subpages" not in page:
+		return page
+	
+	totalSubpages = len(page["subpages"])
+	
+	if totalSubpages < 2:
+		return page
+	
+	output = {"subpages":[]}
+	
+	# Now this is an Assumption. Assumptions are BAD, but I think we can get away with it here.
+	# For now, at least.
+	# We are going to number the subpages in the exact order they are presented, and ignore the specified subcode.
+	# Why? Well, almost no subpages will have a strict subcode defined - and those that do probably will be numbered by order anyway.
+	
+	for guessed_subcode, subpage in enumerate(page["subpages"]):
+		# Let's go ahead and generate the actual count now, since it will almost always be needed no matter what happens below.
+		counter = prefix + str((guessed_subcode + 1)) + "/" + str(totalSubpages)
+		counterLen = len(counter)
+		
+		if totalSubpages > 9 and offset > 0 and align == "right":
+			offset -= 1
+		
+		positionInList = next((i for i, packet in enumerate(subpage["packets"]) if packet["number"] == row), None)
+		
+		if positionInList is not None:
+			# This should be impossible:
+			if subpage["packets"][positionInList]["number"] != row:
+				print("desolate screaming noises")	# hence
+				return page
+			
+			# OK, we have a row. Now to figure out how to splice the bits together.
+			if align == "right":
+				# First, pad the string to 40 chars. There's nothing in the spec to say this will be done for us
+				# Cut the string to length and add the counter onto the end
+				# ToDo: if the offset is large enough, add the end of the string back on again?
+				subpage["packets"][positionInList]["text"] = subpage["packets"][positionInList]["text"].ljust(40)[:(40 - (counterLen + offset))] + counter
+			elif align == "left":
+				# Here the offset is added to the left as spaces.
+				# ToDo: again, we should just add the left part of the packet if there's too much offset
+				subpage["packets"][positionInList]["text"] = (" " * offset) + counter + subpage["packets"][positionInList]["text"].ljust(40)[((counterLen + offset)):]
+		
+		else:
+			if align == "right":
+				subpage["packets"].append({"number":row, "text":(" " * (40 - (counterLen + offset))) + counter})
+			elif align == "left":
+				subpage["packets"].append({"number":row, "text":(" " * offset) + counter})
+		
+		output["subpages"].append(subpage)
+		
+	
+	return page
+
+# Are these two pages the same?
+def comparison(pageA,pageB,debug=False):
+	pageA = teletextDeMinify(pageA)
+	pageB = teletextDeMinify(pageB)
+	
+	if len(pageA["subpages"]) != len(pageB["subpages"]):
+		return False
+	
+	for A, B in zip(pageA["subpages"],pageB["subpages"]):
+		A = sorted(A["packets"], key=lambda d: d['number'])
+		B = sorted(B["packets"], key=lambda d: d['number'])
+		
+		if A != B:
+			if debug:
+				print("Change detected!")
+				with open('debugA.json', 'w', encoding='utf-8') as f:
+					json.dump(A, f, ensure_ascii=False, indent=4)
+				with open('debugB.json', 'w', encoding='utf-8') as f:
+					json.dump(B, f, ensure_ascii=False, indent=4)
+			return False
+	
+	return True
+
+def blockOverlay(rawSource,overlay,startx,starty,endx,endy,align="centre"):
+	source = copy.deepcopy(rawSource)
+	
+	if startx > endx or starty > endy:
+		print("blockOverlay: Grid input fault")
+		return source
+	
+	for itNum,rowNum in enumerate(range(starty,endy+1)):
+		positionInSourceList = next((i for i, packet in enumerate(source) if packet["number"] == rowNum), None)
+		positionInOverlayList = next((i for i, packet in enumerate(overlay) if packet["number"] == itNum+1), None)
+		
+		if positionInSourceList == None:
+			source.append({"number":rowNum,"text":"                                        "})
+			positionInSourceList = next((i for i, packet in enumerate(source) if packet["number"] == rowNum), None)
+		
+		if positionInOverlayList == None:
+			overlay.append({"number":itNum+1,"text":"                                        "})
+			positionInOverlayList = next((i for i, packet in enumerate(overlay) if packet["number"] == itNum+1), None)
+		
+		source[positionInSourceList]["text"] = (source[positionInSourceList]["text"].ljust(40," ")[:startx] + overlay[positionInOverlayList]["text"].ljust(40," ")[:(endx-startx)] + source[positionInSourceList]["text"][endx:])
+	
+	return source
+
+# Export a standard teletext object (or a pagemodel.Page) to a .tti file, by way of a sink (see sinks.py) - teletext/ unless told otherwise.
+# Unless skipUnchanged is turned off, pages that haven't changed since the last export aren't written at all.
+# Only pages that really have changed get the update bit set. Returns True if the page was written.
+def exportTTI(page, skipUnchanged=True, sink=None):
+	if sink is None:
+		sink = defaultSink
+	
+	if isinstance(page, Page):
+		page_number = page.number
+		subpages = page.subpages
+		pageControl = page.control
+	else:
+		page_number = page["number"]
+		page = teletextDeMinify(page)
+		subpages = page["subpages"]
+		pageControl = page.get("control")
+	
+	output = []
+	statusLines = []	# Where the PS lines are, so we can set the update bit once we know if anything changed
+	headerLines = []	# Where the headers are, so the time doesn't count as a change
+	
+	if len(subpages) > 1:
+		subcodeOffset = 1
+	else:
+		subcodeOffset = 0
+	
+	for guessed_subcode, subpage in enumerate(subpages):
+		if isinstance(subpage, Subpage):
+			subcode = subpage.subcode
+			control = subpage.control
+			packets = subpage.entries()
+		else:
+			subcode = subpage.get("subcode")
+			control = subpage.get("control")
+			packets = ((packet["number"], packet.get("text"), packet.get("linking")) for packet in subpage["packets"])
+		
+		if subcode is None:
+			subcode = str(guessed_subcode + subcodeOffset).zfill(4)
+		
+		if int(subcode) > 99:
+			print("This page has more than 99 subpages. For our purposes, .tti doesn't support that")
+			return False;
+		
+		output.append("PN," + str(page_number) + subcode[2:])
+		output.append("SC," + str(subcode))
+		
+		if control is None:
+			control = pageControl
+		
+		page_status = pageStatusWord(control)
+		
+		if control is not None and "cycleTime" in control:
+			output.append("CT," + control["cycleTime"])
+		
+		statusLines.append((len(output), page_status))
+		output.append("PS," + hex(page_status)[2:])
+		
+		headerLines.append(len(output))
+		output.append("OL,0,        " + chr(27) + "ECIMS" + chr(27) + "B" + "" + chr(27) + "F" + str(page_number) + chr(27) + "A")
+		
+		for number, text, linking in packets:
+			if text is not None:
+				if number > 0 and number < 27:
+					escapedPacket = ""
+					if len(text) > 40:
+						print("P" + str(page_number) + " Packet longer than 40 bytes - " + text)
+					for character in text:
+						if ord(character) < 0x20:
+							escapedPacket = escapedPacket + chr(27) + chr(ord(character) + 0x40)
+						else:
+							escapedPacket = escapedPacket + character
+						
+						if ord(character) >=128:
+							print("Unsafe Character on P" + str(page_number) + " S" + str(subcode))
+						
+					output.append("OL," + str(number) + "," + escapedPacket)
+			
+			if linking is not None:
+				if number != 27:
+					print("Unexpected linking packet")
+					return False
+					
+				fasttext = "FL"
+				
+				if "pages" in linking:
+					for link in linking["pages"]:
+						#if link in navigationLinks:
+						#	link = navigationLinks[link]
+						
+						fasttext += "," + link
+					
+					output.append(fasttext)
+	
+	name = sink.pageName(page_number)
+	
+	# Everything but the time in the header goes into the hash
+	contentHash = hashlib.sha1("\n".join(output).encode('utf-8')).hexdigest()
+	changed = sink.lastHash(name) != contentHash
+	
+	if skipUnchanged and not changed:
+		return False
+	
+	if changed:
+		for position, page_status in statusLines:
+			output[position] = "PS," + hex(set_bit(page_status,3))[2:]	# Tell the decoder this page has been updated
+	
+	timestamp = str(int(time.time()))
+	for position in headerLines:
+		output[position] += timestamp
+	
+	output.append("")	# Every line ends in CRLF, including the last one
+	sink.write(name, "\r\n".join(output).encode('utf-8'), contentHash)
+	
+	return True
+
+def charsub(text):
+	if type(text) is not str:
+		print("legaliser tried to charsub something that's not text!")
+		return text
+	
+	text = re.sub("^\s+|\s+$|\s+(?=\s)","",text)	# Remove extraneous whitespace
+	
+	# do any substitutitons that will change the length of the text
+	#text = text.replace("­", "") # strip soft hyphens as wrapping text is hard enough already   -- Uh, no? Kinda necessary for our purposes
+	text = text.replace("…", "...")
+	text = text.replace("&lt;", "<")
+	text = text.replace("&gt;", ">")
+	text = text.replace("&amp;", "&")
+	text = text.replace(" ", " ") # Non-line-breaking space
+	text = text.replace("\r\n", " ")
+	text = text.replace("\r", " ")
+	text = text.replace("–", "-")
+
+	# digraphs and ligatures
+	text = text.replace("Ǳ", "DZ")
+	text = text.replace("ǲ", "Dz")
+	text = text.replace("ǳ", "dz")
+	text = text.replace("Ǆ", "DŽ")
+	text = text.replace("ǅ", "Dž")
+	text = text.replace("ǆ", "dž")
+	#text = text.replace("Ĳ", "IJ") # supported in Latin G2
+	#text = text.replace("ĳ", "ij") # supported in Latin G2
+	text = text.replace("Ǉ", "LJ")
+	text = text.replace("ǈ", "Lj")
+	text = text.replace("ǉ", "lj")
+	text = text.replace("Ǌ", "NJ")
+	text = text.replace("ǋ", "Nj")
+	text = text.replace("ǌ", "nj")
+	text = text.replace("ᵺ", "th")
+	text = text.replace("Ꜳ", "AA")
+	text = text.replace("ꜳ", "aa")
+	#text = text.replace("Æ", "AE") # supported in Latin G2
+	#text = text.replace("æ", "ae") # supported in Latin G2
+	text = text.replace("Ꜵ", "AO")
+	text = text.replace("ꜵ", "ao")
+	text = text.replace("Ꜷ", "AU")
+	text = text.replace("ꜷ", "au")
+	text = text.replace("Ꜹ", "AV")
+	text = text.replace("ꜹ", "av")
+	text = text.replace("Ꜻ", "AV")
+	text = text.replace("ꜻ", "av")
+	text = text.replace("Ꜽ", "AY")
+	text = text.replace("ꜽ", "ay")
+	text = text.replace("🙰", "et")
+	text = text.replace("ﬀ", "ff")
+	text = text.replace("ﬃ", "ffi")
+	text = text.replace("ﬄ", "ffl")
+	text = text.replace("ﬁ", "fi")
+	text = text.replace("ﬂ", "fl")
+	text = text.replace("Ƕ", "Hv")
+	text = text.replace("ƕ", "hv")
+	text = text.replace("℔", "lb")
+	text = text.replace("Ỻ", "lL")
+	text = text.replace("ỻ", "ll")
+	#text = text.replace("Œ", "OE") # supported in Latin G2
+	#text = text.replace("œ", "oe") # supported in Latin G2
+	text = text.replace("Ꝏ", "OO")
+	text = text.replace("ꝏ", "oo")
+	text = text.replace("ﬆ", "st")
+	text = text.replace("ﬅ", "ft")
+	text = text.replace("Ꜩ", "TZ")
+	text = text.replace("ꜩ", "tz")
+	text = text.replace("ᵫ", "ue")
+	text = text.replace("ꭣ", "uo")
+	text = text.replace("Ꝡ", "VY")
+	text = text.replace("ꝡ", "vy")
+
+	# map similar characters to one canonical unicode point
+	text = text.replace("€", "₠")
+	text = re.sub("[··᛫‧∙⋅⋅⸱⸳・ꞏ]","·",text,flags=re.UNICODE)
+	text = text.replace("•", "●")
+	text = text.replace("Ș", "Ş")
+	text = text.replace("ș", "ş")
+	text = text.replace("Å", "Å")
+	text = text.replace("„", "”")
+	text = text.replace("‟", "“")
+	text = text.replace("‘", "'")
+	text = text.replace("’", "'")
+	text = re.sub("[‒–—]","―",text,flags=re.UNICODE) # dashes to horizontal bar
+
+	# emoji stuff
+	text = re.sub("[😊☺]","🙂",text,flags=re.UNICODE) # like slightly smiling face
+	text = re.sub("[😁😃😄😆]","😀",text,flags=re.UNICODE) # like grinning face
+	text = text.replace("😝", "😛") # face with tongue
+	text = text.replace("🤣", "😂") # rofl -> face with tears of joy
+	text = text.replace("🤓", "😎") # nerd -> sunglasses
+	text = re.sub("[☹😦]","🙁",text,flags=re.UNICODE) # like slightly frowning face
+	text = re.sub("[😭😥]", "😢",text,flags=re.UNICODE) # like crying face
+	text = re.sub("[🤚👋🖐]","✋",text,flags=re.UNICODE) # like raised hand
+	text = re.sub("[♡♥🎔💓💖💗💘💙💚💛💜💝💟🖤🧡]","❤",text,flags=re.UNICODE) # like heavy black heart
+	text = re.sub("["u"\U0000FE00-\U0000FE0F]","",text,flags=re.UNICODE) # strip variation selectors
+
+	return text
+
+def pageLegaliser(inpage):
+	page = copy.deepcopy(inpage)
+	page = teletextDeMinify(page)
+	for subcode, subpage in enumerate(page["subpages"]):
+		enhancements = []
+		
+		subpage["packets"] = sorted(subpage["packets"], key=lambda d: d['number'])
+		
+		#print(subpage["packets"])
+		#print(sorted(subpage["packets"], key=lambda d: d['number']))
+		
+		#print("")
+		
+		for pNum,packet in enumerate(subpage["packets"]):
+			if "text" not in packet:
+				continue
+			
+			graphics = False
+			newLine = ""
+			
+			for position, character in enumerate(packet["text"]):
+				
+				if ord(character) >= 0x11 and ord(character) <= 0x17:
+					graphics = True
+				elif ord(character) >= 0x00 and ord(character) <= 0x07:
+					graphics = False
+				
+				if graphics == False:
+					safeChar = enhancementmapping.get(character, [ord(character),0,0])
+					if safeChar[0] > 127:
+						safeChar = [0x7f,0,0]
+					
+					if safeChar[1]:
+						enhancements.append([packet["number"]+40,4,0])
+						enhancements.append([position,safeChar[1],safeChar[2]])
+					
+					newLine += chr(safeChar[0])
+				else:
+					newLine += character
+			
+			newLine = newLine.rstrip()	# Remove trailing whitespace
+			
+			page["subpages"][subcode]["packets"][pNum]["text"] = newLine
+		
+		for enhancementPacket in write_enhancements(enhancements):
+			page["subpages"][subcode]["packets"].append({"number":26,"text":enhancementPacket})
+	
+	return page
+
+def write_enhancements(enhancements):
+	packets = []
+	for p in range(15): # up to 15 enhancement packets per subpage
+		packet = chr(0x40 + p) # first byte is designation code
+		for e in range(13): # up to 13 triplets per enhancement packet
+			if len(enhancements) > p*13+e:
+				# combine parts of enhancement data into an 18 byte triplet, then slice it up into three 6 byte values to write to the row with bit 6 set
+				triplet = enhancements[p*13+e][0] | ((enhancements[p*13+e][1]) << 6) | ((enhancements[p*13+e][2]) << 11)
+				packet+=chr(0x40+(triplet&0x3F))+chr(0x40+((triplet>>6)&0x3F))+chr(0x40+((triplet>>12)&0x3F))
+			elif e == 0:
+				# TODO: generate packet of terminators if previous packet is full.
+				return packets
+			else:
+				packet+=chr(0x7f)+chr(0x7f)+chr(0x7f)
+		packets.append(packet)
+	
+	return packets
+
+def textColour(input,maxWidth=20,cursor=0,indent=0,forceNewLine=False,variable={},defaultColour=" ",doubleHeight=False):
+	line = 0
+	output = [""]
+	
+	width = maxWidth	# We redefine this here in case we want to do nth line offsets later
+	
+	if forceNewLine:
+		line += 1	# Increment the line counter (ToDo: Double Height needs incremented twice)
+		cursor = 0	# Carriage return
+		output.append("")	# Create the next row
+		width = maxWidth-indent	# Reset the width
+	
+	for chunk in input:
+		colourChanged = True
+		
+		#### SUBSTITUTION SECTION ####
+		# Added 2023-07-14
+		
+		if "text" not in chunk and "variable" in chunk:
+			variable_part = variable
+			for path in chunk["variable"]:
+				try:
+					variable_part=variable_part[path]
+				except:
+					logging.debug("textColour: Could not find '" + str(path) + "' in listed variable")
+					
+					variable_part = ""
+					continue
+			
+			focusText = str(variable_part)
+		elif "text" not in chunk and "variable" not in chunk:
+			print("textColour: Major fault, no usable text in chunk")
+			return output
+		elif "text" in chunk:
+			focusText = str(chunk["text"])
+		
+		if "colour" in chunk:
+			colour = textBlock.colourCode(chunk["colour"])	# Set the colour code for this bit
+		else:
+			colour = defaultColour
+		
+		if "datetimeFormat" in chunk:
+			timestamp = float(focusText)
+			
+			if timestamp > 9999999999:
+				timestamp = timestamp/1000
+			
+			focusText = datetime.utcfromtimestamp(timestamp).strftime(chunk["datetimeFormat"])
+		
+		if "forceCaps" in chunk:
+			focusText = focusText.upper()
+		
+		focusText = legaliser.charsub(focusText) # Re-map characters
+		
+		if "pad" in chunk:
+			if chunk["pad"]["align"] == "right":
+				focusText = focusText.rjust(chunk["pad"]["width"],chunk["pad"]["fill"])
+			elif chunk["pad"]["align"] == "left":
+				focusText = focusText.ljust(chunk["pad"]["width"],chunk["pad"]["fill"])
+		
+		if "limit" in chunk:
+			focusText = focusText[:chunk["limit"]]
+		
+		if "lineOffset" in chunk:
+			line += chunk["lineOffset"]	# Increment the line counter (ToDo: Double Height needs incremented twice)
+			cursor = 0	# Carriage return
+			
+			for i in range(chunk["lineOffset"]):
+				output.append("")	# Create the next row
+			
+			colourChanged = True	# Reset the colour
+			width = maxWidth-indent	# Reset the width
+		
+		if "preferNewline" in chunk:
+			chunkElement = [focusText]
+		else:
+			chunkElement = re.split('(.+?(?:\s|\/|\-|$))', focusText)	# Split chunk into words, retaining the delimiter
+			# ToDo - make sure the delimiter stays with the word, rather than floating on it's own
+		
+		for word in chunkElement:
+			wordLen = len(word)	# How long is that word?
+			
+			if wordLen < 1:
+				continue
+			
+			if(wordLen+cursor) >= width+1:	# Is it gonna be too long for this line?
+				if wordLen > width:	# Wait, is it longer than the entire line?
+					print("textColour: Caught word \"" + word + "\" which is too long to fit in " + str(maxWidth) + " characters")	# "uncaught exception"
+					word = word[:width]
+					#exit()	# This shouldn't ever happen, but just in case - ToDo: Split up words that are too long to force them to fit
+				
+				if word == " ":
+					continue	# Don't put spaces at the start of new lines
+				
+				line += 1	# Increment the line counter (ToDo: Double Height needs incremented twice)
+				cursor = 0	# Carriage return
+				output.append("")	# Create the next row
+				colourChanged = True	# Reset the colour
+				width = maxWidth-indent	# Reset the width
+			
+			if colourChanged and "noSpacing" not in chunk:	# Add the colour code again if we need to
+				colourChanged = False
+				output[line] = output[line] + colour
+				
+				if doubleHeight == True:
+					cursor = cursor + 1	# Need to increment the cursor for colour codes
+				else:
+					cursor = cursor + 1	# Need to increment the cursor for colour codes
+			#else:
+			#	output[line] = output[line] + " "	# Otherwise pad with a space
+			
+			output[line] = output[line] + word	# Add the word to the line
+			cursor = cursor + wordLen	# And increment the cursor
+	
+	return(output)
+
+def tableRow(format, data):
+	output = ""
+	
+	for cell in format:
+		if "colour" in cell:
+			output += textBlock.colourCode(cell["colour"])
+		
+		if "align" in cell:
+			align = cell["align"]
+		else:
+			align = "left"
+		
+		if "width" not in cell:
+			print("tableRow: cell has no defined width")
+			return
+		
+		if "data" in cell:
+			if cell["data"] in data:
+				rawInput = data[cell["data"]]
+				
+				if "round" in cell:
+					rawInput = round(rawInput,cell["round"])
+				
+				if len(str(rawInput)) > cell["width"] and rawInput is int:
+					rawInput = round(rawInput)
+				
+				inputText = str(rawInput)
+			else:
+				print("tableRow: specified data absent")
+				return
+		elif "text" in cell:
+			inputText = cell["text"]
+		else:
+			print("tableRow: Cell has no data input or text specified")
+			return
+		
+		inputText = legaliser.charsub(inputText)
+		
+		if align == "right":
+			cellText = inputText[:cell["width"]].rjust(cell["width"])
+		elif align == "centre":
+			cellText = inputText[:cell["width"]].center(cell["width"])
+		else:
+			cellText = inputText[:cell["width"]].ljust(cell["width"])
+		
+		output += cellText
+	
+	if len(output) > 40:
+		print("tableRow: warning, output was longer than 40, truncated")
+		output = output[:40]
+	
+	return output
@@ -1,344 +1,363 @@
-from page import teletextDeMinify
-import copy, re
+from page import teletextDeMinify, clonePacket
+from pagemodel import Page
+from charsets import enhancementmapping, getProfile, pageProfile
+import functools, logging, re
 
-def charsub(text):
-	if type(text) is not str:
-		print("legaliser tried to charsub something that's not text!")
-		return text
-	
-	text = re.sub("^\s+|\s+$|\s+(?=\s)","",text)	# Remove extraneous whitespace
-	
+# charsub's substitutions, in the order they have always been made. Each one is (characters, replacement),
+# and every one of the characters gets the replacement. They're all folded into one translate table below.
+charsubRules = [
 	# do any substitutitons that will change the length of the text
-	#text = text.replace("­", "") # strip soft hyphens as wrapping text is hard enough already   -- Uh, no? Kinda necessary for our purposes
-	text = text.replace("…", "...")
-	text = text.replace("&lt;", "<")
-	text = text.replace("&gt;", ">")
-	text = text.replace("&amp;", "&")
-	text = text.replace(" ", " ") # Non-line-breaking space
-	text = text.replace("\r\n", " ")
-	text = text.replace("\r", " ")
-	text = text.replace("–", "-")
+	#("­", ""), # strip soft hyphens as wrapping text is hard enough already   -- Uh, no? Kinda necessary for our purposes
+	("…", "..."),
+	(" ", " "), # Non-line-breaking space
+	("\r", " "),
+	("–", "-"),
 
 	# digraphs and ligatures
-	text = text.replace("Ǳ", "DZ")
-	text = text.replace("ǲ", "Dz")
-	text = text.replace("ǳ", "dz")
-	text = text.replace("Ǆ", "DŽ")
-	text = text.replace("ǅ", "Dž")
-	text = text.replace("ǆ", "dž")
-	#text = text.replace("Ĳ", "IJ") # supported in Latin G2
-	#text = text.replace("ĳ", "ij") # supported in Latin G2
-	text = text.replace("Ǉ", "LJ")
-	text = text.replace("ǈ", "Lj")
-	text = text.replace("ǉ", "lj")
-	text = text.replace("Ǌ", "NJ")
-	text = text.replace("ǋ", "Nj")
-	text = text.replace("ǌ", "nj")
-	text = text.replace("ᵺ", "th")
-	text = text.replace("Ꜳ", "AA")
-	text = text.replace("ꜳ", "aa")
-	#text = text.replace("Æ", "AE") # supported in Latin G2
-	#text = text.replace("æ", "ae") # supported in Latin G2
-	text = text.replace("Ꜵ", "AO")
-	text = text.replace("ꜵ", "ao")
-	text = text.replace("Ꜷ", "AU")
-	text = text.replace("ꜷ", "au")
-	text = text.replace("Ꜹ", "AV")
-	text = text.replace("ꜹ", "av")
-	text = text.replace("Ꜻ", "AV")
-	text = text.replace("ꜻ", "av")
-	text = text.replace("Ꜽ", "AY")
-	text = text.replace("ꜽ", "ay")
-	text = text.replace("🙰", "et")
-	text = text.replace("ﬀ", "ff")
-	text = text.replace("ﬃ", "ffi")
-	text = text.replace("ﬄ", "ffl")
-	text = text.replace("ﬁ", "fi")
-	text = text.replace("ﬂ", "fl")
-	text = text.replace("Ƕ", "Hv")
-	text = text.replace("ƕ", "hv")
-	text = text.replace("℔", "lb")
-	text = text.replace("Ỻ", "lL")
-	text = text.replace("ỻ", "ll")
-	#text = text.replace("Œ", "OE") # supported in Latin G2
-	#text = text.replace("œ", "oe") # supported in Latin G2
-	text = text.replace("Ꝏ", "OO")
-	text = text.replace("ꝏ", "oo")
-	text = text.replace("ﬆ", "st")
-	text = text.replace("ﬅ", "ft")
-	text = text.replace("Ꜩ", "TZ")
-	text = text.replace("ꜩ", "tz")
-	text = text.replace("ᵫ", "ue")
-	text = text.replace("ꭣ", "uo")
-	text = text.replace("Ꝡ", "VY")
-	text = text.replace("ꝡ", "vy")
+	("Ǳ", "DZ"),
+	("ǲ", "Dz"),
+	("ǳ", "dz"),
+	("Ǆ", "DŽ"),
+	("ǅ", "Dž"),
+	("ǆ", "dž"),
+	#("Ĳ", "IJ"), # supported in Latin G2
+	#("ĳ", "ij"), # supported in Latin G2
+	("Ǉ", "LJ"),
+	("ǈ", "Lj"),
+	("ǉ", "lj"),
+	("Ǌ", "NJ"),
+	("ǋ", "Nj"),
+	("ǌ", "nj"),
+	("ᵺ", "th"),
+	("Ꜳ", "AA"),
+	("ꜳ", "aa"),
+	#("Æ", "AE"), # supported in Latin G2
+	#("æ", "ae"), # supported in Latin G2
+	("Ꜵ", "AO"),
+	("ꜵ", "ao"),
+	("Ꜷ", "AU"),
+	("ꜷ", "au"),
+	("Ꜹ", "AV"),
+	("ꜹ", "av"),
+	("Ꜻ", "AV"),
+	("ꜻ", "av"),
+	("Ꜽ", "AY"),
+	("ꜽ", "ay"),
+	("🙰", "et"),
+	("ﬀ", "ff"),
+	("ﬃ", "ffi"),
+	("ﬄ", "ffl"),
+	("ﬁ", "fi"),
+	("ﬂ", "fl"),
+	("Ƕ", "Hv"),
+	("ƕ", "hv"),
+	("℔", "lb"),
+	("Ỻ", "lL"),
+	("ỻ", "ll"),
+	#("Œ", "OE"), # supported in Latin G2
+	#("œ", "oe"), # supported in Latin G2
+	("Ꝏ", "OO"),
+	("ꝏ", "oo"),
+	("ﬆ", "st"),
+	("ﬅ", "ft"),
+	("Ꜩ", "TZ"),
+	("ꜩ", "tz"),
+	("ᵫ", "ue"),
+	("ꭣ", "uo"),
+	("Ꝡ", "VY"),
+	("ꝡ", "vy"),
 
 	# map similar characters to one canonical unicode point
-	text = text.replace("€", "₠")
-	text = re.sub("[··᛫‧∙⋅⋅⸱⸳・ꞏ]","·",text,flags=re.UNICODE)
-	text = text.replace("•", "●")
-	text = text.replace("Ș", "Ş")
-	text = text.replace("ș", "ş")
-	text = text.replace("Å", "Å")
-	text = text.replace("„", "”")
-	text = text.replace("‟", "“")
-	text = text.replace("‘", "'")
-	text = text.replace("’", "'")
-	text = re.sub("[‒–—]","―",text,flags=re.UNICODE) # dashes to horizontal bar
+	("€", "₠"),
+	("··᛫‧∙⋅⋅⸱⸳・ꞏ", "·"),
+	("•", "●"),
+	("Ș", "Ş"),
+	("ș", "ş"),
+	("Å", "Å"),
+	("„", "”"),
+	("‟", "“"),
+	("‘", "'"),
+	("’", "'"),
+	("‒–—", "―"), # dashes to horizontal bar
 
 	# emoji stuff
-	text = re.sub("[😊☺]","🙂",text,flags=re.UNICODE) # like slightly smiling face
-	text = re.sub("[😁😃😄😆]","😀",text,flags=re.UNICODE) # like grinning face
-	text = text.replace("😝", "😛") # face with tongue
-	text = text.replace("🤣", "😂") # rofl -> face with tears of joy
-	text = text.replace("🤓", "😎") # nerd -> sunglasses
-	text = re.sub("[☹😦]","🙁",text,flags=re.UNICODE) # like slightly frowning face
-	text = re.sub("[😭😥]", "😢",text,flags=re.UNICODE) # like crying face
-	text = re.sub("[🤚👋🖐]","✋",text,flags=re.UNICODE) # like raised hand
-	text = re.sub("[♡♥🎔💓💖💗💘💙💚💛💜💝💟🖤🧡]","❤",text,flags=re.UNICODE) # like heavy black heart
-	text = re.sub("["u"\U0000FE00-\U0000FE0F]","",text,flags=re.UNICODE) # strip variation selectors
+	("😊☺", "🙂"), # like slightly smiling face
+	("😁😃😄😆", "😀"), # like grinning face
+	("😝", "😛"), # face with tongue
+	("🤣", "😂"), # rofl -> face with tears of joy
+	("🤓", "😎"), # nerd -> sunglasses
+	("☹😦", "🙁"), # like slightly frowning face
+	("😭😥", "😢"), # like crying face
+	("🤚👋🖐", "✋"), # like raised hand
+	("♡♥🎔💓💖💗💘💙💚💛💜💝💟🖤🧡", "❤"), # like heavy black heart
+]
 
-	return text
-
-enhancementmapping = {
-	# map to L1 replacement character, enhancement mode, enhancement data
-	# these can be mapped to level 1 characters provided we are using the English language (which we always are right now)
+# Work out what each character ends up as once every rule has been applied to it, in order
+def foldRules(rules):
+	table = {}
+	
+	for characters, replacement in rules:
+		for character, output in table.items():
+			table[character] = "".join(replacement if c in characters else c for c in output)
+		
+		for character in characters:
+			table.setdefault(character, replacement)
+	
+	return str.maketrans(table)
 
-#¤ÉÄÖÅÜ_éäöåü
+charsubTable = foldRules(charsubRules)
 
-	"#":[0x23,0,0],
-	"¤":[0x24,0,0],
-	"É":[0x40,0,0],
-	"Ä":[0x5b,0,0],
-	"Ö":[0x5c,0,0],
-	"Å":[0x5d,0,0],
-	"Ü":[0x5e,0,0],
-	"_":[0x5F,0,0],
-	"é":[0x60,0,0],
-	"ä":[0x7b,0,0],
-	"ö":[0x7c,0,0],
-	"å":[0x7d,0,0],
-	"ü":[0x7e,0,0],
+# Extraneous whitespace, HTML entities and variation selectors, all in one pass.
+# (A \r\n never makes it past the whitespace cleanup, so it doesn't need a rule of its own.)
+charsubCleanup = re.compile("(^\\s+|\\s+$|\\s+(?=\\s))|&(lt|gt|amp);|[\uFE00-\uFE0F]")
+charsubEntities = {"lt":"<", "gt":">", "amp":"&"}
 
-	# no diacritic - i.e. the Latin G0 character set
-	# 0x23 character already present in English NOS
-	"¤":[0x7f,0x10,0x24],
-	"[":[0x28,0x10,0x5b],
-	"\\":[0x2f,0x10,0x5c],
-	"]":[0x29,0x10,0x5d],
-	"^":[0x20,0x10,0x5e],
-	"{":[0x28,0x10,0x7b],
-	"|":[0x20,0x10,0x7c],
-	"}":[0x29,0x10,0x7d],
-	"~":[0x7f,0x10,0x7e],
+def charsubMatch(match):
+	if match.group(2):
+		return charsubEntities[match.group(2)]
+	
+	return ""	# Whitespace or a variation selector
 
-	# grave AEIOUaeiou
-	"À":[0x41,0x11,0x41],"È":[0x45,0x11,0x45],"Ì":[0x49,0x11,0x49],"Ò":[0x4F,0x11,0x4F],"Ù":[0x55,0x11,0x55],
-	"à":[0x61,0x11,0x61],"è":[0x65,0x11,0x65],"ì":[0x69,0x11,0x69],"ò":[0x6F,0x11,0x6F],"ù":[0x75,0x11,0x75],
+def charsub(text):
+	if type(text) is not str:
+		print("legaliser tried to charsub something that's not text!")
+		return text
+	
+	return charsubCleanup.sub(charsubMatch, text).translate(charsubTable)
 
-	# acute ACEILNORSUYZacegilnorsuyz
-	"Á":[0x41,0x12,0x41],"Ć":[0x43,0x12,0x43],"Í":[0x49,0x12,0x49],"Ĺ":[0x4c,0x12,0x4c],"Ń":[0x4e,0x12,0x4e],"Ó":[0x4f,0x12,0x4f],"Ŕ":[0x52,0x12,0x52],"Ś":[0x53,0x12,0x53],"Ú":[0x55,0x12,0x55],"Ý":[0x59,0x12,0x59],"Ź":[0x5a,0x12,0x5a],
-	"á":[0x61,0x12,0x61],"ć":[0x63,0x12,0x63],"í":[0x69,0x12,0x69],"ĺ":[0x6c,0x12,0x6c],"ń":[0x6e,0x12,0x6e],"ó":[0x6f,0x12,0x6f],"ŕ":[0x72,0x12,0x72],"ś":[0x73,0x12,0x73],"ú":[0x75,0x12,0x75],"ý":[0x79,0x12,0x79],"ź":[0x7a,0x12,0x7a],
 
-	# circumflex ACEGHIJOSUWYaceghijosuwy
-	"Â":[0x41,0x13,0x41],"Ĉ":[0x43,0x13,0x43],"Ê":[0x45,0x13,0x45],"Ĝ":[0x47,0x13,0x47],"Ĥ":[0x48,0x13,0x48],"Î":[0x49,0x13,0x49],"Ĵ":[0x4a,0x13,0x4a],"Ô":[0x4f,0x13,0x4f],"Ŝ":[0x53,0x13,0x53],"Û":[0x55,0x13,0x55],"Ŵ":[0x57,0x13,0x57],"Ŷ":[0x59,0x13,0x59],
-	"â":[0x61,0x13,0x61],"ĉ":[0x63,0x13,0x63],"ê":[0x65,0x13,0x65],"ĝ":[0x67,0x13,0x67],"ĥ":[0x68,0x13,0x68],"î":[0x69,0x13,0x69],"ĵ":[0x6a,0x13,0x6a],"ô":[0x6f,0x13,0x6f],"ŝ":[0x73,0x13,0x73],"û":[0x75,0x13,0x75],"ŵ":[0x77,0x13,0x77],"ŷ":[0x79,0x13,0x79],
+# X/26 enhancement packets: up to 15 per subpage, 13 triplets each, and we always keep room for a terminator
+enhancementPackets = 15
+tripletsPerPacket = 13
+enhancementBudget = enhancementPackets * tripletsPerPacket - 1
+terminator = chr(0x7f) * 3
 
-	# tilde AINOUainou
-	"Ã":[0x41,0x14,0x41],"Ĩ":[0x49,0x14,0x49],"Ñ":[0x4e,0x14,0x4e],"Õ":[0x4f,0x14,0x4f],"Ũ":[0x55,0x14,0x55],
-	"ã":[0x61,0x14,0x61],"ĩ":[0x69,0x14,0x69],"ñ":[0x6e,0x14,0x6e],"õ":[0x6f,0x14,0x6f],"ũ":[0x75,0x14,0x75],
+# A triplet as it goes in a .tti file: 18 bits, sliced up into three 6 bit values with bit 6 set
+@functools.lru_cache(maxsize=None)
+def encodeTriplet(address, mode, data):
+	triplet = address | (mode << 6) | (data << 11)
+	return chr(0x40+(triplet&0x3F)) + chr(0x40+((triplet>>6)&0x3F)) + chr(0x40+((triplet>>12)&0x3F))
 
-	# macron AEIOUaeiou
-	"Ā":[0x41,0x15,0x41],"Ē":[0x45,0x15,0x45],"Ī":[0x49,0x15,0x49],"Ō":[0x4f,0x15,0x4f],"Ū":[0x55,0x15,0x55],
-	"ā":[0x61,0x15,0x61],"ē":[0x65,0x15,0x65],"ī":[0x69,0x15,0x69],"ō":[0x6f,0x15,0x6f],"ū":[0x75,0x15,0x75],
+# Row address triplets ("set active position"), by row. Row 24 is address 40; rows 0 and 25 can't be addressed at all.
+rowTriplets = {row:encodeTriplet(40 if row == 24 else row + 40, 4, 0) for row in range(1, 25)}
 
-	# breve AGUagu
-	"Ă":[0x41,0x16,0x41],"Ğ":[0x47,0x16,0x47],"Ŭ":[0x55,0x16,0x55],
-	"ă":[0x61,0x16,0x61],"ğ":[0x67,0x16,0x67],"ŭ":[0x75,0x16,0x75],
+# Pack enhancements (pairs of [row + 40,4,0] and [column,mode,data], in row order) into X/26 packets.
+# Each row address is only sent once for a run of characters on the same row. Anything that doesn't fit
+# is left as the level 1 character the legaliser already put in the row.
+def write_enhancements(enhancements):
+	triplets = []
+	lastRow = None
+	dropped = 0
+	
+	for position in range(0, len(enhancements), 2):
+		row = enhancements[position][0] - 40
+		column, mode, data = enhancements[position + 1]
+		
+		if row not in rowTriplets:
+			dropped += 1
+			continue
+		
+		if len(triplets) + (row != lastRow) + 1 > enhancementBudget:
+			dropped += 1
+			continue
+		
+		if row != lastRow:
+			triplets.append(rowTriplets[row])
+			lastRow = row
+		
+		triplets.append(encodeTriplet(column, mode, data))
+	
+	if dropped:
+		logging.info("write_enhancements: " + str(dropped) + " characters left as level 1")
+	
+	if not triplets:
+		return []
+	
+	triplets.append(terminator)
+	
+	packets = []
+	for p in range(0, len(triplets), tripletsPerPacket):
+		packet = triplets[p:p + tripletsPerPacket]
+		packets.append(chr(0x40 + p // tripletsPerPacket) + "".join(packet) + terminator * (tripletsPerPacket - len(packet)))	# first byte is designation code
+	
+	return packets
 
-	# dot CEGIZcegz
-	"Ċ":[0x43,0x17,0x43],"Ė":[0x45,0x17,0x45],"Ġ":[0x47,0x17,0x47],"İ":[0x49,0x17,0x49],"Ż":[0x5a,0x17,0x5a],
-	"ċ":[0x63,0x17,0x63],"ė":[0x65,0x17,0x65],"ġ":[0x67,0x17,0x67],"ż":[0x7a,0x17,0x7a],
+# The enhancements (in the same pairs write_enhancements takes) that a subpage's X/26 packets already make,
+# or None if they do anything other than put characters at positions
+def readEnhancements(packets):
+	enhancements = []
+	row = None
+	
+	for packet in packets:
+		for position in range(1, len(packet) - 2, 3):
+			if packet[position:position + 3] == terminator:
+				return enhancements
+			
+			value = (ord(packet[position]) - 0x40) | ((ord(packet[position + 1]) - 0x40) << 6) | ((ord(packet[position + 2]) - 0x40) << 12)
+			address, mode, data = value & 0x3f, (value >> 6) & 0x1f, value >> 11
+			
+			if address >= 40:
+				if mode != 4 or data != 0:
+					return None	# Not just "set active position"
+				row = 24 if address == 40 else address - 40
+			elif row is None:
+				return None
+			else:
+				enhancements.append([row+40,4,0])
+				enhancements.append([address,mode,data])
+	
+	return enhancements
 
-	# diaeresis/umlaut AEIOUYaeiouy
-	"Ë":[0x45,0x18,0x45],"Ï":[0x49,0x18,0x49],"Ÿ":[0x59,0x18,0x59],
-	"ë":[0x65,0x18,0x65],"ï":[0x69,0x18,0x69],"ÿ":[0x79,0x18,0x79],
+# X/26 packets for a subpage that already had some (from a template, or from being legalised before) and now
+# has new enhancements as well. Where both put something at the same place, the new one wins.
+def mergeEnhancements(existing, enhancements):
+	if not enhancements:
+		return list(existing)	# Untouched, so legalising a legalised page changes nothing
+	
+	if not existing:
+		return write_enhancements(enhancements)
+	
+	old = readEnhancements(existing)
+	if old is None:
+		logging.info("mergeEnhancements: can't add to these X/26 packets, so the new characters are left as level 1")
+		return list(existing)
+	
+	merged = {}
+	for pairs in (old, enhancements):
+		for position in range(0, len(pairs), 2):
+			merged[(pairs[position][0], pairs[position + 1][0])] = pairs[position:position + 2]
+	
+	return write_enhancements([triplet for place in sorted(merged) for triplet in merged[place]])
 
-	# ring AUau
-	"Ů":[0x55,0x1a,0x55],
-	"ů":[0x75,0x1a,0x75],
+mosaicCodes = frozenset(chr(code) for code in range(0x11, 0x18))
+modeSwitch = re.compile("[\x00-\x07\x11-\x17]")	# Codes that turn graphics on or off
 
-	# cedilla CGKLNRSTcklnrst
-	"Ç":[0x43,0x1b,0x43],"Ģ":[0x47,0x1b,0x47],"Ķ":[0x4b,0x1b,0x4b],"Ļ":[0x4c,0x1b,0x4c],"Ņ":[0x4e,0x1b,0x4e],"Ŗ":[0x52,0x1b,0x52],"Ş":[0x53,0x1b,0x53],"Ț":[0x54,0x1b,0x54],
-	"ç":[0x63,0x1b,0x63],"ķ":[0x6b,0x1b,0x6b],"ļ":[0x6c,0x1b,0x6c],"ņ":[0x6e,0x1b,0x6e],"ŗ":[0x72,0x1b,0x72],"ş":[0x73,0x1b,0x73],"ț":[0x74,0x1b,0x74],
+# Add the enhancements for any characters in this piece of a row that need them
+def findEnhancements(number, text, offset, enhancements, profile):
+	if profile.enhancedSet.isdisjoint(text):
+		return
+	
+	for position, character in enumerate(text):
+		if character in profile.enhancedSet:
+			mode, data = profile.enhancements[character]
+			enhancements.append([number+40,4,0])
+			enhancements.append([position + offset,mode,data])
 
-	# double acute OUou
-	"Ő":[0x4f,0x1d,0x4f],"Ű":[0x55,0x1d,0x55],
-	"ő":[0x6f,0x1d,0x6f],"ű":[0x75,0x1d,0x75],
+# Make one row safe for level 1 in a national option (see charsets.py), adding any characters it can't show to enhancements
+def legaliseRow(number, text, enhancements, profile=None):
+	profile = getProfile(profile)
+	
+	if mosaicCodes.isdisjoint(text):
+		# No graphics, so the whole row is text
+		findEnhancements(number, text, 0, enhancements, profile)
+		return profile.encode(text).rstrip()	# Remove trailing whitespace
+	
+	# Mosaics get passed through untouched, so only the text between them is legalised
+	pieces = []
+	graphics = False
+	start = 0
+	
+	for match in modeSwitch.finditer(text):
+		position = match.start()
+		pieces.append(legalisePiece(number, text[start:position], start, graphics, enhancements, profile))
+		graphics = text[position] >= "\x11"
+		start = position
+	
+	pieces.append(legalisePiece(number, text[start:], start, graphics, enhancements, profile))
+	
+	return "".join(pieces).rstrip()	# Remove trailing whitespace
 
-	# ogonek AEIUaeiu
-	"Ą":[0x41,0x1e,0x41],"Ę":[0x45,0x1e,0x45],"Į":[0x49,0x1e,0x49],"Ų":[0x55,0x1e,0x55],
-	"ą":[0x61,0x1e,0x61],"ę":[0x65,0x1e,0x65],"į":[0x69,0x1e,0x69],"ų":[0x75,0x1e,0x75],
+def legalisePiece(number, text, offset, graphics, enhancements, profile):
+	if graphics:
+		return text
+	
+	findEnhancements(number, text, offset, enhancements, profile)
+	return profile.encode(text)
 
-	# caron/háček CDELNRSTZcdelnrstz
-	"Č":[0x43,0x1f,0x43],"Ď":[0x44,0x1f,0x44],"Ě":[0x45,0x1f,0x45],"Ľ":[0x4c,0x1f,0x4c],"Ň":[0x4e,0x1f,0x4e],"Ř":[0x52,0x1f,0x52],"Š":[0x53,0x1f,0x53],"Ť":[0x54,0x1f,0x54],"Ž":[0x5a,0x1f,0x5a],
-	"č":[0x63,0x1f,0x63],"ď":[0x64,0x1f,0x64],"ě":[0x65,0x1f,0x65],"ľ":[0x6c,0x1f,0x6c],"ň":[0x6e,0x1f,0x6e],"ř":[0x72,0x1f,0x72],"š":[0x73,0x1f,0x73],"ť":[0x74,0x1f,0x74],"ž":[0x7a,0x1f,0x7a],
-	# symbols from the Latin G2 supplementary set
-	"¡":[0x21,0x0F,0x21],
-	"¢":[0x63,0x0F,0x22],
-	# 0x23 character already present in English NOS
-	# 0x24 character already present in English NOS
-	"¥":[0x59,0x0F,0x25],
-	# 0x26 character already present in English NOS
-	"§":[0x53,0x0F,0x27],
-	# 0x28 already mapped from G0 set
-	"‘":[0x27,0x0F,0x29],
-	"“":[0x22,0x0F,0x2a],
-	"«":[0x3c,0x0F,0x2b],
-	# 0x2c character already present in English NOS
-	# 0x2d character already present in English NOS
-	# 0x2e character already present in English NOS
-	"↓":[0x7f,0x0F,0x2f],
-	"°":[0x7f,0x0F,0x30],
-	"±":[0x7f,0x0F,0x31],
-	"²":[0x7f,0x0F,0x32],
-	"³":[0x7f,0x0F,0x33],
-	"×":[0x7f,0x0F,0x34],
-	"µ":[0x7f,0x0F,0x35],
-	"¶":[0x7f,0x0F,0x36],
-	"·":[0x7f,0x0F,0x37],
-	# 0x38 characeter already present in English NOS
-	"’":[0x27,0x0F,0x39],
-	"”":[0x22,0x0F,0x3a],
-	"»":[0x3e,0x0F,0x3b],
-	# 0x3c character already present in English NOS
-	# 0x3d character already present in English NOS
-	# 0x3e character already present in English NOS
-	"¿":[0x3F,0x0F,0x3f],
-	# 0x40-0x4f are the diacritic characters
-	# 0x50 character already present in English NOS
-	"¹":[0x7f,0x0F,0x51],
-	"®":[0x7f,0x0F,0x52],
-	"©":[0x7f,0x0F,0x53],
-	"™":[0x7f,0x0F,0x54],
-	"♪":[0x7f,0x0F,0x55],
-	"₠":[0x45,0x0F,0x56],
-	"‰":[0x7f,0x0F,0x57],
-	"∝":[0x7f,0x0F,0x58],
-	# 0x59-0x5b are reserved
-	"⅛":[0x7f,0x0F,0x5c],
-	"⅜":[0x7f,0x0F,0x5d],
-	"⅝":[0x7f,0x0F,0x5e],
-	"⅞":[0x7f,0x0F,0x5f],
-	"Ω":[0x7f,0x0F,0x60],
-	"Æ":[0x7f,0x0F,0x61],
-	"Đ":[0x44,0x0F,0x62],
-	"ª":[0x61,0x0F,0x63],
-	"Ħ":[0x48,0x0F,0x64],
-	# 0x65 is reserved
-	"Ĳ":[0x7f,0x0F,0x66],
-	"Ŀ":[0x4C,0x0F,0x67],
-	"Ł":[0x4C,0x0F,0x68],
-	"Ø":[0x4f,0x0F,0x69],
-	"Œ":[0x7f,0x0F,0x6a],
-	"º":[0x6f,0x0F,0x6b],
-	"Þ":[0x7f,0x0F,0x6c],
-	"Ŧ":[0x4f,0x0F,0x6d],
-	"Ŋ":[0x7f,0x0F,0x6e],
-	"ŉ":[0x6e,0x0F,0x6f],
-	"ĸ":[0x71,0x0F,0x70],
-	"æ":[0x7f,0x0F,0x71],
-	"đ":[0x64,0x0F,0x72],
-	"ð":[0x64,0x0F,0x73],
-	"ħ":[0x68,0x0F,0x74],
-	"ı":[0x69,0x0F,0x75],
-	"ĳ":[0x7f,0x0F,0x76],
-	"ŀ":[0x6C,0x0F,0x77],
-	"ł":[0x6C,0x0F,0x78],
-	"ø":[0x6f,0x0F,0x79],
-	"œ":[0x7f,0x0F,0x7a],
-	"ß":[0x73,0x0F,0x7b],
-	"þ":[0x7f,0x0F,0x7c],
-	"ŧ":[0x4f,0x0F,0x7d],
-	"ŋ":[0x7f,0x0F,0x7e],
+# Most rows we legalise are template rows we've seen before (headers, footers, banners), so we remember the
+# last few thousand: (row text, profile name) -> (legalised text, (position, mode, data) for each enhancement).
+# The row number only matters to the enhancements, so it's added back in afterwards.
+@functools.lru_cache(maxsize=4096)
+def legaliseText(text, profile):
+	enhancements = []
+	newLine = legaliseRow(0, text, enhancements, profile)
+	return newLine, tuple(tuple(triplet) for triplet in enhancements[1::2])
 
-	# G1 mosaics
-	"▌":[0x7f,0x01,0x35],
-	"▐":[0x7f,0x01,0x6a],
-	"█":[0x7f,0x01,0x7f],
+def legaliseCached(number, text, enhancements, profile):
+	newLine, triplets = legaliseText(text, profile.name)
+	
+	for position, mode, data in triplets:
+		enhancements.append([number+40,4,0])
+		enhancements.append([position,mode,data])
+	
+	return newLine
 
-	# G3 smooth mosaics and line drawing set
-	"▒":[0x7f,0x02,0x2f],
-	"●":[0x7f,0x02,0x4D],
-	"⬤":[0x7f,0x02,0x4E],
-	"◯":[0x4f,0x02,0x4F],
+# How well the row cache is doing: (hits, misses, maxsize, currsize)
+def legaliserCacheInfo():
+	return legaliseText.cache_info()
 
-	#todo: more mappings
-}
+def clearLegaliserCache():
+	legaliseText.cache_clear()
 
-def write_enhancements(enhancements):
-	packets = []
-	for p in range(15): # up to 15 enhancement packets per subpage
-		packet = chr(0x40 + p) # first byte is designation code
-		for e in range(13): # up to 13 triplets per enhancement packet
-			if len(enhancements) > p*13+e:
-				# combine parts of enhancement data into an 18 byte triplet, then slice it up into three 6 byte values to write to the row with bit 6 set
-				triplet = enhancements[p*13+e][0] | ((enhancements[p*13+e][1]) << 6) | ((enhancements[p*13+e][2]) << 11)
-				packet+=chr(0x40+(triplet&0x3F))+chr(0x40+((triplet>>6)&0x3F))+chr(0x40+((triplet>>12)&0x3F))
-			elif e == 0:
-				# TODO: generate packet of terminators if previous packet is full.
-				return packets
-			else:
-				packet+=chr(0x7f)+chr(0x7f)+chr(0x7f)
-		packets.append(packet)
+# Make a page (dict or pagemodel.Page) safe for level 1, in the page's own profile unless we're given another one.
+# Unless inPlace is set the page you give us isn't changed, but only the rows are new: everything else is shared with it.
+# Only rows 0-24 are legalised. Any X/26 packets the page already has are kept, with the new enhancements merged
+# in, so a legalised page comes back out the same.
+def pageLegaliser(inpage, inPlace=False, profile=None):
+	profile = getProfile(profile) if profile is not None else pageProfile(inpage)
+	
+	if isinstance(inpage, Page):
+		# Rows are never changed in place, so a cheap copy will do
+		page = inpage if inPlace else inpage.copy()
+		if profile is not pageProfile(page):
+			page.profile = profile.name	# So it goes out with the right language bits
+		
+		for subpage in page.subpages:
+			enhancements = []
+			
+			for row in subpage:
+				if row.number < 25:
+					subpage[row.number] = legaliseCached(row.number, row.text, enhancements, profile)
+			
+			subpage.enhancements = mergeEnhancements(subpage.enhancements, enhancements)
+		
+		return page
+	
+	if inPlace:
+		page = inpage
+	else:
+		page = dict(inpage)
+		page["subpages"] = [dict(subpage, packets=list(subpage["packets"])) for subpage in inpage.get("subpages") or []]
+	
+	if profile is not pageProfile(page):
+		page["profile"] = profile.name	# So it goes out with the right language bits
 	
-	return packets
-
-def pageLegaliser(inpage):
-	page = copy.deepcopy(inpage)
 	page = teletextDeMinify(page)
-	for subcode, subpage in enumerate(page["subpages"]):
+	for subpage in page["subpages"]:
 		enhancements = []
 		
-		subpage["packets"] = sorted(subpage["packets"], key=lambda d: d['number'])
+		subpage["packets"].sort(key=lambda d: d['number'])
+		packets = subpage["packets"]
 		
-		#print(subpage["packets"])
-		#print(sorted(subpage["packets"], key=lambda d: d['number']))
+		# X/26 packets we already have are merged with the new ones at the end, rather than legalised as text
+		existing = [packet["text"] for packet in packets if packet["number"] == 26 and "text" in packet]
+		if existing:
+			packets[:] = [packet for packet in packets if packet["number"] != 26 or "text" not in packet]
 		
-		#print("")
-		
-		for pNum,packet in enumerate(subpage["packets"]):
-			if "text" not in packet:
+		for pNum,packet in enumerate(packets):
+			if "text" not in packet or packet["number"] >= 25:
+				if not inPlace:
+					packets[pNum] = clonePacket(packet)
 				continue
 			
-			graphics = False
-			newLine = ""
-			
-			for position, character in enumerate(packet["text"]):
-				
-				if ord(character) >= 0x11 and ord(character) <= 0x17:
-					graphics = True
-				elif ord(character) >= 0x00 and ord(character) <= 0x07:
-					graphics = False
-				
-				if graphics == False:
-					safeChar = enhancementmapping.get(character, [ord(character),0,0])
-					if safeChar[0] > 127:
-						safeChar = [0x7f,0,0]
-					
-					if safeChar[1]:
-						enhancements.append([packet["number"]+40,4,0])
-						enhancements.append([position,safeChar[1],safeChar[2]])
-					
-					newLine += chr(safeChar[0])
-				else:
-					newLine += character
+			newLine = legaliseCached(packet["number"], packet["text"], enhancements, profile)
 			
-			newLine = newLine.rstrip()	# Remove trailing whitespace
-			
-			page["subpages"][subcode]["packets"][pNum]["text"] = newLine
+			if inPlace:
+				packet["text"] = newLine
+			else:
+				packets[pNum] = dict(packet, text=newLine)
 		
-		for enhancementPacket in write_enhancements(enhancements):
-			page["subpages"][subcode]["packets"].append({"number":26,"text":enhancementPacket})
+		for enhancementPacket in mergeEnhancements(existing, enhancements):
+			packets.append({"number":26,"text":enhancementPacket})
 	
 	return page
\ No newline at end of file
@@ -1,9 +1,9 @@
 import feedparser
-import copy
 from datetime import datetime
 import unicodedata
-from page import loadTTI, exportTTI
+from page import loadTemplate, clonePackets, exportTTI
 from legaliser import pageLegaliser
+from feeds import getFeed
 
 # Finse dag- en maandnamen
 FINNISH_DAYS = ["MAANANTAI", "TIISTAI", "KESKIVIIKKO", "TORSTAI", "PERJANTAI", "LAUANTAI", "SUNNUNTAI"]
@@ -123,7 +123,7 @@ def create_newsflash_subpage(template, headline_text, page_number):
         Dictionary met subpage packets
     """
     # Maak een kopie van de template packets
-    subpage_packets = copy.deepcopy(template["subpages"][0]["packets"])
+    subpage_packets = clonePackets(template["subpages"][0]["packets"])
     
     # Vervang DAY/DATE placeholders
     subpage_packets = vervang_datum_in_packets(subpage_packets)
@@ -211,10 +211,10 @@ def generate_newsflash():
         
         try:
             # Load de template voor deze categorie
-            template = loadTTI(feed_config["template"])
+            template = loadTemplate(feed_config["template"])
             
-            # Download de RSS feed
-            news_data = feedparser.parse(feed_config["url"])
+            # Haal de RSS feed op (uit de gedeelde feed-opslag als hij deze run al binnen is)
+            news_data = getFeed(feed_config["url"])
             
             # Verwerk elk artikel
             for idx, article in enumerate(news_data['entries']):
@@ -1,14 +1,14 @@
 import feedparser
 from bs4 import BeautifulSoup
-import copy
 from datetime import datetime
 import unicodedata
 import os
 import json
 
-from textBlock import toTeletextBlock, tableRow
-from page import exportTTI, loadTTI
+from textBlock import toTeletextBlock, measureTeletextBlock, compile_table
+from page import exportTTI, loadTemplate, clonePackets
 from legaliser import pageLegaliser
+from feeds import getFeed
 
 # Finse dag- en maandnamen
 FINNISH_DAYS = ["MAANANTAI", "TIISTAI", "KESKIVIIKKO", "TORSTAI", "PERJANTAI", "LAUANTAI", "SUNNUNTAI"]
@@ -53,8 +53,8 @@ def load_intro(intro_filename):
     """Laad een intro subpage als deze bestaat"""
     if os.path.exists(intro_filename):
         try:
-            intro_template = loadTTI(intro_filename)
-            intro_subpage = {"packets": copy.deepcopy(intro_template["subpages"][0]["packets"])}
+            intro_template = loadTemplate(intro_filename)
+            intro_subpage = {"packets": clonePackets(intro_template["subpages"][0]["packets"])}
             # Vervang datum placeholders
             for packet in intro_subpage["packets"]:
                 if "text" in packet:
@@ -111,7 +111,8 @@ def fetch_articles_from_feed(rss_url, max_articles, clean_aggressive=False):
     """Haal artikelen op van een specifieke RSS feed"""
     all_articles = []
     
-    parsed = feedparser.parse(rss_url)
+    # Via de gedeelde feed-opslag: demo.py heeft deze feeds deze run meestal al opgehaald
+    parsed = getFeed(rss_url)
     count = 0
     
     for entry in parsed["entries"]:
@@ -129,7 +130,7 @@ def fetch_articles_from_feed(rss_url, max_articles, clean_aggressive=False):
         else:
             article_text = clean_title
         
-        article_text = article_text.replace("\u00AD", "")
+        # Soft hyphens (U+00AD) blijven staan: de optimale layout gebruikt ze als afbreekpunten
         
         # Gebruik aggressive cleaning voor jalkapallo feed
         if clean_aggressive:
@@ -149,23 +150,22 @@ def fetch_articles_from_feed(rss_url, max_articles, clean_aggressive=False):
 
 def create_index_subpage(template, headlines, section_title):
     """Maak een index subpagina met headlines"""
-    packets = copy.deepcopy(template["subpages"][0]["packets"])
+    packets = clonePackets(template["subpages"][0]["packets"])
     line = 5
     
     for headline in headlines:
-        para_block = toTeletextBlock(
-            input={
-                "content": [
-                    {"align": "left", "content": [{"colour": "white", "text": headline["title"]}]},
-                    {"align": "right", "content": [{"colour": "yellow", "text": headline["number"]}]}
-                ]
-            },
-            line=line
-        )
+        paragraph = {
+            "content": [
+                {"align": "left", "content": [{"colour": "white", "text": headline["title"]}]},
+                {"align": "right", "content": [{"colour": "yellow", "text": headline["number"]}]}
+            ]
+        }
         
-        if (len(para_block) + line) > 22:
+        rows, cursor = measureTeletextBlock(paragraph)
+        if (rows + line) > 22:
             break
         
+        para_block = toTeletextBlock(input=paragraph, line=line)
         line += len(para_block) + 1
         packets += para_block
     
@@ -173,7 +173,7 @@ def create_index_subpage(template, headlines, section_title):
 
 def create_article_subpage(template, article, page_number):
     """Maak een artikel subpagina"""
-    packets = copy.deepcopy(template["subpages"][0]["packets"])
+    packets = clonePackets(template["subpages"][0]["packets"])
     line = 5
     
     # Titel toevoegen
@@ -186,12 +186,15 @@ def create_article_subpage(template, article, page_number):
     
     # Content toevoegen
     for paragraph in article["content"]:
-        para_block = toTeletextBlock(
-            input={"content": [{"align": "left", "content": [{"colour": "white", "text": paragraph}]}]},
-            line=line
-        )
-        if line + len(para_block) > 22:
+        # Optimale regelafbreking (met afbreekstreepjes) zodat er meer tekst op de subpagina past
+        block = {"layout": "optimal", "content": [{"align": "left", "content": [{"colour": "white", "text": paragraph}]}]}
+        
+        # Eerst meten, alleen renderen als het nog past
+        rows, cursor = measureTeletextBlock(block)
+        if line + rows > 22:
             break
+        
+        para_block = toTeletextBlock(input=block, line=line)
         line += len(para_block) + 1
         packets += para_block
     
@@ -205,11 +208,14 @@ def create_article_subpage(template, article, page_number):
     return {"packets": packets}
 
 def calculate_text_lines(text, width=40):
-    """Bereken EXACT hoeveel regels een tekst nodig heeft"""
+    """Bereken EXACT hoeveel regels een tekst nodig heeft, zoals toTeletextBlock hem afbreekt"""
     if not text:
         return 0
-    import math
-    return math.ceil(len(text) / width)
+    rows, cursor = measureTeletextBlock(
+        {"content": [{"align": "left", "content": [{"colour": "white", "text": text}]}]},
+        maxWidth=width
+    )
+    return rows
 
 def create_newsreel_page(page_number=185):
     """Maak de volledige newsreel met alle feeds"""
@@ -218,8 +224,8 @@ def create_newsreel_page(page_number=185):
     # ===== HOOFDINTRO =====
     intro_filename = get_intro_template()
     print(f"Loading main intro: {intro_filename}")
-    intro_template = loadTTI(intro_filename)
-    intro_subpage = {"packets": copy.deepcopy(intro_template["subpages"][0]["packets"])}
+    intro_template = loadTemplate(intro_filename)
+    intro_subpage = {"packets": clonePackets(intro_template["subpages"][0]["packets"])}
     subpages.append(intro_subpage)
     print(f"Main intro loaded with {len(intro_subpage['packets'])} packets")
     
@@ -228,11 +234,11 @@ def create_newsreel_page(page_number=185):
     paauutiset_articles = fetch_articles_from_feed("https://yle.fi/rss/uutiset/paauutiset", 9)
     paauutiset_headlines = [{"title": art["title"], "number": str(102 + i)} for i, art in enumerate(paauutiset_articles)]
     
-    paauutiset_index_template = loadTTI("paauutiset_index.tti")
+    paauutiset_index_template = loadTemplate("paauutiset_index.tti")
     index_subpage = create_index_subpage(paauutiset_index_template, paauutiset_headlines, "PÄÄUUTISET")
     subpages.append(index_subpage)
     
-    paauutiset_page_template = loadTTI("paauutiset_page.tti")
+    paauutiset_page_template = loadTemplate("paauutiset_page.tti")
     for i, article in enumerate(paauutiset_articles):
         article_subpage = create_article_subpage(paauutiset_page_template, article, 102 + i)
         subpages.append(article_subpage)
@@ -247,11 +253,11 @@ def create_newsreel_page(page_number=185):
     tuoreimmat_articles = fetch_articles_from_feed("https://yle.fi/rss/uutiset/tuoreimmat", 5)
     tuoreimmat_headlines = [{"title": art["title"], "number": str(112 + i)} for i, art in enumerate(tuoreimmat_articles)]
     
-    tuoreimmat_index_template = loadTTI("tuoreimmat_index.tti")
+    tuoreimmat_index_template = loadTemplate("tuoreimmat_index.tti")
     index_subpage = create_index_subpage(tuoreimmat_index_template, tuoreimmat_headlines, "TUOREIMMAT")
     subpages.append(index_subpage)
     
-    tuoreimmat_page_template = loadTTI("tuoreimmat_page.tti")
+    tuoreimmat_page_template = loadTemplate("tuoreimmat_page.tti")
     for i, article in enumerate(tuoreimmat_articles):
         article_subpage = create_article_subpage(tuoreimmat_page_template, article, 112 + i)
         subpages.append(article_subpage)
@@ -266,11 +272,11 @@ def create_newsreel_page(page_number=185):
     urheilu_articles = fetch_articles_from_feed("https://yle.fi/rss/urheilu", 5)
     urheilu_headlines = [{"title": art["title"], "number": str(302 + i)} for i, art in enumerate(urheilu_articles)]
     
-    urheilu_index_template = loadTTI("sportgeneral_index.tti")
+    urheilu_index_template = loadTemplate("sportgeneral_index.tti")
     index_subpage = create_index_subpage(urheilu_index_template, urheilu_headlines, "URHEILU")
     subpages.append(index_subpage)
     
-    urheilu_page_template = loadTTI("sportgeneral_page.tti")
+    urheilu_page_template = loadTemplate("sportgeneral_page.tti")
     for i, article in enumerate(urheilu_articles):
         article_subpage = create_article_subpage(urheilu_page_template, article, 302 + i)
         subpages.append(article_subpage)
@@ -283,11 +289,11 @@ def create_newsreel_page(page_number=185):
     )
     jalkapallo_headlines = [{"title": art["title"], "number": str(309 + i)} for i, art in enumerate(jalkapallo_articles)]
     
-    jalkapallo_index_template = loadTTI("jalkapallo_index.tti")
+    jalkapallo_index_template = loadTemplate("jalkapallo_index.tti")
     index_subpage = create_index_subpage(jalkapallo_index_template, jalkapallo_headlines, "JALKAPALLO")
     subpages.append(index_subpage)
     
-    jalkapallo_page_template = loadTTI("jalkapallo_page.tti")
+    jalkapallo_page_template = loadTemplate("jalkapallo_page.tti")
     for i, article in enumerate(jalkapallo_articles):
         article_subpage = create_article_subpage(jalkapallo_page_template, article, 309 + i)
         subpages.append(article_subpage)
@@ -301,29 +307,33 @@ def create_newsreel_page(page_number=185):
         standings = scraper.scrape_standings()
         
         if standings and len(standings) > 0:
-            veikkausliiga_template = loadTTI("veikkausliiga_page.tti")
-            veikkausliiga_packets = copy.deepcopy(veikkausliiga_template["subpages"][0]["packets"])
+            veikkausliiga_template = loadTemplate("veikkausliiga_page.tti")
+            veikkausliiga_packets = clonePackets(veikkausliiga_template["subpages"][0]["packets"])
             
             line = 6
+            standings_table = compile_table(
+                [
+                    {"width": 2,  "data": "P",   "colour": "yellow", "align": "right"},
+                    {"width": 13, "data": "C",   "colour": "cyan"},
+                    {"width": 3,  "data": "Pt",  "colour": "yellow", "align": "right"},
+                    {"width": 7,  "data": "G",   "colour": "white"},
+                    {"width": 6,  "data": "WDG", "colour": "white"},
+                ]
+            )
+            
             for t in standings:
-                rowDict = {
-                    "P": t["position"],
-                    "C": t["team"][:13],
-                    "Pt": t["points"],
-                    "G": t["goals"],
-                    "WDG": f"{t['wins']}/{t['draws']}/{t['losses']}"
-                }
-                
-                row = tableRow(
-                    [
-                        {"width": 2,  "data": "P",   "colour": "yellow", "align": "right"},
-                        {"width": 13, "data": "C",   "colour": "cyan"},
-                        {"width": 3,  "data": "Pt",  "colour": "yellow", "align": "right"},
-                        {"width": 7,  "data": "G",   "colour": "white"},
-                        {"width": 6,  "data": "WDG", "colour": "white"},
-                    ],
-                    rowDict
-                )
+                try:
+                    row = standings_table.render_row({
+                        "P": t["position"],
+                        "C": t["team"][:13],
+                        "Pt": t["points"],
+                        "G": t["goals"],
+                        "WDG": f"{t['wins']}/{t['draws']}/{t['losses']}"
+                    })
+                except ValueError as error:
+                    # Eén onvolledig team mag niet de hele tabel kosten: rij overslaan
+                    print(f"  ! Rij overgeslagen: {error}")
+                    continue
                 
                 tt_block = [{"number": line, "text": row}]
                 
@@ -347,8 +357,8 @@ def create_newsreel_page(page_number=185):
             # Geen data - maak "KAUSI PÄÄTTYNYT" pagina
             print(f"  ℹ Veikkausliiga: No data - creating 'season ended' page")
             
-            veikkausliiga_template = loadTTI("veikkausliiga_page.tti")
-            veikkausliiga_packets = copy.deepcopy(veikkausliiga_template["subpages"][0]["packets"])
+            veikkausliiga_template = loadTemplate("veikkausliiga_page.tti")
+            veikkausliiga_packets = clonePackets(veikkausliiga_template["subpages"][0]["packets"])
             
             # Maak centered message
             line = 11  # Midden van de pagina
@@ -382,8 +392,8 @@ def create_newsreel_page(page_number=185):
         # Error - maak ook "KAUSI PÄÄTTYNYT" pagina
         print(f"  ⚠ Veikkausliiga error: {e} - creating fallback page")
         try:
-            veikkausliiga_template = loadTTI("veikkausliiga_page.tti")
-            veikkausliiga_packets = copy.deepcopy(veikkausliiga_template["subpages"][0]["packets"])
+            veikkausliiga_template = loadTemplate("veikkausliiga_page.tti")
+            veikkausliiga_packets = clonePackets(veikkausliiga_template["subpages"][0]["packets"])
             
             line = 11
             season_ended_block = toTeletextBlock(
@@ -422,11 +432,11 @@ def create_newsreel_page(page_number=185):
     travel_articles = fetch_articles_from_feed("https://yle.fi/rss/t/18-206851/fi", 5)
     travel_headlines = [{"title": art["title"], "number": str(402 + i)} for i, art in enumerate(travel_articles)]
     
-    travel_index_template = loadTTI("matkailu_index.tti")
+    travel_index_template = loadTemplate("matkailu_index.tti")
     index_subpage = create_index_subpage(travel_index_template, travel_headlines, "MATKAILU")
     subpages.append(index_subpage)
     
-    travel_page_template = loadTTI("matkailu_page.tti")
+    travel_page_template = loadTemplate("matkailu_page.tti")
     for i, article in enumerate(travel_articles):
         article_subpage = create_article_subpage(travel_page_template, article, 402 + i)
         subpages.append(article_subpage)
@@ -451,8 +461,8 @@ def create_newsreel_page(page_number=185):
         forecast_text = weather_scraper.get_land_forecast()
         
         if forecast_text:
-            weather_template = loadTTI("weather_land_template.tti")
-            weather_packets = copy.deepcopy(weather_template["subpages"][0]["packets"])
+            weather_template = loadTemplate("weather_land_template.tti")
+            weather_packets = clonePackets(weather_template["subpages"][0]["packets"])
             
             for packet in weather_packets:
                 if "text" in packet:
@@ -496,7 +506,7 @@ def create_newsreel_page(page_number=185):
                 return lines
             
             try:
-                marine_template = loadTTI("weather_marine_template.tti")
+                marine_template = loadTemplate("weather_marine_template.tti")
             except:
                 marine_template = {
                     "subpages": [{
@@ -537,7 +547,7 @@ def create_newsreel_page(page_number=185):
                     
                     if current_line + group_size > MAX_LINE:
                         if current_groups:
-                            subpage = {"packets": copy.deepcopy(marine_template["subpages"][0]["packets"])}
+                            subpage = {"packets": clonePackets(marine_template["subpages"][0]["packets"])}
                             for packet in subpage["packets"]:
                                 if "text" in packet:
                                     packet["text"] = packet["text"].replace("DATE", get_finnish_date())
@@ -580,7 +590,7 @@ def create_newsreel_page(page_number=185):
                         current_line += group_size
                 
                 if current_groups:
-                    subpage = {"packets": copy.deepcopy(marine_template["subpages"][0]["packets"])}
+                    subpage = {"packets": clonePackets(marine_template["subpages"][0]["packets"])}
                     for packet in subpage["packets"]:
                         if "text" in packet:
                             packet["text"] = packet["text"].replace("DATE", get_finnish_date())
@@ -618,7 +628,7 @@ def create_newsreel_page(page_number=185):
             
             # Maak forecast subpages (1 per gebied)
             for section in marine_data['forecast_sections']:
-                subpage = {"packets": copy.deepcopy(marine_template["subpages"][0]["packets"])}
+                subpage = {"packets": clonePackets(marine_template["subpages"][0]["packets"])}
                 for packet in subpage["packets"]:
                     if "text" in packet:
                         packet["text"] = packet["text"].replace("DATE", get_finnish_date())
@@ -652,7 +662,7 @@ def create_newsreel_page(page_number=185):
             
             # Maak VRK2 subpages (1 per gebied)
             for section in marine_data['vrk2_sections']:
-                subpage = {"packets": copy.deepcopy(marine_template["subpages"][0]["packets"])}
+                subpage = {"packets": clonePackets(marine_template["subpages"][0]["packets"])}
                 for packet in subpage["packets"]:
                     if "text" in packet:
                         packet["text"] = packet["text"].replace("DATE", get_finnish_date())
@@ -690,7 +700,7 @@ def create_newsreel_page(page_number=185):
         
         if regions:
             try:
-                regional_template = loadTTI("weather_regional_template.tti")
+                regional_template = loadTemplate("weather_regional_template.tti")
             except:
                 regional_template = {
                     "subpages": [{
@@ -702,7 +712,7 @@ def create_newsreel_page(page_number=185):
                 }
             
             for region_data in regions:
-                subpage = {"packets": copy.deepcopy(regional_template["subpages"][0]["packets"])}
+                subpage = {"packets": clonePackets(regional_template["subpages"][0]["packets"])}
                 
                 for packet in subpage["packets"]:
                     if "text" in packet:
@@ -766,7 +776,7 @@ def create_newsreel_page(page_number=185):
     }
     
     page = vervang_datum_in_tti(page)
-    exportTTI(pageLegaliser(page))
+    exportTTI(pageLegaliser(page, inPlace=True))
     
     print(f"\n{'='*70}")
     print(f"NEWSREEL COMPLETE!")
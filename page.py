@@ -8,7 +8,11 @@
 # Page handling functions for CIMS
 # Nathan Dane, 2022
 
-import json, time, sys, copy
+import json, time, sys, copy, os, hashlib, logging, atexit
+from sinks import DirectorySink
+from pagemodel import Page, Subpage
+from differ import diffPages
+from charsets import getProfile, pageProfile
 
 def access_bit(data, num):
 	base = int(num // 8)
@@ -23,310 +27,528 @@ def clear_bit(value, bit):
 
 # De-Minify a teletext page object
 # Basically this takes care of all the inheritance stuff and returns fully-formed subpages
+# Global packets are shared with the subpages (see clonePacket), not deep-copied, and a page that's
+# already been de-minified comes straight back out again, so it doesn't matter how many times this gets called
 def teletextDeMinify(page):
-	if "packets" in page:	# If there aren't any global packets, we're wasting our time
-		#print("nothing to expand")
-		#return page	# Return unchanged
-		globalPackets = page["packets"]	# Get the global packets
-	else:
-		globalPackets = []
+	globalPackets = page.pop("packets", [])	# Get the global packets
 	
-	if "subpages" not in page:	# Create a subpage list
+	if not page.get("subpages"):	# Create a subpage list
 		page["subpages"] = [{"packets":[]}]
 	
-	if len(page["subpages"]) < 1:
-		page["subpages"] = [{"packets":[]}]
+	control = page.get("control")
 	
-	for subcode,subpage in enumerate(page["subpages"]):	# For every subpage...
-		if "inherit" in subpage:	# Don't add global packets when we've been asked not to
-			if not subpage["inherit"]:
-				continue
+	if not globalPackets and control is None:	# If there aren't any global packets, we're wasting our time
+		return page
+	
+	for subpage in page["subpages"]:	# For every subpage...
+		if not subpage.get("inherit", True):	# Don't add global packets when we've been asked not to
+			continue
 		
-		if "control" not in subpage:
-			if "control" in page:
-				page["subpages"][subcode]["control"] = page["control"]
+		if control is not None and "control" not in subpage:
+			subpage["control"] = control
 		
-		for globalPacket in globalPackets:
-			if not any(globalPacket["number"] == packet["number"] for packet in subpage["packets"]):	# If there's no overriding local packet
-				page["subpages"][subcode]["packets"].append(copy.deepcopy(globalPacket))	# Add in the global packet
-	
-	if "packets" in page:
-		del page["packets"]
+		if globalPackets:
+			present = set(packet["number"] for packet in subpage["packets"])
+			
+			for globalPacket in globalPackets:
+				if globalPacket["number"] not in present:	# If there's no overriding local packet
+					subpage["packets"].append(clonePacket(globalPacket))	# Add in the global packet
+					present.add(globalPacket["number"])
 	
 	return(page)
 
 # Minify a teletext page object
 # Takes fully formed subpages, and makes common packets global
+# A row becomes global when every subpage that inherits has exactly one packet for it, and they're all the same.
+# If they all have the same control too, and the page doesn't have its own, that goes global as well.
 def teletextMinify(page):
 	if "subpages" not in page:	# Don't bother if there are no subpages
 		print("nothing to contract")
 		return page	# Return unchanged
-
-# Reads a .tti file into a standard teletext JSON object.
-# Note that this is not a "minified" object (no inheritance, etc)
-def loadTTI(filename):
-	regionMapping = {
-		0x23:"#",
-		0x24:"¤",
-		0x40:"É",
-		0x5b:"Ä",
-		0x5c:"Ö",
-		0x5d:"Å",
-		0x5e:"Ü",
-		0x5f:"_",
-		0x60:"é",
-		0x7b:"ä",
-		0x7c:"ö",
-		0x7d:"å",
-		0x7e:"ü"
-	}
 	
-	# Read in the file
-	tti = open(filename, "rb")
-	ttiContent = tti.readlines()
-	tti.close()
-	
-	# initialise variables for later
-	output = {"subpages":[]}
-	current = {"control":{"erasePage":False}}
-	newPage = True
-	subpageCounter = 0	# We only use this to check if the subcode makes sense
-	
-	for line in ttiContent:
-		line = line.decode('ascii','ignore').strip() # Remove any trailing whitespace
-		
-		try:
-			line.index(",")
-		except:
-			continue
+	if "packets" in page:	# Half-minified already? Start again from the top
+		teletextDeMinify(page)
+	
+	subpages = [subpage for subpage in page["subpages"] if subpage.get("inherit", True)]
+	
+	if len(subpages) < 2:	# Nothing to share
+		return page
+	
+	common = None
+	
+	for subpage in subpages:
+		rows = {}
+		repeated = set()
 		
-		# If an "attribute" comes through after an OL or FL, we assume this is a new page
-		if line[:line.index(",")] in ["PN","SC","PS","CT"] and newPage:
-			if current:
-				if "packets" in current:
-					current["packets"] = sorted(current["packets"],key = lambda d: d['number'])
-					output["subpages"].append(current)	# If the current subpage isn't empty, write it to the output
-					subpageCounter += 1
-			
-			newPage = False	# Reset 
-			current = {"control":{"erasePage":False}}	# Create a fresh new subpage
-		
-		# Get the page number
-		if line[:line.index(",")] == "PN":
-			page_number = line[line.index(",") + 1:line.index(",") + 4]	# Find the "," and cut out the number bit
-			if "number" in output:	# What if we already have a number for this page?
-				if output["number"] != str(page_number):	# Is this the same as what we have?
-					print("More than one page in this tti " + str(filename))	# Oh no, a weird page has appeared
-					exit()	# This will be a return later
-			else:
-				output["number"] = str(page_number)	# Otherwise, this is our page number now
-		
-		# Get the page subcode
-		elif line[:line.index(",")] == "SC":
-			subcode = line[line.index(",") + 1:]
-			# Subcode should only be defined if it's not what we would logically expect
-			if (subpageCounter + 1) != int(subcode):
-				current["subcode"] = str(subcode)
-				#print(subpageCounter + 1)
-				#print(int(subcode))
-		
-		# Get the page options
-		elif line[:line.index(",")] == "PS":
-			raw_page_status = bytearray.fromhex(line[line.index(",") + 1:])
-			
-			# Language is composed from three bits. Pretty sure this isn't the right order, either...
-			language = (access_bit(raw_page_status,15) << 2) + (access_bit(raw_page_status,0) << 1) + access_bit(raw_page_status,1)
+		for packet in subpage["packets"]:
+			if packet["number"] in rows:
+				repeated.add(packet["number"])	# Can't tell which one to override, so this row stays local
+			rows[packet["number"]] = packet
+		
+		for number in repeated:
+			del rows[number]
+		
+		if common is None:
+			common = rows
+		else:
+			common = {number:packet for number, packet in common.items() if number in rows and rows[number] == packet}
+		
+		if not common:
+			break
+	
+	if common:
+		page["packets"] = [common[number] for number in sorted(common)]
+		
+		for subpage in subpages:
+			subpage["packets"] = [packet for packet in subpage["packets"] if packet["number"] not in common]
+	
+	if "control" not in page and all("control" in subpage for subpage in subpages):
+		control = subpages[0]["control"]
+		
+		if all(subpage["control"] == control for subpage in subpages):
+			page["control"] = control
 			
-			if "control" not in current:
-				current["control"] = {"erasePage":False}
+			for subpage in subpages:
+				del subpage["control"]
+	
+	return page
+
+# Everything loadTTI needs per character is worked out once, here, rather than for every character of every row.
+# The national option characters come from the page's profile (see charsets.py).
+unescapeTable = [chr(code - 0x40) if code >= 0x40 else None for code in range(0x80)]
+
+# Page status bits and the control flags they map to, in the order loadTTI has always written them
+pageStatusFlags = (
+	(6,"erasePage"),
+	(8,"newsFlash"),
+	(9,"subtitle"),
+	(10,"suppressHeader"),
+	(11,"update"),
+	(13,"suppressPage"),
+	(12,"interruptedSequence")	# ?
+)
+
+pageStatusCache = {}
+
+# Turn a PS value into the control flags it sets. Templates only ever use a handful of values, so we remember them
+def parsePageStatus(value):
+	if value in pageStatusCache:
+		return pageStatusCache[value]
+	
+	raw_page_status = bytearray.fromhex(value)
+	
+	# Language is composed from three bits. Pretty sure this isn't the right order, either...
+	language = (access_bit(raw_page_status,15) << 2) + (access_bit(raw_page_status,0) << 1) + access_bit(raw_page_status,1)
+	
+	flags = tuple(name for bit, name in pageStatusFlags if access_bit(raw_page_status,bit) == 1)
+	
+	pageStatusCache[value] = (flags, language)
+	return pageStatusCache[value]
+
+# Un-escape one OL row and apply the national option mapping (a profile's decodeTable) to everything that isn't in graphics mode.
+# The row is cut up at every escape, so each run of plain characters only needs one translate() call.
+# Returns None for rows with broken escapes, which get the careful character-by-character treatment instead.
+def unescapeRow(content, regionTable):
+	if "\x1b" not in content:
+		return content.translate(regionTable)
+	
+	segments = content.split("\x1b")
+	output = [segments[0].translate(regionTable)]
+	graphics = False
+	last = len(segments) - 1
+	
+	for position in range(1, len(segments)):
+		segment = segments[position]
+		
+		if not segment:
+			if position == last:
+				break	# An escape at the very end of the line escapes nothing
+			return None	# An escaped escape
+		
+		code = ord(segment[0])
+		
+		if code < 0x40:
+			return None	# Can't be un-escaped
+		
+		output.append(unescapeTable[code])
+		
+		if code >= 0x51 and code <= 0x57:
+			graphics = True
+		elif code <= 0x47:
+			graphics = False
+		
+		if graphics:
+			output.append(segment[1:])	# Pass mosaics on through
+		else:
+			output.append(segment[1:].translate(regionTable))
+	
+	return "".join(output)
+
+# The slow way of un-escaping a row, which copes with (and complains about) broken escapes
+def unescapeRowSlowly(content, output, regionTable):
+	esc = False
+	unescapedPacket = ""
+	graphics = False
+	
+	for position, character in enumerate(content):
+		if esc:
+			esc = False
+			try:
+				unescapedPacket += chr(ord(character) - 0x40)	# Get the escaped character and subtract 0x40 to make it normal
 				
-			if access_bit(raw_page_status,6) == 1:
-				current["control"]["erasePage"] = True
-			if access_bit(raw_page_status,8) == 1:
-				current["control"]["newsFlash"] = True
-			if access_bit(raw_page_status,9) == 1:
-				current["control"]["subtitle"] = True
-			if access_bit(raw_page_status,10) == 1:
-				current["control"]["suppressHeader"] = True
-			if access_bit(raw_page_status,11) == 1:
-				current["control"]["update"] = True
-			if access_bit(raw_page_status,13) == 1:
-				current["control"]["suppressPage"] = True
-			if access_bit(raw_page_status,12) == 1: # ?
-				current["control"]["interruptedSequence"] = True
+				if ord(character) >= 0x51 and ord(character) <= 0x57:
+					graphics = True
+				elif ord(character) >= 0x40 and ord(character) <= 0x47:
+					graphics = False
+				
+			except:
+				print("loadTTI: error on page " + str(output["number"]) + " " + str(position) + " " + character)
+				continue
 			
-			# Only output the language bit if it's not zero
-			if language != 0:
-				current["control"]["language"] = language
-		
-		# Page cycle time. We ignore this for the time being 
-		elif line[:line.index(",")] == "CT":
-			if "control" not in current:
-				current["control"] = {}
-			current["control"]["cycleTime"] = line[line.index(",") + 1:]
-		#	print("Cycle Time: " + line[line.index(",") + 1:])
-		
-		# Fasttext! A lot of the exciting stuff can be ignored here
-		# as it's not implemented in .tti
-		elif line[:line.index(",")] == "FL":
-			fasttext = line[line.index(",") + 1:].split(',')
+			continue	# Skip straight on to the next character
+		
+		if character == "\x1b":	# Tell us that the next character is escaped
+			esc = True
+		elif not graphics:
+			unescapedPacket += character.translate(regionTable)
+		else:
+			unescapedPacket += character	# Pass other characters on through
+	
+	return unescapedPacket
+
+# Everything we need to keep track of while reading a .tti file
+class TTIReader:
+	__slots__ = ("filename", "output", "current", "newPage", "subpageCounter", "model", "profile")
+	
+	def __init__(self, filename, model=False, profile=None):
+		self.filename = filename
+		self.output = {"subpages":[]}
+		self.current = {"control":{"erasePage":False}}
+		self.newPage = True
+		self.subpageCounter = 0	# We only use this to check if the subcode makes sense
+		self.model = model	# Build pagemodel objects rather than dicts
+		self.profile = getProfile(profile)
+	
+	# Write out the current subpage (if it isn't empty) and start a fresh one
+	def nextSubpage(self):
+		if "packets" in self.current:
+			self.closeSubpage()
+			self.subpageCounter += 1
+		
+		self.current = {"control":{"erasePage":False}}
+	
+	def closeSubpage(self):
+		current = self.current
+		
+		if self.model:
+			# Rows go straight into their place, so there's nothing to sort
+			self.output["subpages"].append(Subpage.fromPackets(current["packets"], current.get("control"), current.get("subcode")))
+		else:
+			current["packets"] = sorted(current["packets"],key = lambda d: d['number'])
+			self.output["subpages"].append(current)
+	
+	def addPacket(self, packet):
+		if "packets" in self.current:
+			self.current["packets"].append(packet)
+		else:
+			self.current["packets"] = [packet]
+	
+	# Get the page number
+	def pageNumber(self, value):
+		page_number = value[:3]
+		if "number" in self.output:	# What if we already have a number for this page?
+			if self.output["number"] != str(page_number):	# Is this the same as what we have?
+				print("More than one page in this tti " + str(self.filename))	# Oh no, a weird page has appeared
+				exit()	# This will be a return later
+		else:
+			self.output["number"] = str(page_number)	# Otherwise, this is our page number now
+	
+	# Get the page subcode
+	def subcode(self, value):
+		# Subcode should only be defined if it's not what we would logically expect
+		if (self.subpageCounter + 1) != int(value):
+			self.current["subcode"] = str(value)
+	
+	# Get the page options
+	def pageStatus(self, value):
+		flags, language = parsePageStatus(value)
+		control = self.current.setdefault("control", {"erasePage":False})
+		
+		for flag in flags:
+			control[flag] = True
+		
+		# Only output the language bit if it's not zero
+		if language != 0:
+			control["language"] = language
+	
+	# Page cycle time. We ignore this for the time being
+	def cycleTime(self, value):
+		self.current.setdefault("control", {})["cycleTime"] = value
+	
+	# Fasttext! A lot of the exciting stuff can be ignored here
+	# as it's not implemented in .tti
+	def fastext(self, value):
+		self.addPacket({"number":27, "dc":0, "linking":{"pages":value.split(',')}})
+	
+	# Output Lines (packets)
+	# For the moment we only care about packets 0-25 - no level 2.5 here :(
+	def outputLine(self, value):
+		self.newPage = True
+		packet_number, packet_content = value.split(",", 1)
+		packet_number = int(packet_number)
+		
+		if (packet_number < 26) and (packet_number != 0):
+			unescapedPacket = unescapeRow(packet_content, self.profile.decodeTable)
 			
-			if "packets" in current:
-				current["packets"].append({"number":27, "dc":0, "linking":{"pages":fasttext}})
-			else:
-				current["packets"] = [{"number":27, "dc":0, "linking":{"pages":fasttext}}]
-		
-		# Output Lines (packets)
-		# For the moment we only care about packets 0-25 - no level 2.5 here :(
-		elif line[:line.index(",")] == "OL":
-			newPage = True
-			packet_number = int(line[line.index(",") + 1:line.index(",",3)])
-			packet_content = line[line.index(",",3) + 1:]
+			if unescapedPacket is None:
+				unescapedPacket = unescapeRowSlowly(packet_content, self.output, self.profile.decodeTable)
 			
-			if (packet_number < 26) and (packet_number != 0):
-				esc = False
-				unescapedPacket = ""
-				
-				graphics = False
-				
-				for position, character in enumerate(packet_content): # Un-escape the lines
-					
-					if esc:
-						esc = False
-						try:
-							unescapedPacket += chr(ord(character) - 0x40)	# Get the escaped character and subtract 0x40 to make it normal
-							
-							if ord(character) >= 0x51 and ord(character) <= 0x57:
-								graphics = True
-							elif ord(character) >= 0x40 and ord(character) <= 0x47:
-								graphics = False
-							
-						except:
-							print("loadTTI: error on page " + str(output["number"]) + " " + str(position) + " " + character)
-							continue
-						
-						continue	# Skip straight on to the next character
-					
-					if character == "":	# Tell us that the next character is escaped
-						esc = True
-					else:
-						if not graphics:
-							unescapedPacket += regionMapping.get(ord(character),character)
-						else:
-							unescapedPacket += character	# Pass other characters on through
-				
-				if "packets" in current:
-					current["packets"].append({"number":packet_number, "text":unescapedPacket})
-				else:
-					current["packets"] = [{"number":packet_number, "text":unescapedPacket}]
-		
-		# Meta isn't in the spec yet, officially
-		#elif line[:line.index(",")] == "DE":	# This isn't important, and has no bearing on the page
-		#	if "meta" in output:
-		#		output["meta"]["title"] = line[line.index(",") + 1:]
-		#	else:
-		#		output["meta"] = {"title":line[line.index(",") + 1:]}
-	
-	# Write out final subpage
-	if current:
-		if "packets" in current:
-			current["packets"]=sorted(current["packets"],key=lambda d: d['number'])
-			output["subpages"].append(current)	# If the current subpage isn't empty, write it to the output
-	
-	# This is a form of minification, which I've now decided will be taken care of elsewhere
-	#if len(output["subpages"]) == 1:	# If there's only one subpage
-	#	output = dict(**output, **output["subpages"][0])
-	#	del output["subpages"]
-	#	del output["subcode"]
-
-	return(output)
-
-# Export a standard teletext object to a .tti file
-def exportTTI(page):
-	page_number = page["number"]
-	output = []
+			self.addPacket({"number":packet_number, "text":unescapedPacket})
 	
-	page = teletextDeMinify(page)
+	def finish(self):
+		# Write out final subpage
+		if "packets" in self.current:
+			self.closeSubpage()
+		
+		profile = None if self.profile is getProfile() else self.profile.name	# Only say so if it's not the default
+		
+		if self.model:
+			return Page(self.output.get("number"), self.output["subpages"], profile=profile)
+		
+		if profile is not None:
+			self.output["profile"] = profile
+		
+		return self.output
+
+# What to do with each .tti command. Anything not in here (DE, DS, etc) has no bearing on the page
+ttiCommands = {
+	"PN":TTIReader.pageNumber,
+	"SC":TTIReader.subcode,
+	"PS":TTIReader.pageStatus,
+	"CT":TTIReader.cycleTime,
+	"FL":TTIReader.fastext,
+	"OL":TTIReader.outputLine
+}
+
+# If an "attribute" comes through after an OL, we assume this is a new page
+subpageCommands = frozenset(("PN","SC","PS","CT"))
+
+# Reads a .tti file into a standard teletext JSON object.
+# Note that this is not a "minified" object (no inheritance, etc)
+# With model=True you get a pagemodel.Page instead.
+# Rows are read in the national option of the profile you ask for (see charsets.py), Finnish unless you say otherwise.
+def loadTTI(filename, model=False, profile=None):
+	# Read in the file
+	with open(filename, "rb") as tti:
+		ttiContent = tti.read().decode('ascii','ignore')
+	
+	reader = TTIReader(filename, model, profile)
+	
+	for line in ttiContent.split("\n"):
+		command, comma, value = line.strip().partition(",")	# Remove any trailing whitespace, then split it up once
+		
+		if not comma:
+			continue
+		
+		handler = ttiCommands.get(command)
+		
+		if handler is None:
+			continue
+		
+		if command in subpageCommands and reader.newPage:
+			reader.nextSubpage()
+			reader.newPage = False	# Reset
+		
+		handler(reader, value)
+	
+	return reader.finish()
+
+# Templates we've already read in, by path: (modification time, page)
+templateCache = {}
+
+# Load a template page. Each .tti is only parsed once per run, unless it changes on disk in the meantime.
+# The page that comes back is shared with everyone else who asked for it, so don't change it:
+# take a copy of the bits you need with clonePackets() first.
+def loadTemplate(filename):
+	path = os.path.abspath(filename)
+	modified = os.stat(path).st_mtime_ns
+	
+	if path in templateCache and templateCache[path][0] == modified:
+		return templateCache[path][1]
+	
+	template = loadTTI(filename)
+	templateCache[path] = (modified, template)
+	
+	return template
+
+# Copy a packet list (usually from a template) so it can be changed.
+# Row text is never changed in place, only replaced, so the text itself is shared with the original
+# and only the small packet dict gets copied. Replacing a row's text in the copy leaves the original alone.
+def clonePackets(packets):
+	return [clonePacket(packet) for packet in packets]
+
+def clonePacket(packet):
+	if "linking" in packet:
+		return copy.deepcopy(packet)	# Fastext links are lists, which could be changed in place
+	
+	return dict(packet)
+
+# The page status (PS) word for a subpage's control, as used in .tti files
+def pageStatusWord(control, profile=None):
+	page_status = 0
+	page_status = set_bit(page_status,15) # Transmit page
+	
+	page_status |= getProfile(profile).statusBits() # Set the language to the page's national option
+	
+	if control is not None:
+		if "erasePage" in control and control["erasePage"] == True:
+			page_status = set_bit(page_status,14)
+		if "newsFlash" in control and control["newsFlash"] == True:
+			page_status = set_bit(page_status,0)
+		if "subtitle" in control and control["subtitle"] == True:
+			page_status = set_bit(page_status,1)
+		if "suppressHeader" in control and control["suppressHeader"] == True:
+			page_status = set_bit(page_status,2)
+		if "update" in control and control["update"] == True:
+			page_status = set_bit(page_status,3)
+		if "suppressPage" in control and control["suppressPage"] == True:
+			page_status = set_bit(page_status,5)
+		if "interruptedSequence" in control and control["interruptedSequence"] == True:
+			page_status = set_bit(page_status,4)
+		if "transmitPage" in control:
+			page_status = clear_bit(page_status,15)
+	
+	return page_status
+
+# Where exportTTI sends pages when it isn't told otherwise
+defaultSink = DirectorySink("teletext")
+
+# Whatever the default sink is by then, so it gets to write out its hashes
+def closeDefaultSink():
+	defaultSink.close()
+
+atexit.register(closeDefaultSink)
+
+# Escaping for .tti rows: control codes become ESC followed by the code + 0x40
+escapeTable = str.maketrans({code:"\x1b" + chr(code + 0x40) for code in range(0x20)})
+
+# Everything exportTTI found wrong with a page. True if the page was written, so it can be used just like the
+# True/False exportTTI used to return.
+class ExportReport:
+	__slots__ = ("number", "written", "issues", "changed")
+	
+	def __init__(self, number):
+		self.number = number
+		self.written = False
+		self.issues = []	# (subcode, row, problem, detail)
+		self.changed = None	# The (subpage, row) cells that changed (see differ.py), if the sink keeps track
+	
+	def add(self, subcode, row, problem, detail):
+		self.issues.append((subcode, row, problem, detail))
+	
+	def __bool__(self):
+		return self.written
+	
+	def __str__(self):
+		lines = ["P" + str(self.number) + ": " + str(len(self.issues)) + " problem(s)"]
+		
+		for subcode, row, problem, detail in self.issues:
+			where = ""
+			if subcode is not None:
+				where += " S" + str(subcode)
+			if row is not None:
+				where += " row " + str(row)
+			lines.append("  " + problem + where + ": " + detail)
+		
+		return "\n".join(lines)
+
+# Check a row before it's exported
+def validateRow(report, subcode, number, text):
+	if len(text) > 40:
+		report.add(subcode, number, "overlength", str(len(text)) + " characters - " + repr(text))
 	
-	if len(page["subpages"]) > 1:
+	if not text.isascii():
+		report.add(subcode, number, "unsafe", "".join(sorted(set(character for character in text if ord(character) >= 128))))
+
+# Export a standard teletext object (or a pagemodel.Page) to a .tti file, by way of a sink (see sinks.py) - teletext/ unless told otherwise.
+# Unless skipUnchanged is turned off, pages that haven't changed since the last export aren't written at all.
+# Only pages that really have changed get the update bit set.
+# Returns an ExportReport, which is True if the page was written. Any problems are logged once, all together.
+def exportTTI(page, skipUnchanged=True, sink=None):
+	if sink is None:
+		sink = defaultSink
+	
+	profile = pageProfile(page)
+	
+	if isinstance(page, Page):
+		page_number = page.number
+		subpages = page.subpages
+		pageControl = page.control
+	else:
+		page_number = page["number"]
+		page = teletextDeMinify(page)
+		subpages = page["subpages"]
+		pageControl = page.get("control")
+	
+	report = ExportReport(page_number)
+	output = []
+	statusLines = []	# Where the PS lines are, so we can set the update bit once we know if anything changed
+	headerLines = []	# Where the headers are, so the time doesn't count as a change
+	
+	if len(subpages) > 1:
 		subcodeOffset = 1
 	else:
 		subcodeOffset = 0
 	
-	for guessed_subcode, subpage in enumerate(page["subpages"]):
-		if "subcode" in subpage:
-			subcode = subpage["subcode"]
+	for guessed_subcode, subpage in enumerate(subpages):
+		if isinstance(subpage, Subpage):
+			subcode = subpage.subcode
+			control = subpage.control
+			packets = subpage.entries()
 		else:
+			subcode = subpage.get("subcode")
+			control = subpage.get("control")
+			packets = ((packet["number"], packet.get("text"), packet.get("linking")) for packet in subpage["packets"])
+		
+		if subcode is None:
 			subcode = str(guessed_subcode + subcodeOffset).zfill(4)
 		
 		if int(subcode) > 99:
-			print("This page has more than 99 subpages. For our purposes, .tti doesn't support that")
-			return False;
+			report.add(None, None, "subpages", "more than 99 subpages. For our purposes, .tti doesn't support that")
+			return finishReport(report)
 		
 		output.append("PN," + str(page_number) + subcode[2:])
 		output.append("SC," + str(subcode))
 		
-		if "control" not in subpage:
-			if "control" in page:
-				subpage["control"] = page["control"]
-		
-		page_status = 0
-		page_status = set_bit(page_status,15) # Transmit page
-		
-		page_status = set_bit(page_status,8) # Set language to Swedish/Finnish
-		
-		if "control" in subpage:
-			if "erasePage" in subpage["control"] and subpage["control"]["erasePage"] == True:
-				page_status = set_bit(page_status,14)
-			if "newsFlash" in subpage["control"] and subpage["control"]["newsFlash"] == True:
-				page_status = set_bit(page_status,0)
-			if "subtitle" in subpage["control"] and subpage["control"]["subtitle"] == True:
-				page_status = set_bit(page_status,1)
-			if "suppressHeader" in subpage["control"] and subpage["control"]["suppressHeader"] == True:
-				page_status = set_bit(page_status,2)
-			if "update" in subpage["control"] and subpage["control"]["update"] == True:
-				page_status = set_bit(page_status,3)
-			if "suppressPage" in subpage["control"] and subpage["control"]["suppressPage"] == True:
-				page_status = set_bit(page_status,5)
-			if "interruptedSequence" in subpage["control"] and subpage["control"]["interruptedSequence"] == True:
-				page_status = set_bit(page_status,4)
-			if "cycleTime" in subpage["control"]:
-				output.append("CT," + subpage["control"]["cycleTime"])
-			if "transmitPage" in subpage["control"]:
-				page_status = clear_bit(page_status,15)
-		
-		page_status = set_bit(page_status,3)
+		if control is None:
+			control = pageControl
+		
+		page_status = pageStatusWord(control, profile)
 		
+		if control is not None and "cycleTime" in control:
+			output.append("CT," + control["cycleTime"])
+		
+		statusLines.append((len(output), page_status))
 		output.append("PS," + hex(page_status)[2:])
 		
-		output.append("OL,0,        " + chr(27) + "ECIMS" + chr(27) + "B" + "" + chr(27) + "F" + str(page_number) + chr(27) + "A" + str(int(time.time())))
+		headerLines.append(len(output))
+		output.append("OL,0,        " + chr(27) + "ECIMS" + chr(27) + "B" + "" + chr(27) + "F" + str(page_number) + chr(27) + "A")
 		
-		for packet in subpage["packets"]:
-			if "text" in packet:
-				if packet["number"] > 0 and packet["number"] < 27:
-					escapedPacket = ""
-					if len(packet["text"]) > 40:
-						print("P" + page_number + " Packet longer than 40 bytes - " + packet["text"])
-					for character in packet["text"]:
-						if ord(character) < 0x20:
-							escapedPacket = escapedPacket + chr(27) + chr(ord(character) + 0x40)
-						else:
-							escapedPacket = escapedPacket + character
-						
-						if ord(character) >=128:
-							print("Unsafe Character on P" + str(page_number) + " S" + str(subcode))
-						
-					output.append("OL," + str(packet["number"]) + "," + escapedPacket)
+		for number, text, linking in packets:
+			if text is not None:
+				if number > 0 and number < 27:
+					validateRow(report, subcode, number, text)
+					output.append("OL," + str(number) + "," + text.translate(escapeTable))
 			
-			if "linking" in packet:
-				if packet["number"] != 27:
-					print("Unexpected linking packet")
-					return False
+			if linking is not None:
+				if number != 27:
+					report.add(subcode, number, "linking", "unexpected linking packet")
+					return finishReport(report)
 					
 				fasttext = "FL"
 				
-				if "pages" in packet["linking"]:
-					for link in packet["linking"]["pages"]:
+				if "pages" in linking:
+					for link in linking["pages"]:
 						#if link in navigationLinks:
 						#	link = navigationLinks[link]
 						
@@ -334,111 +556,174 @@ def exportTTI(page):
 					
 					output.append(fasttext)
 	
-	filename = "teletext/P" + str(page_number) + ".tti"
+	name = sink.pageName(page_number)
+	
+	# Everything but the time in the header goes into the hash
+	contentHash = hashlib.sha1("\n".join(output).encode('utf-8')).hexdigest()
+	changed = sink.lastHash(name) != contentHash
+	
+	if skipUnchanged and not changed:
+		report.changed = set()
+		return finishReport(report)
+	
+	if changed:
+		for position, page_status in statusLines:
+			output[position] = "PS," + hex(set_bit(page_status,3))[2:]	# Tell the decoder this page has been updated
+	
+	timestamp = str(int(time.time()))
+	for position in headerLines:
+		output[position] += timestamp
 	
-	with open(filename, 'w') as f:
-		for line in output:
-			f.write("%s\r\n" % line)
+	output.append("")	# Every line ends in CRLF, including the last one
+	sink.write(name, "\r\n".join(output).encode('utf-8'), contentHash)
+	
+	report.written = True
+	report.changed = sink.rowChanges(name, page)
+	return finishReport(report)
+
+def finishReport(report):
+	if report.issues:
+		logging.warning(str(report))
+	
+	return report
+
+# Put a subpage counter ("1/5") on a row
+def counterRow(text, counter, offset, align):
+	if align == "right":
+		# First, pad the string to 40 chars. There's nothing in the spec to say this will be done for us
+		# Cut the string to length and add the counter onto the end
+		# ToDo: if the offset is large enough, add the end of the string back on again?
+		return (text or "").ljust(40)[:(40 - (len(counter) + offset))] + counter
+	elif align == "left":
+		# Here the offset is added to the left as spaces.
+		# ToDo: again, we should just add the left part of the packet if there's too much offset
+		if text is None:
+			return (" " * offset) + counter
+		return (" " * offset) + counter + text.ljust(40)[((len(counter) + offset)):]
+	
+	return text
 
 #	How about an out-of-band flag, like a meta tag or something, to signal when this should be done!?
+# Numbers every subpage of a page (dict or pagemodel.Page) in place, in one pass.
 def numberSubpage(page, row=20, offset=1, prefix=chr(7), align="right"):
-	if "subpages" not in page:
+	if isinstance(page, Page):
+		subpages = page.subpages
+	elif "subpages" in page:
+		subpages = page["subpages"]
+	else:
 		return page
 	
-	totalSubpages = len(page["subpages"])
+	totalSubpages = len(subpages)
 	
 	if totalSubpages < 2:
 		return page
 	
-	output = {"subpages":[]}
-	
 	# Now this is an Assumption. Assumptions are BAD, but I think we can get away with it here.
 	# For now, at least.
 	# We are going to number the subpages in the exact order they are presented, and ignore the specified subcode.
 	# Why? Well, almost no subpages will have a strict subcode defined - and those that do probably will be numbered by order anyway.
 	
-	for guessed_subcode, subpage in enumerate(page["subpages"]):
+	for guessed_subcode, subpage in enumerate(subpages):
 		# Let's go ahead and generate the actual count now, since it will almost always be needed no matter what happens below.
 		counter = prefix + str((guessed_subcode + 1)) + "/" + str(totalSubpages)
-		counterLen = len(counter)
 		
 		if totalSubpages > 9 and offset > 0 and align == "right":
 			offset -= 1
 		
-		positionInList = next((i for i, packet in enumerate(subpage["packets"]) if packet["number"] == row), None)
-		
-		if positionInList is not None:
-			# This should be impossible:
-			if subpage["packets"][positionInList]["number"] != row:
-				print("desolate screaming noises")	# hence
-				return page
-			
-			# OK, we have a row. Now to figure out how to splice the bits together.
-			if align == "right":
-				# First, pad the string to 40 chars. There's nothing in the spec to say this will be done for us
-				# Cut the string to length and add the counter onto the end
-				# ToDo: if the offset is large enough, add the end of the string back on again?
-				subpage["packets"][positionInList]["text"] = subpage["packets"][positionInList]["text"].ljust(40)[:(40 - (counterLen + offset))] + counter
-			elif align == "left":
-				# Here the offset is added to the left as spaces.
-				# ToDo: again, we should just add the left part of the packet if there's too much offset
-				subpage["packets"][positionInList]["text"] = (" " * offset) + counter + subpage["packets"][positionInList]["text"].ljust(40)[((counterLen + offset)):]
-		
-		else:
-			if align == "right":
-				subpage["packets"].append({"number":row, "text":(" " * (40 - (counterLen + offset))) + counter})
-			elif align == "left":
-				subpage["packets"].append({"number":row, "text":(" " * offset) + counter})
+		if isinstance(subpage, Subpage):
+			text = counterRow(subpage[row], counter, offset, align)
+			if text is not None:
+				subpage[row] = text
+			continue
 		
-		output["subpages"].append(subpage)
+		packet = next((packet for packet in subpage["packets"] if packet["number"] == row), None)
 		
+		if packet is not None:
+			# OK, we have a row. Now to figure out how to splice the bits together.
+			packet["text"] = counterRow(packet["text"], counter, offset, align)
+		elif align == "right" or align == "left":
+			subpage["packets"].append({"number":row, "text":counterRow(None, counter, offset, align)})
 	
 	return page
 
+# Are these two pages the same? See differ.py if you need to know which rows changed.
 def comparison(pageA,pageB,debug=False):
-	pageA = teletextDeMinify(pageA)
-	pageB = teletextDeMinify(pageB)
+	changed = diffPages(pageA, pageB)
 	
-	if len(pageA["subpages"]) != len(pageB["subpages"]):
+	if changed:
+		if debug:
+			print("Change detected! " + ", ".join("S" + str(subpage + 1) + " row " + str(row) for subpage, row in sorted(changed)))
 		return False
 	
-	for A, B in zip(pageA["subpages"],pageB["subpages"]):
-		A = sorted(A["packets"], key=lambda d: d['number'])
-		B = sorted(B["packets"], key=lambda d: d['number'])
-		
-		if A != B:
-			if debug:
-				print("Change detected!")
-				with open('debugA.json', 'w', encoding='utf-8') as f:
-					json.dump(A, f, ensure_ascii=False, indent=4)
-				with open('debugB.json', 'w', encoding='utf-8') as f:
-					json.dump(B, f, ensure_ascii=False, indent=4)
-			return False
-	
 	return True
 
+# The rows of an overlay block as 40 column strings, by row number (1 is the top of the block)
+def overlayRows(overlay):
+	rows = {}
+	
+	if isinstance(overlay, Subpage):
+		for row in overlay:
+			rows[row.number] = row.columns()
+		return rows
+	
+	for packet in overlay:
+		if packet["number"] not in rows:	# The first one wins
+			rows[packet["number"]] = packet["text"].ljust(40," ")
+	
+	return rows
+
+def overlayRow(text, overlayText, startx, endx):
+	return text.ljust(40," ")[:startx] + overlayText[:(endx-startx)] + text[endx:]
+
+# Overlay rows 1 onwards of a block onto rows starty to endy of a packet list or a pagemodel.Subpage, between columns startx and endx.
+# Neither the source nor the overlay is changed: you get a copy, which shares any rows that weren't touched.
 def blockOverlay(rawSource,overlay,startx,starty,endx,endy,align="centre"):
-	source = copy.deepcopy(rawSource)
+	if isinstance(rawSource, Subpage):
+		source = rawSource.copy()
+	else:
+		source = list(rawSource)
 	
 	if startx > endx or starty > endy:
 		print("blockOverlay: Grid input fault")
 		return source
 	
+	placeOverlay(source, overlayRows(overlay), startx, starty, endx, endy)
+	return source
+
+# Overlay the same block onto every subpage of a page (dict or pagemodel.Page) in one go, in place.
+# The overlay is only worked out once, however many subpages there are.
+def pageOverlay(page,overlay,startx,starty,endx,endy):
+	if startx > endx or starty > endy:
+		print("pageOverlay: Grid input fault")
+		return page
+	
+	rows = overlayRows(overlay)
+	
+	for subpage in (page.subpages if isinstance(page, Page) else page["subpages"]):
+		placeOverlay(subpage if isinstance(subpage, Subpage) else subpage["packets"], rows, startx, starty, endx, endy)
+	
+	return page
+
+# Does the actual overlaying, in place. Row text is replaced, never changed, so copies made with clonePackets are safe
+def placeOverlay(source, rows, startx, starty, endx, endy):
+	blank = " " * 40
+	
+	if isinstance(source, Subpage):
+		for itNum,rowNum in enumerate(range(starty,endy+1)):
+			source[rowNum] = overlayRow(source[rowNum] or blank, rows.get(itNum+1, blank), startx, endx)
+		return
+	
+	positions = {}
+	for position, packet in enumerate(source):
+		positions.setdefault(packet["number"], position)	# The first one wins
+	
 	for itNum,rowNum in enumerate(range(starty,endy+1)):
-		positionInSourceList = next((i for i, packet in enumerate(source) if packet["number"] == rowNum), None)
-		positionInOverlayList = next((i for i, packet in enumerate(overlay) if packet["number"] == itNum+1), None)
+		text = overlayRow(source[positions[rowNum]]["text"] if rowNum in positions else blank, rows.get(itNum+1, blank), startx, endx)
 		
-		if positionInSourceList == None:
-			source.append({"number":rowNum,"text":"                                        "})
-			positionInSourceList = next((i for i, packet in enumerate(source) if packet["number"] == rowNum), None)
-		
-		if positionInOverlayList == None:
-			overlay.append({"number":itNum+1,"text":"                                        "})
-			positionInOverlayList = next((i for i, packet in enumerate(overlay) if packet["number"] == itNum+1), None)
-		
-		source[positionInSourceList]["text"] = (source[positionInSourceList]["text"].ljust(40," ")[:startx] + overlay[positionInOverlayList]["text"].ljust(40," ")[:(endx-startx)] + source[positionInSourceList]["text"][endx:])
-	
-	return source
+		if rowNum in positions:
+			source[positions[rowNum]] = dict(source[positions[rowNum]], text=text)
+		else:
+			source.append({"number":rowNum,"text":text})
 
 #print(blockOverlay(testPacketList,overlayBlock,8,5,39,5))
 
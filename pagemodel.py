@@ -0,0 +1,178 @@
+# Page object model for CIMS
+# The dict format ({"subpages":[{"packets":[{"number":..,"text":..}]}]}) is easy to build by hand, but finding a row
+# means scanning the whole packet list. These classes hold the same page with each subpage's rows in a 26-entry
+# array indexed by row number, so getting at a row is a list index.
+#
+# Page.fromDict() and Page.toDict() convert to and from the dict format. loadTTI(filename, model=True),
+# exportTTI and pageLegaliser all take these directly.
+
+rowCount = 26	# Rows 0 to 25
+rowWidth = 40
+
+# One row of a subpage. Treat these as read-only: to change a row, give the subpage new text for it
+# (subpage[number] = text), which means a copied subpage can share rows with the one it was copied from.
+class Row:
+	__slots__ = ("number", "text")
+
+	def __init__(self, number, text):
+		self.number = number
+		self.text = text
+
+	# The row as it's displayed: exactly 40 columns
+	def columns(self):
+		return self.text.ljust(rowWidth)[:rowWidth]
+
+	def toDict(self):
+		return {"number":self.number, "text":self.text}
+
+	def __eq__(self, other):
+		return isinstance(other, Row) and self.number == other.number and self.text == other.text
+
+	def __repr__(self):
+		return "Row(" + repr(self.number) + ", " + repr(self.text) + ")"
+
+class Subpage:
+	__slots__ = ("rows", "enhancements", "links", "control", "subcode", "inherit")
+
+	def __init__(self, control=None, subcode=None, inherit=None):
+		self.rows = [None] * rowCount
+		self.enhancements = []	# The text of each X/26 packet, in order
+		self.links = None	# Fastext page links from an FL line
+		self.control = control	# None means use the page's control
+		self.subcode = subcode	# None means work it out from the subpage's position
+		self.inherit = inherit
+
+	@classmethod
+	def fromPackets(cls, packets, control=None, subcode=None, inherit=None):
+		subpage = cls(control, subcode, inherit)
+		subpage.place(packets)
+		return subpage
+
+	# The text of a row, or None if the subpage doesn't have one
+	def __getitem__(self, number):
+		row = self.rows[number]
+		return None if row is None else row.text
+
+	def __setitem__(self, number, text):
+		self.rows[number] = Row(number, text)
+
+	def __delitem__(self, number):
+		self.rows[number] = None
+
+	def __contains__(self, number):
+		return 0 <= number < rowCount and self.rows[number] is not None
+
+	# Every row we have, in order
+	def __iter__(self):
+		for row in self.rows:
+			if row is not None:
+				yield row
+
+	# Add a packet, either a Row or a packet dict like the ones toTeletextBlock makes.
+	# A later packet for the same row replaces an earlier one, just like it would on screen.
+	def add(self, packet):
+		if isinstance(packet, Row):
+			self.rows[packet.number] = packet
+			return
+
+		number = packet["number"]
+
+		if "linking" in packet:
+			if number != 27:
+				raise ValueError("Subpage: unexpected linking packet on row " + str(number))
+			self.links = list(packet["linking"].get("pages", []))
+		elif number == 26:
+			self.enhancements.append(packet["text"])
+		elif 0 <= number < rowCount:
+			self.rows[number] = Row(number, packet["text"])
+		else:
+			raise ValueError("Subpage: can't hold packet " + str(number))
+
+	# Add a whole list of packets, such as the output of toTeletextBlock
+	def place(self, packets):
+		for packet in packets:
+			self.add(packet)
+		return self
+
+	# Every packet as (number, text, linking), in the order pageLegaliser has always left them in:
+	# rows, then fastext, then enhancements
+	def entries(self):
+		for row in self.rows:
+			if row is not None:
+				yield (row.number, row.text, None)
+
+		if self.links is not None:
+			yield (27, None, {"pages":self.links})
+
+		for enhancement in self.enhancements:
+			yield (26, enhancement, None)
+
+	# A copy that shares its rows with this one. Setting a row on either only changes that one.
+	def copy(self):
+		subpage = Subpage(self.control, self.subcode, self.inherit)
+		subpage.rows = self.rows[:]
+		subpage.enhancements = self.enhancements[:]
+		subpage.links = None if self.links is None else self.links[:]
+		return subpage
+
+	def toDict(self):
+		packets = [row.toDict() for row in self.rows if row is not None]
+
+		if self.links is not None:
+			packets.append({"number":27, "dc":0, "linking":{"pages":self.links[:]}})
+
+		packets += [{"number":26, "text":enhancement} for enhancement in self.enhancements]
+
+		output = {"packets":packets}
+
+		if self.control is not None:
+			output["control"] = self.control
+		if self.subcode is not None:
+			output["subcode"] = self.subcode
+		if self.inherit is not None:
+			output["inherit"] = self.inherit
+
+		return output
+
+class Page:
+	__slots__ = ("number", "subpages", "control", "profile")
+
+	def __init__(self, number, subpages=None, control=None, profile=None):
+		self.number = number
+		self.subpages = [] if subpages is None else subpages
+		self.control = control
+		self.profile = profile	# Character set profile name (see charsets.py), None for the default
+
+	# Build a page from the dict format. Global packets are inherited the same way teletextDeMinify does it,
+	# enhancements included, so a Page is always fully formed.
+	@classmethod
+	def fromDict(cls, page):
+		output = cls(page.get("number"), control=page.get("control"), profile=page.get("profile"))
+		globalPackets = page.get("packets", [])
+
+		for subpage in page.get("subpages") or [{"packets":[]}]:
+			inherit = subpage.get("inherit")
+			converted = Subpage.fromPackets(subpage.get("packets", []), subpage.get("control"), subpage.get("subcode"), inherit)
+
+			if inherit is None or inherit:
+				for packet in globalPackets:
+					number = packet["number"]
+					if (number < rowCount and converted.rows[number] is None) or (number == 26 and not converted.enhancements) or (number == 27 and converted.links is None):
+						converted.add(packet)
+
+			output.subpages.append(converted)
+
+		return output
+
+	def toDict(self):
+		output = {"number":self.number, "subpages":[subpage.toDict() for subpage in self.subpages]}
+
+		if self.control is not None:
+			output["control"] = self.control
+		if self.profile is not None:
+			output["profile"] = self.profile
+
+		return output
+
+	def copy(self):
+		return Page(self.number, [subpage.copy() for subpage in self.subpages], self.control, self.profile)
@@ -6,12 +6,11 @@ from selenium.webdriver.chrome.options import Options
 from datetime import datetime
 import json
 import time
-import copy
 import os
 
 # Import teletext modules
 from textBlock import toTeletextBlock
-from page import exportTTI, loadTTI
+from page import exportTTI, loadTemplate, clonePackets
 from legaliser import pageLegaliser
 
 # Finse dag- en maandnamen
@@ -230,7 +229,7 @@ class YleRadioScraper:
         
         try:
             # Load template
-            pageTemplate = loadTTI(template_file)
+            pageTemplate = loadTemplate(template_file)
             
             # Create teletext page met subpages
             teletextPage = {
@@ -246,7 +245,7 @@ class YleRadioScraper:
             # Start op regel 5 (na header)
             current_line = 5
             current_subpage = {
-                "packets": copy.deepcopy(pageTemplate["subpages"][0]["packets"])
+                "packets": clonePackets(pageTemplate["subpages"][0]["packets"])
             }
             
             # Vervang datum placeholders
@@ -287,7 +286,7 @@ class YleRadioScraper:
                     
                     # Start nieuwe subpage
                     current_subpage = {
-                        "packets": copy.deepcopy(pageTemplate["subpages"][0]["packets"])
+                        "packets": clonePackets(pageTemplate["subpages"][0]["packets"])
                     }
                     
                     # Vervang datum placeholders in nieuwe subpage
@@ -0,0 +1,204 @@
+# Output sinks for CIMS
+# exportTTI builds each page as bytes and hands it to a sink, which decides where it actually goes.
+#
+#	DirectorySink	a directory of .tti files, for vbit2 (this is what you get by default)
+#	MemorySink	a dict of bytes, for tests, benchmarks and dry runs
+#	BundleSink	a single zip or tar of the whole service
+#	TeeSink	several of the above at once, from one render
+#
+# Sinks also remember a content hash for each page they were given, so exportTTI can leave unchanged pages alone.
+# A DirectorySink also keeps the row hashes of every page (differ.RowIndex), so exportTTI can say which rows of
+# a page changed. It only writes its hashes out when it's flushed or closed (page.py closes the default one at exit).
+
+import abc, io, json, os, tarfile, tempfile, time, zipfile
+
+# Write a file so that anyone reading it (vbit2!) sees either the old version or the new one, never half of each
+def writeAtomically(filename, data):
+	fd, temporary = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", prefix=".", suffix=".tmp")
+
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			f.write(data)
+
+		os.chmod(temporary, 0o644)
+		os.replace(temporary, filename)
+	except:
+		os.unlink(temporary)
+		raise
+
+class Sink(abc.ABC):
+	def __init__(self, prefix="P", suffix=".tti"):
+		self.prefix = prefix
+		self.suffix = suffix
+
+	# What a page is called inside this sink
+	def pageName(self, number):
+		return self.prefix + str(number) + self.suffix
+
+	# The content hash of the last version of this page we were given, or None if we don't know
+	def lastHash(self, name):
+		return None
+
+	@abc.abstractmethod
+	def write(self, name, data, contentHash=None):
+		pass
+
+	# The (subpage, row) cells of a page that changed since the last version this sink was given,
+	# or None if the sink doesn't keep track
+	def rowChanges(self, name, page):
+		return None
+
+	# Make sure everything written so far is where it's going. The sink can still be written to afterwards.
+	def flush(self):
+		pass
+
+	def close(self):
+		self.flush()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+# A directory of .tti files. The hashes of the last export are kept next to them, in .hashes.json,
+# and the row hashes in .rows.json
+class DirectorySink(Sink):
+	def __init__(self, directory="teletext", prefix="P", suffix=".tti"):
+		Sink.__init__(self, prefix, suffix)
+		self.directory = directory
+		self.hashFile = os.path.join(directory, ".hashes.json")
+		self.hashes = None	# Loaded the first time we need them
+		self.dirty = False	# Whether hashes has changed since it was last written out
+		self.rows = None	# The RowIndex, also loaded the first time we need it
+		self.rowsDirty = False
+
+	def loadHashes(self):
+		if self.hashes is None:
+			try:
+				with open(self.hashFile, encoding='utf-8') as f:
+					self.hashes = json.load(f)
+			except (OSError, ValueError):
+				self.hashes = {}
+
+		return self.hashes
+
+	def lastHash(self, name):
+		if not os.path.exists(os.path.join(self.directory, name)):
+			return None	# Somebody's deleted it, so whatever we think we wrote isn't there any more
+
+		return self.loadHashes().get(name)
+
+	def write(self, name, data, contentHash=None):
+		writeAtomically(os.path.join(self.directory, name), data)
+
+		if contentHash is not None:
+			self.loadHashes()[name] = contentHash
+			self.dirty = True
+
+	def rowChanges(self, name, page):
+		if self.rows is None:
+			from differ import RowIndex	# Not at the top: differ uses writeAtomically from here
+			self.rows = RowIndex(os.path.join(self.directory, ".rows.json"))
+
+		self.rowsDirty = True
+		return self.rows.update(page, name)
+
+	def flush(self):
+		if self.dirty:
+			writeAtomically(self.hashFile, json.dumps(self.hashes, sort_keys=True).encode('utf-8'))
+			self.dirty = False
+
+		if self.rowsDirty:
+			self.rows.save()
+			self.rowsDirty = False
+
+# Keeps every page in memory as bytes, in .pages
+class MemorySink(Sink):
+	def __init__(self, prefix="P", suffix=".tti"):
+		Sink.__init__(self, prefix, suffix)
+		self.pages = {}
+		self.hashes = {}
+
+	def lastHash(self, name):
+		return self.hashes.get(name)
+
+	def write(self, name, data, contentHash=None):
+		self.pages[name] = bytes(data)
+
+		if contentHash is not None:
+			self.hashes[name] = contentHash
+
+# Collects a complete snapshot of the service and writes it out as one zip or tar file when closed.
+# A snapshot has to contain every page, so this never lets exportTTI skip one.
+class BundleSink(Sink):
+	def __init__(self, filename, format=None, prefix="P", suffix=".tti"):
+		Sink.__init__(self, prefix, suffix)
+
+		if format is None:
+			format = "zip" if filename.endswith(".zip") else "tar"
+
+		if format not in ("zip", "tar"):
+			raise ValueError("BundleSink: unknown format " + str(format))
+
+		self.filename = filename
+		self.format = format
+		self.pages = {}
+
+	def write(self, name, data, contentHash=None):
+		self.pages[name] = bytes(data)
+
+	def close(self):
+		buffer = io.BytesIO()
+
+		if self.format == "zip":
+			with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+				for name in sorted(self.pages):
+					bundle.writestr(name, self.pages[name])
+		else:
+			with tarfile.open(fileobj=buffer, mode="w:gz" if self.filename.endswith("gz") else "w") as bundle:
+				now = time.time()
+				for name in sorted(self.pages):
+					info = tarfile.TarInfo(name)
+					info.size = len(self.pages[name])
+					info.mtime = now
+					info.mode = 0o644
+					bundle.addfile(info, io.BytesIO(self.pages[name]))
+
+		writeAtomically(self.filename, buffer.getvalue())
+
+# Sends every page to several sinks, so one render can serve more than one output
+class TeeSink(Sink):
+	def __init__(self, *sinks):
+		Sink.__init__(self)
+		self.sinks = sinks
+
+	# Each sink can call its pages whatever it likes, so we pass the page number through and let them decide
+	def pageName(self, number):
+		return str(number)
+
+	# A page can only be skipped if every sink already has it
+	def lastHash(self, name):
+		hashes = set(sink.lastHash(sink.pageName(name)) for sink in self.sinks)
+
+		if len(hashes) == 1:
+			return hashes.pop()
+
+		return None
+
+	def write(self, name, data, contentHash=None):
+		for sink in self.sinks:
+			sink.write(sink.pageName(name), data, contentHash)
+
+	# From the first sink that keeps track, but every sink that does gets to see the page
+	def rowChanges(self, name, page):
+		changes = [sink.rowChanges(sink.pageName(name), page) for sink in self.sinks]
+		return next((changed for changed in changes if changed is not None), None)
+
+	def flush(self):
+		for sink in self.sinks:
+			sink.flush()
+
+	def close(self):
+		for sink in self.sinks:
+			sink.close()
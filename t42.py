@@ -0,0 +1,231 @@
+#!/usr/bin/python3
+
+# T42 packet encoder for CIMS
+# Turns pages straight into the 42 byte packets that actually go out in the VBI, so we don't need
+# vbit2 to read our .tti files back in to get there. Pages should have been through pageLegaliser first.
+#
+# For each subpage we send:
+#	row 0	the header, with the page number, subcode and control bits from the page status word
+#	rows 1-25	the display rows, with odd parity
+#	X/26	the enhancement packets pageLegaliser made with write_enhancements
+#	X/27/0	the fastext links from the FL line
+#
+# Everything that can be worked out ahead of time (Hamming codes, parity) is, when this module is imported.
+#
+#	python t42.py -o service.t42 teletext/*.tti
+#	python t42.py teletext/P100.tti | some-inserter
+
+import argparse, sys, time
+
+from page import loadTTI, pageStatusWord
+from charsets import pageProfile
+from pagemodel import Page
+
+packetSize = 42
+
+# Hamming 8/4: one byte for each nibble
+hamming84 = bytes((0x15, 0x02, 0x49, 0x5e, 0x64, 0x73, 0x38, 0x2f, 0xd0, 0xc7, 0x8c, 0x9b, 0xa1, 0xb6, 0xfd, 0xea))
+
+# Odd parity on the bottom seven bits of every byte, ready for bytes.translate()
+def oddParity(byte):
+	byte &= 0x7f
+	return byte | (0x80 if bin(byte).count("1") % 2 == 0 else 0)
+
+parityTable = bytes(oddParity(byte) for byte in range(256))
+
+# Hamming 24/18, the slow way. Only used to build the tables below.
+# Bit n of the result is bit Bn+1 of the spec: P1 P2 D1 P3 D2 D3 D4 P4 D5-D11 P5 D12-D18 P6
+hamming2418Data = (2, 4, 5, 6, 8, 9, 10, 11, 12, 13, 14, 16, 17, 18, 19, 20, 21, 22)
+hamming2418Parity = ((0, 1), (1, 2), (3, 4), (7, 8), (15, 16))	# (position, the positions it covers have that bit set)
+
+def encodeHamming2418(value):
+	word = 0
+	for bit, position in enumerate(hamming2418Data):
+		if value & (1 << bit):
+			word |= 1 << position
+
+	for position, mask in hamming2418Parity:
+		covered = sum(1 for other in range(23) if (other + 1) & mask and word & (1 << other))
+		if covered % 2 == 0:
+			word |= 1 << position	# Odd parity
+
+	if bin(word).count("1") % 2 == 0:
+		word |= 1 << 23
+
+	return word
+
+# Hamming 24/18 is linear apart from a constant (the odd parity), so a triplet is three lookups, one
+# for each six bits, XORed together with the constant
+hamming2418Constant = encodeHamming2418(0)
+hamming2418Tables = tuple(tuple(encodeHamming2418(value << shift) ^ hamming2418Constant for value in range(64)) for shift in (0, 6, 12))
+
+def hamming2418(value):
+	low, middle, high = hamming2418Tables
+	return low[value & 0x3f] ^ middle[(value >> 6) & 0x3f] ^ high[(value >> 12) & 0x3f] ^ hamming2418Constant
+
+# Magazine and row address
+def packetAddress(magazine, row):
+	return hamming84[(magazine & 7) | ((row & 1) << 3)], hamming84[row >> 1]
+
+# "8ff" -> (magazine, page)
+def splitPageNumber(number):
+	number = int(str(number), 16)
+	return (number >> 8) & 7, number & 0xff
+
+# Header control bits from the page status word (vbit2 has the same layout)
+def headerControl(status):
+	return (
+		(status >> 14) & 1,	# C4 erase page
+		status & 1,	# C5 newsflash
+		(status >> 1) & 1,	# C6 subtitle
+		(status >> 2) & 1,	# C7 suppress header
+		(status >> 3) & 1,	# C8 update
+		(status >> 4) & 1,	# C9 interrupted sequence
+		(status >> 5) & 1,	# C10 inhibit display
+		(status >> 6) & 1,	# C11 magazine serial
+		(status >> 7) & 7	# C12-C14 national option
+	)
+
+def rowBytes(text):
+	return text.encode('latin-1', 'replace')[:40].ljust(40, b" ").translate(parityTable)
+
+def headerText(number):
+	return ("\x05CIMS\x02\x06" + str(number) + "\x01" + time.strftime("%d.%m. %H:%M/%S"))[:32].ljust(32)
+
+def writeHeader(packet, offset, magazine, pageNumber, subcode, status, text):
+	erase, newsflash, subtitle, suppressHeader, update, interrupted, inhibit, serial, language = headerControl(status)
+
+	packet[offset], packet[offset + 1] = packetAddress(magazine, 0)
+	packet[offset + 2] = hamming84[pageNumber & 0xf]
+	packet[offset + 3] = hamming84[pageNumber >> 4]
+	packet[offset + 4] = hamming84[subcode & 0xf]
+	packet[offset + 5] = hamming84[((subcode >> 4) & 0x7) | (erase << 3)]
+	packet[offset + 6] = hamming84[(subcode >> 8) & 0xf]
+	packet[offset + 7] = hamming84[((subcode >> 12) & 0x3) | (newsflash << 2) | (subtitle << 3)]
+	packet[offset + 8] = hamming84[suppressHeader | (update << 1) | (interrupted << 2) | (inhibit << 3)]
+	packet[offset + 9] = hamming84[serial | (language << 1)]
+	packet[offset + 10:offset + packetSize] = rowBytes(text)[:32]
+
+# One X/26 packet from write_enhancements: a designation code then thirteen triplets of 6 bit characters
+def writeEnhancement(packet, offset, magazine, text):
+	packet[offset], packet[offset + 1] = packetAddress(magazine, 26)
+	packet[offset + 2] = hamming84[(ord(text[0]) - 0x40) & 0xf]
+
+	position = offset + 3
+	for triplet in range(13):
+		characters = text[1 + triplet * 3:4 + triplet * 3].ljust(3, "\x7f")	# Pad with terminators
+		value = (ord(characters[0]) - 0x40) | ((ord(characters[1]) - 0x40) << 6) | ((ord(characters[2]) - 0x40) << 12)
+		word = hamming2418(value & 0x3ffff)
+		packet[position] = word & 0xff
+		packet[position + 1] = (word >> 8) & 0xff
+		packet[position + 2] = word >> 16
+		position += 3
+
+# X/27/0: six links, then the link control byte (show row 24) and a CRC we leave empty
+def writeLinks(packet, offset, magazine, links):
+	packet[offset], packet[offset + 1] = packetAddress(magazine, 27)
+	packet[offset + 2] = hamming84[0]
+
+	position = offset + 3
+	for link in (links + ["8ff"] * 6)[:6]:
+		linkMagazine, linkPage = splitPageNumber(link)
+		relative = linkMagazine ^ magazine	# Links are relative to our own magazine
+
+		packet[position] = hamming84[linkPage & 0xf]
+		packet[position + 1] = hamming84[linkPage >> 4]
+		packet[position + 2] = hamming84[0xf]	# Any subcode
+		packet[position + 3] = hamming84[0x7 | ((relative & 1) << 3)]
+		packet[position + 4] = hamming84[0xf]
+		packet[position + 5] = hamming84[0x3 | ((relative >> 1) << 2)]
+		position += 6
+
+	packet[position] = hamming84[0xf]
+	packet[position + 1] = 0
+	packet[position + 2] = 0
+
+# Encode a page (dict or pagemodel.Page) into one bytearray of T42 packets
+def encodePage(page, header=headerText):
+	if not isinstance(page, Page):
+		page = Page.fromDict(page)
+
+	magazine, pageNumber = splitPageNumber(page.number)
+
+	# Work out how big this is going to be first, so there's only one allocation
+	count = 0
+	for subpage in page.subpages:
+		count += 1 + sum(1 for row in subpage if row.number > 0) + len(subpage.enhancements) + (subpage.links is not None)
+
+	packets = bytearray(count * packetSize)
+	offset = 0
+
+	subcodeOffset = 1 if len(page.subpages) > 1 else 0
+	title = header(page.number)
+	profile = pageProfile(page)
+
+	for guessed_subcode, subpage in enumerate(page.subpages):
+		subcode = subpage.subcode if subpage.subcode is not None else str(guessed_subcode + subcodeOffset).zfill(4)
+		control = subpage.control if subpage.control is not None else page.control
+
+		writeHeader(packets, offset, magazine, pageNumber, int(subcode, 16), pageStatusWord(control, profile), title)
+		offset += packetSize
+
+		for row in subpage:
+			if row.number == 0:
+				continue	# We make our own header
+
+			packets[offset], packets[offset + 1] = packetAddress(magazine, row.number)
+			packets[offset + 2:offset + packetSize] = rowBytes(row.text)
+			offset += packetSize
+
+		for enhancement in subpage.enhancements:
+			writeEnhancement(packets, offset, magazine, enhancement)
+			offset += packetSize
+
+		if subpage.links is not None:
+			writeLinks(packets, offset, magazine, subpage.links)
+			offset += packetSize
+
+	return packets
+
+# Writes pages out as a T42 stream to a file, a pipe or anything else with a binary write()
+class T42Writer:
+	def __init__(self, output):
+		if isinstance(output, str):
+			self.file = open(output, "wb")
+			self.ownFile = True
+		else:
+			self.file = output
+			self.ownFile = False
+
+		self.packets = 0
+
+	def write(self, page):
+		packets = encodePage(page)
+		self.file.write(packets)
+		self.packets += len(packets) // packetSize
+		return len(packets) // packetSize
+
+	def close(self):
+		self.file.flush()
+		if self.ownFile:
+			self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+if __name__ == '__main__':
+	from legaliser import pageLegaliser
+
+	parser = argparse.ArgumentParser(description="Encode pages as a T42 packet stream")
+	parser.add_argument("pages", nargs="+", help=".tti files")
+	parser.add_argument("-o", "--output", help="file to write to (default: standard output)")
+	args = parser.parse_args()
+
+	with T42Writer(args.output or sys.stdout.buffer) as writer:
+		for filename in args.pages:
+			writer.write(pageLegaliser(loadTTI(filename, model=True)))
+
+	print(str(writer.packets) + " packets", file=sys.stderr)
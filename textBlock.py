@@ -10,7 +10,10 @@
 
 from legaliser import charsub
 import re
+import json
 import logging
+import collections
+import threading
 from datetime import datetime
 
 def colourCode(colour):
@@ -40,57 +43,82 @@ def colourCode(colour):
 # Total widths MUST add up to less than (40 - total_rows)
 # Width does not include colour code
 def tableRow(format, data):
-	output = ""
-	
-	for cell in format:
-		if "colour" in cell:
-			output += colourCode(cell["colour"])
+	try:
+		return compile_table(format).render_row(data)
+	except ValueError as error:
+		print(error)
+		return None
+
+# A table format that's been checked and worked out once, for rendering lots of rows with the same format.
+# Everything that doesn't depend on the row (colour codes, alignment, fixed text cells) is done here, so
+# rendering a row is just looking up its data. Problems with the format or the data raise ValueError.
+#
+#	standings = compile_table([{"width":2,"data":"P","colour":"yellow","align":"right"}, {"width":13,"data":"C","colour":"cyan"}])
+#	rows = standings.render_rows([{"P":1,"C":"HJK"}, {"P":2,"C":"KuPS"}])
+class CompiledTable:
+	def __init__(self, format):
+		self.cells = []
+		width = 0
 		
-		if "align" in cell:
-			align = cell["align"]
-		else:
-			align = "left"
+		for position, cell in enumerate(format):
+			if "width" not in cell:
+				raise ValueError("compile_table: cell " + str(position) + " has no defined width")
+			
+			colour = colourCode(cell["colour"]) if "colour" in cell else ""
+			align = cell.get("align", "left")
+			
+			if align == "right":
+				justify = str.rjust
+			elif align == "centre":
+				justify = str.center
+			else:
+				justify = str.ljust
+			
+			if "data" in cell:
+				self.cells.append((colour, cell["data"], cell.get("round"), cell["width"], justify))
+			elif "text" in cell:
+				self.cells.append((colour + justify(charsub(cell["text"])[:cell["width"]], cell["width"]), None, None, None, None))	# Same every row
+			else:
+				raise ValueError("compile_table: cell " + str(position) + " has no data input or text specified")
+			
+			width += len(colour) + cell["width"]
 		
-		if "width" not in cell:
-			print("tableRow: cell has no defined width")
-			return
+		# Every cell always comes out exactly its width, so we know now whether rows will be too long
+		self.truncate = width > 40
 		
-		if "data" in cell:
-			if cell["data"] in data:
-				rawInput = data[cell["data"]]
-				
-				if "round" in cell:
-					rawInput = round(rawInput,cell["round"])
-				
-				if len(str(rawInput)) > cell["width"] and rawInput is int:
-					rawInput = round(rawInput)
-				
-				inputText = str(rawInput)
-			else:
-				print("tableRow: specified data absent")
-				return
-		elif "text" in cell:
-			inputText = cell["text"]
-		else:
-			print("tableRow: Cell has no data input or text specified")
-			return
+		if self.truncate:
+			logging.warning("compile_table: rows are " + str(width) + " long, they'll be truncated to 40")
+	
+	def render_row(self, data):
+		output = []
 		
-		inputText = charsub(inputText)
+		for colour, key, rounding, width, justify in self.cells:
+			if key is None:
+				output.append(colour)	# A fixed cell, already rendered
+				continue
+			
+			if key not in data:
+				raise ValueError("tableRow: specified data " + repr(key) + " absent")
+			
+			rawInput = data[key]
+			
+			if rounding is not None:
+				rawInput = round(rawInput,rounding)
+			
+			output.append(colour)
+			output.append(justify(charsub(str(rawInput))[:width], width))
 		
-		if align == "right":
-			cellText = inputText[:cell["width"]].rjust(cell["width"])
-		elif align == "centre":
-			cellText = inputText[:cell["width"]].center(cell["width"])
-		else:
-			cellText = inputText[:cell["width"]].ljust(cell["width"])
+		if self.truncate:
+			return "".join(output)[:40]
 		
-		output += cellText
+		return "".join(output)
 	
-	if len(output) > 40:
-		print("tableRow: warning, output was longer than 40, truncated")
-		output = output[:40]
-	
-	return output
+	def render_rows(self, rows):
+		render = self.render_row
+		return [render(data) for data in rows]
+
+def compile_table(format):
+	return CompiledTable(format)
 
 #print(tableRow(
 #	[
@@ -110,7 +138,115 @@ def colourCodeReplace(toggle,input,code="\r"):
 	else:
 		return code + input
 
+# The same text gets laid out over and over in one run (a headline on its article page, the index, the newsreel...),
+# so finished layouts are kept, keyed on the block spec as canonical JSON plus maxWidth. Variables are looked up
+# first and put into the spec as text, so only the ones a block actually uses are part of its key.
+# Blocks are kept relative to their first line, so a cached layout can be put at any line.
+# The caches can be shared between threads (categories.py can build categories in a pool); layouts are built
+# outside the lock, so two threads may both build the same one, but they'll both get the same answer.
+CacheInfo = collections.namedtuple("CacheInfo", ("hits", "misses", "maxsize", "currsize"))
+
+class LayoutCache:
+	def __init__(self, size):
+		self.size = size
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+	
+	# The entry for key, making it with build() if we don't have it
+	def lookup(self, key, build):
+		with self.lock:
+			try:
+				value = self.entries[key]
+			except KeyError:
+				self.misses += 1
+			else:
+				self.hits += 1
+				self.entries.move_to_end(key)
+				return value
+		
+		value = build()
+		
+		with self.lock:
+			self.entries[key] = value
+			
+			if len(self.entries) > self.size:
+				self.entries.popitem(last=False)	# Least recently used
+		
+		return value
+	
+	def info(self):
+		return CacheInfo(self.hits, self.misses, self.size, len(self.entries))
+	
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+		self.hits = 0
+		self.misses = 0
+
+# The same spec always comes out as the same string, whatever order its keys were in
+canonicalJSON = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode
+
+blockCache = LayoutCache(2048)
+measureCache = LayoutCache(2048)
+wrapCache = LayoutCache(4096)
+
 def toTeletextBlock(input,maxWidth=40,line=1,variable={}):
+	resolved = resolveBlock(input, variable)
+	
+	try:
+		key = (canonicalJSON(resolved), maxWidth)
+	except (TypeError, ValueError):
+		return renderTeletextBlock(input,maxWidth,line,variable)	# Not something we can use as a key
+	
+	rows = blockCache.lookup(key, lambda: tuple((packet["number"], packet["text"]) for packet in renderTeletextBlock(resolved, maxWidth, 0, wrap=wrapText)))
+	return [{"number":line + offset,"text":text} for offset, text in rows]
+
+# What textColour does to find a variable's value
+def resolveVariable(variable, paths):
+	variable_part = variable
+	for path in paths:
+		try:
+			variable_part=variable_part[path]
+		except:
+			logging.debug("textColour: Could not find '" + str(path) + "' in listed variable")
+			
+			variable_part = ""
+			continue
+	
+	return str(variable_part)
+
+# Chunks with their variables swapped for the text they'd have given
+def resolveChunks(chunks, variable):
+	for chunk in chunks:
+		if "text" not in chunk and "variable" in chunk:
+			break
+	else:
+		return chunks	# Nothing to look up
+	
+	return [dict(chunk, text=resolveVariable(variable, chunk["variable"])) if "text" not in chunk and "variable" in chunk else chunk for chunk in chunks]
+
+def resolveBlock(input, variable):
+	if "content" not in input:
+		return input
+	
+	return dict(input, content=[dict(group, content=resolveChunks(group["content"], variable)) for group in input["content"]])
+
+# (blocks, wrapped chunks)
+def layoutCacheInfo():
+	return blockCache.info(), wrapCache.info()
+
+def clearLayoutCache():
+	blockCache.clear()
+	measureCache.clear()
+	wrapCache.clear()
+
+# wrap lays out each group's text. The block caches don't need it cached as well, so they use wrapText.
+def renderTeletextBlock(input,maxWidth=40,line=1,variable={},wrap=None):
+	if wrap is None:
+		wrap = textColour
+	
 	output = []
 	previousFinal = ""
 	previousAlign = ""
@@ -148,6 +284,11 @@ def toTeletextBlock(input,maxWidth=40,line=1,variable={}):
 	else:
 		boxed = False
 	
+	if "layout" in input:
+		layout = input["layout"]	# "optimal" for the dynamic programming line breaker
+	else:
+		layout = "greedy"
+	
 	if boxed == True:
 		maxWidth -= 2
 	
@@ -182,9 +323,9 @@ def toTeletextBlock(input,maxWidth=40,line=1,variable={}):
 		#### FORMATTING SECTION ####
 		
 		if previousAlign == "left":
-			formattedText = textColour(input=group["content"], maxWidth=maxWidth, cursor=previousLastLineLen, indent=indent, forceNewLine=newLine, variable=variable, defaultColour=defaultColour,doubleHeight=doubleHeight)
+			formattedText = wrap(input=group["content"], maxWidth=maxWidth, cursor=previousLastLineLen, indent=indent, forceNewLine=newLine, variable=variable, defaultColour=defaultColour,doubleHeight=doubleHeight,layout=layout)
 		else:
-			formattedText = textColour(input=group["content"], maxWidth=maxWidth, indent=indent, forceNewLine=newLine, variable=variable, defaultColour=defaultColour,doubleHeight=doubleHeight)
+			formattedText = wrap(input=group["content"], maxWidth=maxWidth, indent=indent, forceNewLine=newLine, variable=variable, defaultColour=defaultColour,doubleHeight=doubleHeight,layout=layout)
 		
 		if "postWrapLimit" in group:
 			if len(formattedText) >= group["postWrapLimit"]["maxLines"]:
@@ -284,16 +425,340 @@ def toTeletextBlock(input,maxWidth=40,line=1,variable={}):
 	#print("")
 	return output
 
-def textColour(input,maxWidth=20,cursor=0,indent=0,forceNewLine=False,variable={},defaultColour=" ",doubleHeight=False):
+# How much room a block needs, without making it: (rows, cursor) where rows is how many packets toTeletextBlock
+# would give us for the same input and cursor is how far along the last of them its text goes (before padding).
+# Wraps exactly the same way, so if it fits here it fits there. Cached just like the blocks themselves.
+def measureTeletextBlock(input,maxWidth=40,variable={}):
+	resolved = resolveBlock(input, variable)
+	
+	try:
+		key = (canonicalJSON(resolved), maxWidth)
+	except (TypeError, ValueError):
+		return measureBlock(input,maxWidth,variable)
+	
+	return measureCache.lookup(key, lambda: measureBlock(resolved, maxWidth, wrap=wrapText))
+
+def measureBlock(input,maxWidth=40,variable={},wrap=None):
+	if wrap is None:
+		wrap = textColour
+	
+	rows = 0
+	cursor = 0
+	previousFinal = False
+	previousAlign = ""
+	previousLastLineLen = 0
+	firstLineLen = 0
+	
+	if "content" not in input:
+		return (0, 0)
+	
+	if "colour" in input:
+		defaultColour = colourCode(input["colour"])
+	else:
+		defaultColour = colourCode('white')
+	
+	doubleHeight = input.get("doubleHeight", False)
+	layout = input.get("layout", "greedy")
+	
+	if input.get("boxed", False) == True:
+		maxWidth -= 2
+	
+	for pos,group in enumerate(input["content"]):
+		lastGroup = (len(input["content"]) - 1) == pos
+		align = group.get("align", "left")
+		indent = group.get("indent", 0)
+		newLine = group.get("forceNewLine", False)
+		
+		if previousAlign == "left":
+			formattedText = wrap(input=group["content"], maxWidth=maxWidth, cursor=previousLastLineLen, indent=indent, forceNewLine=newLine, variable=variable, defaultColour=defaultColour,doubleHeight=doubleHeight,layout=layout)
+		else:
+			formattedText = wrap(input=group["content"], maxWidth=maxWidth, indent=indent, forceNewLine=newLine, variable=variable, defaultColour=defaultColour,doubleHeight=doubleHeight,layout=layout)
+		
+		if "postWrapLimit" in group:
+			maxLines = group["postWrapLimit"]["maxLines"]
+			if len(formattedText) >= maxLines:
+				formattedText = formattedText[:maxLines]
+				if len(formattedText[maxLines-1]) > group["postWrapLimit"]["cutoff"]:
+					formattedText[maxLines-1] = formattedText[maxLines-1][:group["postWrapLimit"]["cutoff"]]
+		
+		groupLines = len(formattedText)
+		
+		if groupLines:
+			firstLineLen = len(formattedText[0])
+			lastLineLen = len(formattedText[-1])
+		
+		for formattedLineNum in range(groupLines):
+			if ((groupLines - 1) == formattedLineNum) and not lastGroup:
+				# Carried on to the start of the next group, just like toTeletextBlock does
+				previousAlign = align
+				previousFinal = True
+				
+				if previousLastLineLen == 0:
+					previousLastLineLen = indent + lastLineLen
+				else:
+					previousLastLineLen = previousLastLineLen + lastLineLen
+				
+				break
+			
+			if previousFinal and (formattedLineNum == 0) and (previousAlign == "left") and (align != "centre"):
+				if (firstLineLen + previousLastLineLen) <= maxWidth:
+					rows += 1
+					cursor = previousLastLineLen + firstLineLen
+				else:
+					rows += 2
+					cursor = indent + firstLineLen
+			else:
+				rows += 1
+				cursor = indent + len(formattedText[formattedLineNum])
+			
+			previousFinal = False
+			previousAlign = ""
+			previousLastLineLen = 0
+	
+	return (rows, cursor)
+
+# Words for textColour: each one ends in (and keeps) a space, slash or hyphen, or the end of the text.
+# This splits exactly like re.split('(.+?(?:\s|\/|\-|$))', text) used to, newlines included, but never backtracks.
+wordPattern = re.compile(r"[^\n][^\s/\-]*(?:[\s/\-]|$)|\n+")
+
+# A chunk's text, with everything done to it that textColour does before wrapping. None if it hasn't got any.
+def chunkText(chunk, variable):
+	if "text" not in chunk and "variable" in chunk:
+		focusText = resolveVariable(variable, chunk["variable"])
+	elif "text" not in chunk and "variable" not in chunk:
+		return None
+	elif "text" in chunk:
+		focusText = str(chunk["text"])
+	
+	if "datetimeFormat" in chunk:
+		timestamp = float(focusText)
+		
+		if timestamp > 9999999999:
+			timestamp = timestamp/1000
+		
+		focusText = datetime.utcfromtimestamp(timestamp).strftime(chunk["datetimeFormat"])
+	
+	if "forceCaps" in chunk:
+		focusText = focusText.upper()
+	
+	focusText = charsub(focusText) # Re-map characters
+	
+	if "pad" in chunk:
+		if chunk["pad"]["align"] == "right":
+			focusText = focusText.rjust(chunk["pad"]["width"],chunk["pad"]["fill"])
+		elif chunk["pad"]["align"] == "left":
+			focusText = focusText.ljust(chunk["pad"]["width"],chunk["pad"]["fill"])
+	
+	if "limit" in chunk:
+		focusText = focusText[:chunk["limit"]]
+	
+	return focusText
+
+#### OPTIMAL LAYOUT ####
+# Blocks with "layout":"optimal" are broken into lines with dynamic programming instead of first-fit, and can break
+# long words too: at soft hyphens (U+00AD, which Yle puts at the joins of compound words) or between Finnish
+# syllables, with a hyphen at the end of the line. Of all the ways to lay the text out it picks the one with the
+# fewest rows, then the fewest (and best placed) hyphens, then the most even line lengths.
+# Chunks with padding, line offsets or preferNewline are laid out the usual way.
+
+finnishVowels = frozenset("aeiouyäöåéAEIOUYÄÖÅÉ")
+finnishDiphthongs = frozenset(("ai", "ei", "oi", "ui", "yi", "äi", "öi", "au", "eu", "iu", "ou", "ey", "iy", "äy", "öy", "ie", "uo", "yö"))
+
+# What each kind of break costs. Breaking between words is free.
+softHyphenPenalty = 1	# Where the text says a word can be broken
+syllablePenalty = 2	# Between syllables
+forcedPenalty = 4	# Anywhere at all, for words too long for a line even when hyphenated
+
+# Where a Finnish word can be hyphenated: before a consonant followed by a vowel (kau-pun-gin), and between two
+# vowels that aren't a long vowel or a diphthong (kor-ke-a). Never leaving fewer than two letters either side.
+def syllableBreaks(word):
+	breaks = []
+	
+	for position in range(2, len(word) - 1):
+		before, here, after = word[position - 1], word[position], word[position + 1]
+		
+		if not (before.isalpha() and here.isalpha() and after.isalpha()):
+			continue
+		
+		if here not in finnishVowels and after in finnishVowels:
+			if any(character in finnishVowels for character in word[:position]):
+				breaks.append(position)
+		elif before in finnishVowels and here in finnishVowels and before.lower() != here.lower() and (before + here).lower() not in finnishDiphthongs:
+			breaks.append(position)
+	
+	return breaks
+
+# A word split into the pieces we could break it into, as (text, penalty) where penalty is the cost of breaking
+# after that piece. The last piece keeps the word's delimiter and can always be broken after for free.
+def wordPieces(word, lineWidth):
+	core = word.rstrip(" /-")
+	delimiter = word[len(core):]
+	pieces = []
+	
+	for part in core.split("\u00ad"):
+		if not part:
+			continue
+		
+		start = 0
+		for position in (syllableBreaks(part) if len(part) >= 6 else []):
+			pieces.append([part[start:position], syllablePenalty])
+			start = position
+		
+		pieces.append([part[start:], softHyphenPenalty])
+	
+	if not pieces:
+		return [(word.replace("\u00ad", ""), 0)]
+	
+	pieces[-1][0] += delimiter
+	pieces[-1][1] = 0
+	
+	# Anything that still won't fit gets cut wherever it has to be (leaving room for a colour code and the hyphen)
+	output = []
+	for text, penalty in pieces:
+		while len(text) > lineWidth - 2:
+			output.append((text[:lineWidth - 2], forcedPenalty))
+			text = text[lineWidth - 2:]
+		output.append((text, penalty))
+	
+	return output
+
+# The lines for some chunks, or None if we can't do them optimally and they should be laid out the usual way
+def wrapOptimal(input,maxWidth,cursor,indent,forceNewLine,variable,defaultColour):
+	lineWidth = maxWidth - indent
+	pieces = []	# (text, penalty, colour code if this piece starts a chunk, colour code if it starts a line)
+	
+	for chunk in input:
+		if "pad" in chunk or "lineOffset" in chunk or "preferNewline" in chunk:
+			return None
+		
+		focusText = chunkText(chunk, variable)
+		
+		if focusText is None:
+			return None
+		
+		colour = colourCode(chunk["colour"]) if "colour" in chunk else defaultColour
+		spacing = "" if "noSpacing" in chunk else colour
+		first = True
+		
+		for word in wordPattern.findall(focusText.replace("\n", " ")):
+			if word == " ":
+				continue
+			
+			for text, penalty in wordPieces(word, lineWidth):
+				pieces.append((text, penalty, spacing if first else "", spacing))
+				first = False
+	
+	if not pieces:
+		return None
+	
+	if forceNewLine:
+		lines = [""]
+		layout = layoutPieces(pieces, lineWidth, lineWidth)
+	else:
+		lines = []
+		layout = layoutPieces(pieces, maxWidth - cursor, lineWidth)
+		
+		# Starting on the next line instead can't use fewer rows, but it's all we can do if nothing fits here
+		if layout is None:
+			lines = [""]
+			layout = layoutPieces(pieces, lineWidth, lineWidth)
+	
+	if layout is None:
+		return None
+	
+	for start, end in layout:
+		row = [pieces[start][3], pieces[start][0]]	# A line starts with its chunk's colour code
+		for text, penalty, chunkColour, lineColour in pieces[start + 1:end]:
+			row.append(chunkColour)
+			row.append(text)
+		
+		text = "".join(row)
+		
+		if pieces[end - 1][1] > 0:
+			text += "-"	# Broken inside a word
+		elif end < len(pieces) and text.endswith(" "):
+			text = text[:-1]	# No need to keep a space at the end of a line
+		
+		lines.append(text)
+	
+	return lines
+
+# Where to break the pieces: a list of (start, end) for each line, or None if the first line can't take anything
+def layoutPieces(pieces, firstWidth, lineWidth):
+	count = len(pieces)
+	best = [None] * (count + 1)	# best[end] = (cost, start of the last line), cost = (rows, penalties, raggedness)
+	best[0] = ((0, 0, 0), None)
+	
+	for start in range(count):
+		if best[start] is None:
+			continue
+		
+		(rows, penalties, raggedness), _ = best[start]
+		width = firstWidth if start == 0 else lineWidth
+		length = 1 if pieces[start][3] else 0	# The colour code at the start of the line, counted as one like textColour does
+		
+		for end in range(start + 1, count + 1):
+			text, penalty, chunkColour, lineColour = pieces[end - 1]
+			
+			if end > start + 1 and chunkColour:
+				length += 1	# A new chunk's colour code
+			length += len(text)
+			
+			used = length
+			if penalty > 0:
+				used += 1	# The hyphen
+			elif end < count and text.endswith(" "):
+				used -= 1	# The space can hang off the end
+			
+			if used > width:
+				break
+			
+			slack = width - used
+			cost = (rows + 1, penalties + penalty, raggedness + (slack * slack if end < count else 0))
+			
+			if best[end] is None or cost < best[end][0]:
+				best[end] = (cost, start)
+	
+	if best[count] is None:
+		return None
+	
+	layout = []
+	end = count
+	while end > 0:
+		start = best[end][1]
+		layout.append((start, end))
+		end = start
+	
+	layout.reverse()
+	return layout
+
+# Wrapped chunks are cached the same way as whole blocks
+def textColour(input,maxWidth=20,cursor=0,indent=0,forceNewLine=False,variable={},defaultColour=" ",doubleHeight=False,layout="greedy"):
+	chunks = resolveChunks(input, variable)
+	
+	try:
+		key = (canonicalJSON(chunks),maxWidth,cursor,indent,forceNewLine,defaultColour,doubleHeight,layout)
+	except (TypeError, ValueError):
+		return wrapText(input,maxWidth,cursor,indent,forceNewLine,variable,defaultColour,doubleHeight,layout)
+	
+	return list(wrapCache.lookup(key, lambda: tuple(wrapText(chunks,maxWidth,cursor,indent,forceNewLine,{},defaultColour,doubleHeight,layout))))
+
+def wrapText(input,maxWidth=20,cursor=0,indent=0,forceNewLine=False,variable={},defaultColour=" ",doubleHeight=False,layout="greedy"):
+	if layout == "optimal":
+		lines = wrapOptimal(input,maxWidth,cursor,indent,forceNewLine,variable,defaultColour)
+		
+		if lines is not None:
+			return lines
+	
 	line = 0
-	output = [""]
+	output = [[]]	# The pieces of each row, joined once at the end
 	
 	width = maxWidth	# We redefine this here in case we want to do nth line offsets later
 	
 	if forceNewLine:
 		line += 1	# Increment the line counter (ToDo: Double Height needs incremented twice)
 		cursor = 0	# Carriage return
-		output.append("")	# Create the next row
+		output.append([])	# Create the next row
 		width = maxWidth-indent	# Reset the width
 	
 	for chunk in input:
@@ -302,103 +767,64 @@ def textColour(input,maxWidth=20,cursor=0,indent=0,forceNewLine=False,variable={
 		#### SUBSTITUTION SECTION ####
 		# Added 2023-07-14
 		
-		if "text" not in chunk and "variable" in chunk:
-			variable_part = variable
-			for path in chunk["variable"]:
-				try:
-					variable_part=variable_part[path]
-				except:
-					logging.debug("textColour: Could not find '" + str(path) + "' in listed variable")
-					
-					variable_part = ""
-					continue
-			
-			focusText = str(variable_part)
-		elif "text" not in chunk and "variable" not in chunk:
+		focusText = chunkText(chunk, variable)
+		
+		if focusText is None:
 			print("textColour: Major fault, no usable text in chunk")
-			return output
-		elif "text" in chunk:
-			focusText = str(chunk["text"])
+			return ["".join(row) for row in output]
+		
+		focusText = focusText.replace("\u00ad", "")	# Soft hyphens are only break points, and only the optimal layout breaks at them
 		
 		if "colour" in chunk:
 			colour = colourCode(chunk["colour"])	# Set the colour code for this bit
 		else:
 			colour = defaultColour
 		
-		if "datetimeFormat" in chunk:
-			timestamp = float(focusText)
-			
-			if timestamp > 9999999999:
-				timestamp = timestamp/1000
-			
-			focusText = datetime.utcfromtimestamp(timestamp).strftime(chunk["datetimeFormat"])
-		
-		if "forceCaps" in chunk:
-			focusText = focusText.upper()
-		
-		focusText = charsub(focusText) # Re-map characters
-		
-		if "pad" in chunk:
-			if chunk["pad"]["align"] == "right":
-				focusText = focusText.rjust(chunk["pad"]["width"],chunk["pad"]["fill"])
-			elif chunk["pad"]["align"] == "left":
-				focusText = focusText.ljust(chunk["pad"]["width"],chunk["pad"]["fill"])
-		
-		if "limit" in chunk:
-			focusText = focusText[:chunk["limit"]]
-		
 		if "lineOffset" in chunk:
 			line += chunk["lineOffset"]	# Increment the line counter (ToDo: Double Height needs incremented twice)
 			cursor = 0	# Carriage return
 			
 			for i in range(chunk["lineOffset"]):
-				output.append("")	# Create the next row
+				output.append([])	# Create the next row
 			
 			colourChanged = True	# Reset the colour
 			width = maxWidth-indent	# Reset the width
 		
 		if "preferNewline" in chunk:
-			chunkElement = [focusText]
+			chunkElement = [focusText] if focusText else []
 		else:
-			chunkElement = re.split('(.+?(?:\s|\/|\-|$))', focusText)	# Split chunk into words, retaining the delimiter
-			# ToDo - make sure the delimiter stays with the word, rather than floating on it's own
+			chunkElement = wordPattern.findall(focusText)	# Split chunk into words, retaining the delimiter
+		
+		spacing = "noSpacing" not in chunk
+		row = output[line]
 		
 		for word in chunkElement:
 			wordLen = len(word)	# How long is that word?
 			
-			if wordLen < 1:
-				continue
-			
-			if(wordLen+cursor) >= width+1:	# Is it gonna be too long for this line?
+			if(wordLen+cursor) > width:	# Is it gonna be too long for this line?
 				if wordLen > width:	# Wait, is it longer than the entire line?
 					print("textColour: Caught word \"" + word + "\" which is too long to fit in " + str(maxWidth) + " characters")	# "uncaught exception"
 					word = word[:width]
-					#exit()	# This shouldn't ever happen, but just in case - ToDo: Split up words that are too long to force them to fit
 				
 				if word == " ":
 					continue	# Don't put spaces at the start of new lines
 				
 				line += 1	# Increment the line counter (ToDo: Double Height needs incremented twice)
 				cursor = 0	# Carriage return
-				output.append("")	# Create the next row
+				output.append([])	# Create the next row
+				row = output[line]
 				colourChanged = True	# Reset the colour
 				width = maxWidth-indent	# Reset the width
 			
-			if colourChanged and "noSpacing" not in chunk:	# Add the colour code again if we need to
+			if colourChanged and spacing:	# Add the colour code again if we need to
 				colourChanged = False
-				output[line] = output[line] + colour
-				
-				if doubleHeight == True:
-					cursor = cursor + 1	# Need to increment the cursor for colour codes
-				else:
-					cursor = cursor + 1	# Need to increment the cursor for colour codes
-			#else:
-			#	output[line] = output[line] + " "	# Otherwise pad with a space
+				row.append(colour)
+				cursor = cursor + 1	# Need to increment the cursor for colour codes
 			
-			output[line] = output[line] + word	# Add the word to the line
+			row.append(word)	# Add the word to the line
 			cursor = cursor + wordLen	# And increment the cursor
 	
-	return(output)
+	return ["".join(row) for row in output]
 
 #print(toTeletextBlock(textBlock6))
 
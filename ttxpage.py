@@ -4,8 +4,6 @@ import textwrap
 import html
 
 import newsreel
-import config
-_config=config.Config().config
 
 class TeletextPage(object):
     def __init__(self, description="News Page",
@@ -83,13 +81,22 @@ class TeletextPage(object):
         text = html.unescape(text)
         return text.translate(trans)
 
-    def save(self, format_string="{}/{}{}.tti", add_to_newsreel=False):
-        pagedir = _config['pagesdir']
-        pageprefix = _config['pageprefix']
+    def save(self, format_string="{}/{}{}.tti", add_to_newsreel=False,
+             sink=None):
+        # With a sink (see sinks.py) we don't need the pagesdir/pageprefix
+        # settings from config at all
+        if sink is not None:
+            sink.write(sink.pageName(self.page),
+                       "\r\n".join(self.lines).encode("utf-8"))
+        else:
+            import config
+            _config=config.Config().config
+            pagedir = _config['pagesdir']
+            pageprefix = _config['pageprefix']
 
-        with open(format_string.format(pagedir,pageprefix,self.page),
-                  mode="w", newline="\r\n") as f:
-            f.write("\n".join(self.lines))
+            with open(format_string.format(pagedir,pageprefix,self.page),
+                      mode="w", newline="\r\n") as f:
+                f.write("\n".join(self.lines))
 
         if add_to_newsreel:
             n = newsreel.Newsreel()
@@ -2,13 +2,12 @@ import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 import json
-import copy
 import sys
 import os
 
 # Import je teletext modules
 from textBlock import toTeletextBlock
-from page import exportTTI, loadTTI
+from page import exportTTI, loadTemplate, clonePackets
 from legaliser import pageLegaliser
 
 # Finse dag- en maandnamen
@@ -147,7 +146,7 @@ class TelsuScraper:
         
         try:
             # Load template
-            pageTemplate = loadTTI(template_file)
+            pageTemplate = loadTemplate(template_file)
             
             # Create teletext page met subpages
             teletextPage = {
@@ -163,7 +162,7 @@ class TelsuScraper:
             # Start op regel 7 (na header)
             current_line = 7
             current_subpage = {
-                "packets": copy.deepcopy(pageTemplate["subpages"][0]["packets"])
+                "packets": clonePackets(pageTemplate["subpages"][0]["packets"])
             }
             
             # Vervang datum placeholders
@@ -207,7 +206,7 @@ class TelsuScraper:
                     
                     # Start nieuwe subpage
                     current_subpage = {
-                        "packets": copy.deepcopy(pageTemplate["subpages"][0]["packets"])
+                        "packets": clonePackets(pageTemplate["subpages"][0]["packets"])
                     }
                     
                     # Vervang datum placeholders in nieuwe subpage
@@ -1,7 +1,6 @@
-import copy
 from veikkausliiga_scraper import AiScoreScraper
-from textBlock import tableRow, toTeletextBlock
-from page import exportTTI, loadTTI
+from textBlock import compile_table, toTeletextBlock
+from page import exportTTI, loadTemplate, clonePackets
 from legaliser import pageLegaliser
 
 print("="*70)
@@ -11,12 +10,12 @@ print("="*70)
 scraper = AiScoreScraper()
 standings = scraper.scrape_standings()
 
-template = loadTTI("veikkausliiga_page.tti")
+template = loadTemplate("veikkausliiga_page.tti")
 
 teletextPage = {
     "number": 314,
     "subpages": [{
-        "packets": copy.deepcopy(template["subpages"][0]["packets"])
+        "packets": clonePackets(template["subpages"][0]["packets"])
     }]
 }
 
@@ -28,25 +27,30 @@ if standings and len(standings) > 0:
     
     line = 6
 
-    for t in standings:
-        rowDict = {
-            "P": t["position"],
-            "C": t["team"][:13],   # clubnaam inkorten naar 13 chars
-            "Pt": t["points"],
-            "G": t["goals"],
-            "WDG": f"{t['wins']}/{t['draws']}/{t['losses']}"
-        }
+    # Tabelformaat één keer compileren, daarna alle rijen in één keer renderen
+    standings_table = compile_table(
+        [
+            {"width": 2,  "data": "P",   "colour": "yellow", "align": "right"},
+            {"width": 13, "data": "C",   "colour": "cyan"},
+            {"width": 3,  "data": "Pt",  "colour": "yellow", "align": "right"},
+            {"width": 7,  "data": "G",   "colour": "white"},
+            {"width": 6,  "data": "WDG", "colour": "white"},
+        ]
+    )
 
-        row = tableRow(
-            [
-                {"width": 2,  "data": "P",   "colour": "yellow", "align": "right"},
-                {"width": 13, "data": "C",   "colour": "cyan"},
-                {"width": 3,  "data": "Pt",  "colour": "yellow", "align": "right"},
-                {"width": 7,  "data": "G",   "colour": "white"},
-                {"width": 6,  "data": "WDG", "colour": "white"},
-            ],
-            rowDict
-        )
+    for t in standings:
+        try:
+            row = standings_table.render_row({
+                "P": t["position"],
+                "C": t["team"][:13],   # clubnaam inkorten naar 13 chars
+                "Pt": t["points"],
+                "G": t["goals"],
+                "WDG": f"{t['wins']}/{t['draws']}/{t['losses']}"
+            })
+        except ValueError as error:
+            # Eén onvolledig team mag niet de hele tabel kosten: rij overslaan
+            print(f"  ! Rij overgeslagen: {error}")
+            continue
 
         tt_block = [{"number": line, "text": row}]
 
@@ -1,7 +1,6 @@
-import copy
 from datetime import datetime
-from textBlock import toTeletextBlock
-from page import exportTTI, loadTTI
+from textBlock import toTeletextBlock, measureTeletextBlock
+from page import exportTTI, loadTemplate, clonePackets
 from legaliser import pageLegaliser
 from FMI import FMITextScraper
 
@@ -25,12 +24,15 @@ def vervang_datum_in_tti(tti_data):
     return tti_data
 
 def calculate_text_lines(text, width=40):
-    """Bereken EXACT hoeveel regels een tekst nodig heeft"""
+    """Bereken EXACT hoeveel regels een tekst nodig heeft, zoals toTeletextBlock hem afbreekt"""
     if not text:
         return 0
-    # Tel karakters, deel door 40, rond naar boven
-    import math
-    return math.ceil(len(text) / width)
+    # Meten zonder packets te maken, met dezelfde woordafbreking als het echte blok
+    rows, cursor = measureTeletextBlock(
+        {"content":[{"align":"left","content":[{"colour":"white","text":text}]}]},
+        maxWidth=width
+    )
+    return rows
 
 def split_area_name(area):
     """Split lange area namen slim over meerdere regels"""
@@ -73,7 +75,7 @@ def create_land_weather_page():
     
     # Laad template
     try:
-        template = loadTTI("weather_land_template.tti")
+        template = loadTemplate("weather_land_template.tti")
     except:
         print("⚠ weather_land_template.tti niet gevonden, maak basis template")
         template = {
@@ -88,7 +90,7 @@ def create_land_weather_page():
     # Maak pagina
     teletextPage = {
         "number": 161,
-        "subpages": [{"packets": copy.deepcopy(template["subpages"][0]["packets"])}]
+        "subpages": [{"packets": clonePackets(template["subpages"][0]["packets"])}]
     }
     
     # Vervang datum
@@ -132,7 +134,7 @@ def create_marine_weather_page():
     
     # Laad template
     try:
-        template = loadTTI("weather_marine_template.tti")
+        template = loadTemplate("weather_marine_template.tti")
     except:
         print("⚠ weather_marine_template.tti niet gevonden, maak basis template")
         template = {
@@ -232,7 +234,7 @@ def create_marine_weather_page():
                 # Maak subpage met huidige groepen
                 if current_groups:
                     current_page_num += 1
-                    subpage = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+                    subpage = {"packets": clonePackets(template["subpages"][0]["packets"])}
                     
                     for packet in subpage["packets"]:
                         if "text" in packet:
@@ -292,7 +294,7 @@ def create_marine_weather_page():
         # Laatste warning subpage
         if current_groups:
             current_page_num += 1
-            subpage = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+            subpage = {"packets": clonePackets(template["subpages"][0]["packets"])}
             
             for packet in subpage["packets"]:
                 if "text" in packet:
@@ -343,7 +345,7 @@ def create_marine_weather_page():
     for section_idx, section in enumerate(marine_data['forecast_sections']):
         current_page_num += 1
         
-        subpage = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+        subpage = {"packets": clonePackets(template["subpages"][0]["packets"])}
         
         # Vervang datum
         for packet in subpage["packets"]:
@@ -403,7 +405,7 @@ def create_marine_weather_page():
     for section_idx, section in enumerate(marine_data['vrk2_sections']):
         current_page_num += 1
         
-        subpage = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+        subpage = {"packets": clonePackets(template["subpages"][0]["packets"])}
         
         # Vervang datum
         for packet in subpage["packets"]:
@@ -486,7 +488,7 @@ def create_regional_weather_pages():
     
     # Laad template
     try:
-        template = loadTTI("weather_regional_template.tti")
+        template = loadTemplate("weather_regional_template.tti")
     except:
         print("⚠ weather_regional_template.tti niet gevonden, maak basis template")
         template = {
@@ -512,7 +514,7 @@ def create_regional_weather_pages():
         region_name = region_data['region']
         forecast = region_data['forecast']
         
-        subpage = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+        subpage = {"packets": clonePackets(template["subpages"][0]["packets"])}
         
         # Vervang datum
         for packet in subpage["packets"]:
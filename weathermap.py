@@ -7,8 +7,7 @@ import requests
 import os
 import re
 from datetime import datetime, timedelta
-import copy
-from page import exportTTI, loadTTI
+from page import exportTTI, loadTemplate, clonePackets
 from legaliser import pageLegaliser
 import ttxcolour
 from collections import defaultdict
@@ -512,7 +511,7 @@ def get_weather_subpages(input_bestand="weathermap.tti"):
         print(f"VIRHE: Mallia '{input_bestand}' ei löydy.")
         return []
     try:
-        template = loadTTI(input_bestand)
+        template = loadTemplate(input_bestand)
         nu = datetime.now()
         datum = get_finnish_datum()
         tijd = round_tijd_op_15_min()
@@ -523,7 +522,7 @@ def get_weather_subpages(input_bestand="weathermap.tti"):
         # Current
         regel_kleuren_west_nu, regel_kleuren_oost_nu, gebied_weer_data_nu = bepaal_regel_kleuren_west_oost(api_key, 0)
         beschrijvingen_nu = genereer_kleur_beschrijvingen(regel_kleuren_west_nu, regel_kleuren_oost_nu, gebied_weer_data_nu, api_key, 0)
-        subpage1 = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+        subpage1 = {"packets": clonePackets(template["subpages"][0]["packets"])}
         inject_kleuren_in_packets(subpage1["packets"], regel_kleuren_west_nu, regel_kleuren_oost_nu)
         inject_beschrijvingen_in_packets(subpage1["packets"], beschrijvingen_nu, regel_kleuren_west_nu, regel_kleuren_oost_nu)
         for packet in subpage1["packets"]:
@@ -535,7 +534,7 @@ def get_weather_subpages(input_bestand="weathermap.tti"):
         regel_kleuren_west_volgend, regel_kleuren_oost_volgend, gebied_weer_data_volgend = bepaal_regel_kleuren_west_oost(api_key, 6)
         beschrijvingen_volgend = genereer_kleur_beschrijvingen(regel_kleuren_west_volgend, regel_kleuren_oost_volgend, gebied_weer_data_volgend, api_key, 6)
         geldig_volgend = DAGDELEN_FIN_MORGEN[volgend_dagdeel] if is_morgen else DAGDELEN_FIN[volgend_dagdeel]
-        subpage2 = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+        subpage2 = {"packets": clonePackets(template["subpages"][0]["packets"])}
         inject_kleuren_in_packets(subpage2["packets"], regel_kleuren_west_volgend, regel_kleuren_oost_volgend)
         inject_beschrijvingen_in_packets(subpage2["packets"], beschrijvingen_volgend, regel_kleuren_west_volgend, regel_kleuren_oost_volgend)
         for packet in subpage2["packets"]:
@@ -547,7 +546,7 @@ def get_weather_subpages(input_bestand="weathermap.tti"):
         regel_kleuren_west_daarna, regel_kleuren_oost_daarna, gebied_weer_data_daarna = bepaal_regel_kleuren_west_oost(api_key, 12)
         beschrijvingen_daarna = genereer_kleur_beschrijvingen(regel_kleuren_west_daarna, regel_kleuren_oost_daarna, gebied_weer_data_daarna, api_key, 12)
         geldig_daarna = DAGDELEN_FIN_MORGEN[daaropvolgend_dagdeel] if is_overmorgen else DAGDELEN_FIN[daaropvolgend_dagdeel]
-        subpage3 = {"packets": copy.deepcopy(template["subpages"][0]["packets"])}
+        subpage3 = {"packets": clonePackets(template["subpages"][0]["packets"])}
         inject_kleuren_in_packets(subpage3["packets"], regel_kleuren_west_daarna, regel_kleuren_oost_daarna)
         inject_beschrijvingen_in_packets(subpage3["packets"], beschrijvingen_daarna, regel_kleuren_west_daarna, regel_kleuren_oost_daarna)
         for packet in subpage3["packets"]: